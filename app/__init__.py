@@ -1,22 +1,25 @@
-from flask import Flask
 from pathlib import Path
 import logging
-import tomli
+import os
 
 def load_config():
+    from .settings import load_settings
     try:
-        config_path = Path("config/config.toml")
-        with open(config_path, "rb") as f:
-            return tomli.load(f)
+        return load_settings().config
     except Exception as e:
         print(f"Unexpected error loading config: {e}")
         exit(1)
 
-def create_app():
+def create_app(test_config=None):
+    # Flask and the display stack are imported here rather than at module
+    # level so gunicorn_config.py and runserver.sh can read settings cheaply
+    from flask import Flask
     app = Flask(__name__)
 
     config = load_config()
     app.config.update(config)
+    if test_config is not None:
+        app.config.update(test_config)
     
     photos_dir = Path("photos")
     (photos_dir / "originals").mkdir(parents=True, exist_ok=True)
@@ -32,6 +35,11 @@ def create_app():
     # Initialize display controller
     from .display import DisplayController
     app.display_controller = DisplayController(config)
+    # With gunicorn's preload_app the app is built in the master process;
+    # threads started there do not survive the fork, so gunicorn_config.py
+    # starts the slideshow in each worker instead
+    if not app.testing and not os.getenv('EINK_START_IN_WORKER'):
+        app.display_controller.slideshow.start()
     
     from .routes import main
     app.register_blueprint(main)
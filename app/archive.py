@@ -0,0 +1,271 @@
+"""Export the library as a zip and import one back.
+
+GET /photos/export streams photos/originals plus index.json (weights and
+show history) as an uncompressed zip built on the fly. Every header size is
+known before the first byte is sent, so the archive's length and layout are
+fixed up front: memory use does not grow with the library, and a Range
+request can start anywhere, which is how an interrupted download resumes.
+
+POST /photos/import takes such a zip and adds its photos through the same
+ingest path as an upload, writing the index metadata in batches.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zipfile
+import zlib
+from pathlib import PurePosixPath
+
+logger = logging.getLogger(__name__)
+
+METADATA_NAME = 'index.json'
+ORIGINALS_PREFIX = 'originals/'
+# Index columns that describe the user's library rather than derived renders
+METADATA_COLUMNS = ('weight', 'last_shown', 'show_count')
+
+CHUNK_SIZE = 256 * 1024
+# Photos whose index metadata is written per transaction while importing
+BATCH_SIZE = 50
+
+# Offsets and counts past these need the zip64 records
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+
+_FLAGS = 0x08 | 0x800      # sizes and CRC follow the data; UTF-8 names
+_VERSION = 45              # zip64-capable reader
+_MADE_BY = (3 << 8) | _VERSION
+_LOCAL = struct.Struct('<IHHHHHIIIHH')
+_DESCRIPTOR = struct.Struct('<IIII')
+_CENTRAL = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END = struct.Struct('<IHHHHIIH')
+_END64 = struct.Struct('<IQHHIIQQQQ')
+_LOCATOR64 = struct.Struct('<IIQI')
+
+def _dos_time(timestamp):
+    t = time.localtime(max(timestamp, 315532800))    # zip dates start in 1980
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), \
+        ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+class _Entry:
+    def __init__(self, name, size, mtime, path=None, data=None):
+        self.name = name
+        self.encoded = name.encode()
+        self.size = size
+        self.mtime = mtime
+        self.path = path
+        self.data = data
+        self.crc = zlib.crc32(data) if data is not None else None
+        self.offset = 0
+
+    def local_header(self):
+        dos_time, dos_date = _dos_time(self.mtime)
+        return _LOCAL.pack(0x04034b50, _VERSION, _FLAGS, 0, dos_time, dos_date,
+                           0, 0, 0, len(self.encoded), 0) + self.encoded
+
+    def central_header(self):
+        dos_time, dos_date = _dos_time(self.mtime)
+        extra = b''
+        offset = self.offset
+        if offset >= ZIP64_LIMIT:
+            extra = struct.pack('<HHQ', 0x0001, 8, offset)
+            offset = 0xFFFFFFFF
+        return _CENTRAL.pack(0x02014b50, _MADE_BY, _VERSION, _FLAGS, 0, dos_time, dos_date,
+                             self.crc, self.size, self.size, len(self.encoded), len(extra), 0,
+                             0, 0, 0o100644 << 16, offset) + self.encoded + extra
+
+    def central_size(self):
+        return _CENTRAL.size + len(self.encoded) + (12 if self.offset >= ZIP64_LIMIT else 0)
+
+class ZipStream:
+    """A stored (uncompressed) zip whose bytes are produced on demand.
+
+    The layout is local header, data and data descriptor per entry, then the
+    central directory. Only the CRCs are unknown until the data is read;
+    they land in the descriptor and central directory, after the data.
+    """
+
+    def __init__(self, files, extra=()):
+        self.entries = []
+        for name, path in files:
+            stat = os.stat(path)
+            if stat.st_size >= ZIP64_LIMIT:
+                logger.error(f"Skipping {name} in export: too large for the archive")
+                continue
+            self.entries.append(_Entry(name, stat.st_size, stat.st_mtime, path=path))
+        # Dated like the newest photo so the same library gives the same bytes
+        newest = max((entry.mtime for entry in self.entries), default=0)
+        for name, data in extra:
+            self.entries.append(_Entry(name, len(data), newest, data=data))
+
+        # (offset, length, kind, entry) for every part of the archive
+        self._segments = []
+        offset = 0
+        for entry in self.entries:
+            entry.offset = offset
+            for kind, length in (('local', _LOCAL.size + len(entry.encoded)),
+                                 ('data', entry.size),
+                                 ('descriptor', _DESCRIPTOR.size)):
+                self._segments.append((offset, length, kind, entry))
+                offset += length
+        self._central_offset = offset
+        central = sum(entry.central_size() for entry in self.entries)
+        self._central_size = central
+        self.size = offset + central + self._end_size()
+        self._segments.append((offset, self.size - offset, 'central', None))
+
+        key = hashlib.sha1()
+        for entry in self.entries:
+            key.update(f"{entry.name}\0{entry.size}\0{entry.mtime}\0".encode())
+            if entry.data is not None:
+                key.update(entry.data)
+        self.etag = key.hexdigest()[:16]
+
+    def _zip64(self):
+        return (self._central_offset >= ZIP64_LIMIT or self._central_size >= ZIP64_LIMIT
+                or len(self.entries) >= ZIP64_COUNT_LIMIT)
+
+    def _end_size(self):
+        return _END.size + (_END64.size + _LOCATOR64.size if self._zip64() else 0)
+
+    def _crc(self, entry):
+        if entry.crc is None:
+            crc = 0
+            with open(entry.path, 'rb') as f:
+                while chunk := f.read(CHUNK_SIZE):
+                    crc = zlib.crc32(chunk, crc)
+            entry.crc = crc
+        return entry.crc
+
+    def _central(self):
+        for entry in self.entries:
+            self._crc(entry)
+        parts = [entry.central_header() for entry in self.entries]
+        count = len(self.entries)
+        if self._zip64():
+            end64 = self._central_offset + self._central_size
+            parts.append(_END64.pack(0x06064b50, _END64.size - 12, _MADE_BY, _VERSION, 0, 0,
+                                     count, count, self._central_size, self._central_offset))
+            parts.append(_LOCATOR64.pack(0x07064b50, 0, end64, 1))
+            parts.append(_END.pack(0x06054b50, 0, 0, 0xFFFF, 0xFFFF,
+                                   0xFFFFFFFF, 0xFFFFFFFF, 0))
+        else:
+            parts.append(_END.pack(0x06054b50, 0, 0, count, count,
+                                   self._central_size, self._central_offset, 0))
+        return b''.join(parts)
+
+    def _file(self, entry, start, stop):
+        """Yield entry's data[start:stop], noting the CRC when it is all read."""
+        if entry.data is not None:
+            yield entry.data[start:stop]
+            return
+        whole = start == 0 and stop == entry.size
+        crc = 0
+        with open(entry.path, 'rb') as f:
+            f.seek(start)
+            remaining = stop - start
+            while remaining:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise OSError(f"{entry.path} shrank during export")
+                if whole:
+                    crc = zlib.crc32(chunk, crc)
+                remaining -= len(chunk)
+                yield chunk
+        if whole:
+            entry.crc = crc
+
+    def iter_range(self, start=0, stop=None):
+        """Yield the archive's bytes from start up to (not including) stop."""
+        stop = self.size if stop is None else stop
+        for offset, length, kind, entry in self._segments:
+            if offset + length <= start or offset >= stop or not length:
+                continue
+            lo, hi = max(start - offset, 0), min(stop - offset, length)
+            if kind == 'data':
+                yield from self._file(entry, lo, hi)
+            elif kind == 'local':
+                yield entry.local_header()[lo:hi]
+            elif kind == 'descriptor':
+                yield _DESCRIPTOR.pack(0x08074b50, self._crc(entry), entry.size, entry.size)[lo:hi]
+            else:
+                yield self._central()[lo:hi]
+
+def library_zip(controller):
+    """ZipStream of every original photo plus its index metadata."""
+    photos = sorted(p['filename'] for p in controller.get_available_photos())
+    history = controller.index.history()
+    metadata = {
+        'version': 1,
+        'photos': {name: {column: history[name][column] for column in METADATA_COLUMNS}
+                   for name in photos if name in history},
+    }
+    files = [(ORIGINALS_PREFIX + name, controller.originals_dir / name) for name in photos]
+    data = json.dumps(metadata, indent=1, sort_keys=True).encode()
+    return ZipStream(files, [(METADATA_NAME, data)])
+
+def _photo_name(member, allowed):
+    """The filename an archive member should be imported as, or None."""
+    if not member.startswith(ORIGINALS_PREFIX):
+        return None
+    name = member[len(ORIGINALS_PREFIX):]
+    if not name or PurePosixPath(name).name != name or name.startswith('.') or not allowed(name):
+        return None
+    return name
+
+def import_zip(controller, stream, allowed):
+    """Ingest the photos in a zip export; allowed(filename) filters file types.
+
+    Returns counts of imported, skipped (already present, a duplicate or not
+    a photo) and failed members. Raises zipfile.BadZipFile for something that isn't a zip.
+    """
+    result = {'imported': 0, 'skipped': 0, 'failed': 0}
+    with tempfile.TemporaryFile(dir=controller.photos_dir) as spool:
+        # The central directory is at the end, so the upload is spooled to
+        # disk first and members are then copied out one chunk at a time
+        shutil.copyfileobj(stream, spool, CHUNK_SIZE)
+        spool.seek(0)
+        with zipfile.ZipFile(spool) as archive:
+            metadata = {}
+            if METADATA_NAME in archive.namelist():
+                try:
+                    metadata = json.loads(archive.read(METADATA_NAME)).get('photos', {})
+                except ValueError as e:
+                    logger.error(f"Ignoring unreadable {METADATA_NAME} in import: {e}")
+
+            batch = []
+            for info in archive.infolist():
+                if info.is_dir() or info.filename == METADATA_NAME:
+                    continue
+                name = _photo_name(info.filename, allowed)
+                if name is None or (controller.originals_dir / name).exists():
+                    result['skipped'] += 1
+                    continue
+                try:
+                    with archive.open(info) as member:
+                        kept = controller.ingest(name, member)
+                except (OSError, zipfile.BadZipFile) as e:
+                    logger.error(f"Error importing {name}: {e}")
+                    kept = None
+                if kept is None:
+                    result['failed'] += 1
+                    continue
+                if kept != name:
+                    # The same photo under another name
+                    result['skipped'] += 1
+                    continue
+                result['imported'] += 1
+                if name in metadata:
+                    batch.append((name, metadata[name]))
+                if len(batch) >= BATCH_SIZE:
+                    controller.index.restore(batch)
+                    batch = []
+            if batch:
+                controller.index.restore(batch)
+    logger.info(f"Imported {result['imported']} photos, skipped {result['skipped']}, "
+                f"failed {result['failed']}")
+    return result
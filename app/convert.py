@@ -0,0 +1,187 @@
+"""Re-render the whole library for the configured panel.
+
+    python -m app.convert [--force] [--workers N] [filename ...]
+
+Photos whose display version is already up to date are skipped. The same
+job can be started from the web UI with POST /photos/convert-all.
+"""
+import argparse
+import fcntl
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from pathlib import Path
+from . import scheduler
+
+logger = logging.getLogger(__name__)
+
+# Photos handed to a worker process at a time
+CHUNK_SIZE = 8
+
+# Worker processes render in the background, below requests and refreshes
+JOB_CLASS = 'prefetch'
+
+_controller = None
+
+def _init_worker(config):
+    global _controller
+    from .display import DisplayController
+    scheduler.set_class(JOB_CLASS)
+    _controller = DisplayController(config)
+
+def _convert_one(filename):
+    with scheduler.activity(JOB_CLASS):
+        return filename, _controller.convert_photo(filename)
+
+def _format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+class ConvertJob:
+    """Convert many photos across a process pool, tracking throughput.
+
+    Progress is written to photos/display/.convert_job.json so any gunicorn
+    worker can report on a job another one started, and a lock file keeps
+    two jobs from running at once.
+    """
+
+    def __init__(self, controller, filenames=None, force=False, workers=None):
+        self.controller = controller
+        self.filenames = filenames
+        self.force = force
+        self.workers = workers or os.cpu_count() or 1
+        self.state_path = Path(controller.display_dir) / ".convert_job.json"
+        self.lock_path = Path(controller.display_dir) / ".convert_job.lock"
+        self.progress = {'running': False, 'total': 0, 'converted': 0, 'failed': 0}
+        self._started = time.monotonic()
+        self._lock_file = None
+
+    def pending(self):
+        """Filenames that need converting, skipping up-to-date ones unless forced."""
+        names = self.filenames
+        if names is None:
+            names = [p['filename'] for p in self.controller.get_available_photos()]
+        if self.force:
+            return list(names)
+        history = self.controller.index.history()
+        return [name for name in names if not self.controller.is_current(name, history.get(name, {}))]
+
+    def acquire(self):
+        """Take the job lock; False if another job is already running."""
+        self._lock_file = open(self.lock_path, 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+    def release(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _update(self, **changes):
+        self.progress.update(changes)
+        done = self.progress['converted'] + self.progress['failed']
+        elapsed = time.monotonic() - self._started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        remaining = self.progress['total'] - done
+        self.progress['images_per_sec'] = round(rate, 2)
+        self.progress['eta_s'] = round(remaining / rate) if rate else None
+        try:
+            tmp = self.state_path.with_suffix('.tmp')
+            tmp.write_text(json.dumps(self.progress))
+            os.replace(tmp, self.state_path)
+        except OSError as e:
+            logger.error(f"Could not save convert job progress: {e}")
+
+    def run(self, report=None):
+        """Convert everything pending; report(progress) is called as photos finish."""
+        todo = self.pending()
+        self._started = time.monotonic()
+        self.progress = {'running': True, 'total': len(todo), 'converted': 0, 'failed': 0,
+                         'skipped': 0, 'started': time.time(), 'failures': []}
+        if self.filenames is None:
+            self.progress['skipped'] = len(self.controller.get_available_photos()) - len(todo)
+        self._update()
+        logger.info(f"Converting {len(todo)} photos with {self.workers} workers")
+
+        if todo:
+            context = multiprocessing.get_context('spawn')
+            with context.Pool(min(self.workers, len(todo)), _init_worker, (self.controller.config,)) as pool:
+                for filename, ok in pool.imap_unordered(_convert_one, todo, chunksize=CHUNK_SIZE):
+                    if ok:
+                        self._update(converted=self.progress['converted'] + 1)
+                    else:
+                        self.progress['failures'].append(filename)
+                        self._update(failed=self.progress['failed'] + 1)
+                    if report is not None:
+                        report(self.progress)
+
+        self._update(running=False, elapsed_s=round(time.monotonic() - self._started, 1))
+        self.controller.storage.schedule_enforce()
+        logger.info(f"Converted {self.progress['converted']} photos, {self.progress['failed']} failed, "
+                    f"{self.progress['images_per_sec']} images/sec")
+        return self.progress
+
+    def start(self):
+        """Run in a background thread; False if a job is already running."""
+        if not self.acquire():
+            return False
+
+        def work():
+            try:
+                self.run()
+            except Exception as e:
+                logger.error(f"Convert job failed: {e}")
+                self._update(running=False, error=str(e))
+            finally:
+                self.release()
+
+        threading.Thread(target=work, name='convert-all', daemon=True).start()
+        return True
+
+    def status(self):
+        try:
+            return json.loads(self.state_path.read_text())
+        except (OSError, ValueError):
+            return {'running': False}
+
+def _print_progress(progress):
+    done = progress['converted'] + progress['failed']
+    eta = _format_eta(progress['eta_s']) if progress['eta_s'] is not None else '?'
+    print(f"\r{done}/{progress['total']} done, {progress['images_per_sec']} images/sec, ETA {eta}  ",
+          end='', flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.convert', description=__doc__.splitlines()[0])
+    parser.add_argument('filenames', nargs='*', help="photos in photos/originals (default: all)")
+    parser.add_argument('--force', action='store_true', help="convert even if up to date")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    from . import load_config
+    from .display import DisplayController
+    controller = DisplayController(load_config())
+    job = ConvertJob(controller, args.filenames or None, args.force, args.workers)
+    if not job.acquire():
+        print("Another conversion job is already running")
+        return 1
+    try:
+        progress = job.run(report=_print_progress)
+    finally:
+        job.release()
+    print(f"\nConverted {progress['converted']}, skipped {progress['skipped']}, failed {progress['failed']} "
+          f"in {progress['elapsed_s']}s")
+    for filename in progress['failures']:
+        print(f"  failed: {filename}")
+    return 1 if progress['failed'] else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
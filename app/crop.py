@@ -0,0 +1,100 @@
+import logging
+from functools import lru_cache
+from PIL import Image, ImageChops, ImageDraw, ImageFilter
+
+logger = logging.getLogger(__name__)
+
+# Optional face detection; edge energy alone is used without OpenCV
+try:
+    import cv2
+    import numpy as np
+except ImportError:
+    cv2 = None
+
+FIT_MODES = ('fit', 'fill', 'smart')
+
+# Saliency is stored as a GRID x GRID map of byte weights
+GRID = 16
+
+# Long side of the proxy the saliency is measured on
+PROXY_SIZE = 256
+
+# Candidate window positions tried along the axis being cropped
+_STEPS = 32
+
+@lru_cache(maxsize=1)
+def _face_detector():
+    return cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+def _faces(proxy):
+    """Face boxes in proxy (an 'L' image), or [] without OpenCV."""
+    if cv2 is None:
+        return []
+    try:
+        pixels = np.asarray(proxy)
+        return [(x, y, x + w, y + h) for x, y, w, h in
+                _face_detector().detectMultiScale(pixels, scaleFactor=1.2, minNeighbors=5)]
+    except Exception as e:
+        logger.warning(f"Face detection failed: {e}")
+        return []
+
+def saliency_grid(img):
+    """Measure where the interesting parts of an upright image are.
+
+    Edge energy of a small greyscale proxy, averaged into GRID x GRID cells,
+    with detected faces marked at full weight. Returns GRID * GRID bytes.
+    """
+    proxy = img.convert('L')
+    proxy.thumbnail((PROXY_SIZE, PROXY_SIZE))
+    edges = proxy.filter(ImageFilter.FIND_EDGES)
+    # Pillow leaves the outer pixels unfiltered, so they are not edges
+    edges = edges.crop((1, 1, edges.width - 1, edges.height - 1))
+    grid = edges.resize((GRID, GRID), Image.Resampling.BOX)
+
+    faces = _faces(proxy)
+    if faces:
+        mask = Image.new('L', proxy.size, 0)
+        draw = ImageDraw.Draw(mask)
+        for box in faces:
+            draw.rectangle(box, fill=255)
+        grid = ImageChops.lighter(grid, mask.resize((GRID, GRID), Image.Resampling.BOX))
+    return grid.tobytes()
+
+def _best_start(weights, length):
+    """Start (in cells) of the window of length cells covering most weight."""
+    prefix = [0]
+    for w in weights:
+        prefix.append(prefix[-1] + w)
+
+    def covered(x):
+        cell = min(int(x), len(weights) - 1)
+        return prefix[cell] + (x - cell) * weights[cell]
+
+    span = len(weights) - length
+    centre = span / 2
+    starts = [span * i / _STEPS for i in range(_STEPS + 1)]
+    # Ties (e.g. a blank image) go to the most central window
+    return max(starts, key=lambda s: (round(covered(s + length) - covered(s), 6), -abs(s - centre)))
+
+def crop_box(size, target_size, saliency=None):
+    """Largest box in an image of size with target_size's aspect ratio.
+
+    Centred, or placed over the most salient part when a saliency grid
+    from saliency_grid() is given.
+    """
+    width, height = size
+    target_w, target_h = target_size
+    if width * target_h > height * target_w:
+        crop_w, crop_h = height * target_w / target_h, height
+    else:
+        crop_w, crop_h = width, width * target_h / target_w
+
+    left, top = (width - crop_w) / 2, (height - crop_h) / 2
+    if saliency is not None and len(saliency) == GRID * GRID:
+        if crop_w < width:
+            columns = [sum(saliency[x::GRID]) for x in range(GRID)]
+            left = _best_start(columns, GRID * crop_w / width) * width / GRID
+        elif crop_h < height:
+            rows = [sum(saliency[y * GRID:(y + 1) * GRID]) for y in range(GRID)]
+            top = _best_start(rows, GRID * crop_h / height) * height / GRID
+    return (left, top, left + crop_w, top + crop_h)
@@ -0,0 +1,64 @@
+import logging
+from pathlib import Path
+from PIL import ExifTags, Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# HEIF/HEIC (iPhone photos) need pillow-heif; without it they fail to open
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_SUPPORTED = True
+except ImportError:
+    HEIF_SUPPORTED = False
+
+# EXIF orientations that swap width and height
+_TRANSPOSED = {5, 6, 7, 8}
+
+_POINTS_PER_INCH = 72
+
+def _pdf_dpi(page_width, page_height, target_size):
+    """DPI that renders a page (in points) just large enough for target_size."""
+    scale = max(target_size[0] / page_width, target_size[1] / page_height)
+    return max(1, round(scale * _POINTS_PER_INCH))
+
+def _open_pdf(path, target_size):
+    # Only the first page is rasterized, at the resolution the panel needs
+    try:
+        import fitz
+    except ImportError:
+        fitz = None
+    if fitz is not None:
+        with fitz.open(path) as doc:
+            page = doc[0]
+            dpi = _pdf_dpi(page.rect.width, page.rect.height, target_size)
+            pixmap = page.get_pixmap(dpi=dpi)
+            return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+    try:
+        from pdf2image import convert_from_path, pdfinfo_from_path
+    except ImportError:
+        raise ValueError("PDF support needs PyMuPDF or pdf2image installed")
+    width, height = (float(v) for v in pdfinfo_from_path(path)['Page size'].split()[0:3:2])
+    dpi = _pdf_dpi(width, height, target_size)
+    return convert_from_path(path, dpi=dpi, first_page=1, last_page=1)[0]
+
+def open_image(path, target_size, mode='RGB'):
+    """Decode path no larger than needed for target_size, upright, in mode.
+
+    The EXIF orientation is read before decoding so that JPEGs can be
+    decoded at reduced scale (draft) for the rotated target, and the
+    rotation is then applied to that small image rather than the original.
+    """
+    if Path(path).suffix.lower() == '.pdf':
+        return _open_pdf(path, target_size).convert(mode)
+
+    img = Image.open(path)
+    orientation = img.getexif().get(ExifTags.Base.Orientation, 1)
+    width, height = target_size
+    if orientation in _TRANSPOSED:
+        width, height = height, width
+    img.draft(mode, (width, height))
+    if orientation != 1:
+        img = ImageOps.exif_transpose(img)
+    return img.convert(mode)
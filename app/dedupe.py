@@ -0,0 +1,106 @@
+"""Exact and near-duplicate detection for the library.
+
+Each original gets a SHA-256 of its bytes, taken while it is saved, and a
+64-bit dHash of its picture, taken from the proxy decoded for saliency at
+ingest. An upload with a known SHA-256 is dropped. A photo whose dHash is
+within NEAR_DISTANCE bits of an existing one is kept but marked as a near
+duplicate of it, and the slideshow leaves it out.
+
+HashIndex answers "which photos are within r bits of this hash" without
+comparing against the whole library (multi-index hashing): hashes are
+split into four 16-bit chunks, each filed in its own table. If two hashes
+are at most r bits apart, one of their chunks is at most r // 4 bits apart,
+so a lookup only probes each table for the query's chunk and its
+near variants, and compares just the photos found there.
+"""
+from functools import lru_cache
+from itertools import combinations
+
+# Hamming distance up to which two dHashes count as the same picture
+NEAR_DISTANCE = 6
+
+# Size of the proxy the dHash is taken from
+HASH_PROXY = 32
+
+_CHUNKS = 4
+_CHUNK_BITS = 16
+
+def dhash(img):
+    """64-bit difference hash of a decoded image (any mode, any size)."""
+    from PIL import Image
+    proxy = img.convert('L').resize((HASH_PROXY, HASH_PROXY), Image.Resampling.BOX)
+    pixels = list(proxy.resize((9, 8), Image.Resampling.BOX).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            value = (value << 1) | (left < pixels[row * 9 + col + 1])
+    return value
+
+def to_signed(value):
+    """Unsigned 64-bit hash as the signed integer SQLite stores."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+def distance(a, b):
+    return (a ^ b).bit_count()
+
+@lru_cache(maxsize=None)
+def _flips(bits):
+    """XOR masks for every 16-bit chunk within bits of a given one."""
+    return tuple(sum(1 << b for b in chosen)
+                 for n in range(bits + 1) for chosen in combinations(range(_CHUNK_BITS), n))
+
+class HashIndex:
+    """Multi-index hashing over 64-bit hashes."""
+
+    def __init__(self):
+        self.hashes = {}
+        self._buckets = [{} for _ in range(_CHUNKS)]
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @staticmethod
+    def _chunks(value):
+        return [(value >> (_CHUNK_BITS * i)) & 0xFFFF for i in range(_CHUNKS)]
+
+    def add(self, name, value):
+        if name in self.hashes:
+            self.remove(name)
+        self.hashes[name] = value
+        for bucket, chunk in zip(self._buckets, self._chunks(value)):
+            bucket.setdefault(chunk, set()).add(name)
+
+    def remove(self, name):
+        value = self.hashes.pop(name, None)
+        if value is None:
+            return
+        for bucket, chunk in zip(self._buckets, self._chunks(value)):
+            names = bucket.get(chunk)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del bucket[chunk]
+
+    def sync(self, hashes):
+        """Make the index hold exactly hashes, a mapping of name -> hash."""
+        for name in [n for n in self.hashes if hashes.get(n) != self.hashes[n]]:
+            self.remove(name)
+        for name, value in hashes.items():
+            if name not in self.hashes:
+                self.add(name, value)
+
+    def near(self, value, radius=NEAR_DISTANCE):
+        """(distance, name) of every hash within radius of value, closest first."""
+        flips = _flips(radius // _CHUNKS)
+        candidates = set()
+        for bucket, chunk in zip(self._buckets, self._chunks(value)):
+            for flip in flips:
+                names = bucket.get(chunk ^ flip)
+                if names:
+                    candidates.update(names)
+        found = [(distance(value, self.hashes[name]), name) for name in candidates]
+        return sorted(match for match in found if match[0] <= radius)
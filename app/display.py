@@ -1,6 +1,21 @@
+import hashlib
 import logging
+import os
+import threading
 from pathlib import Path
-from .waveshare_utils import convert_for_display, display_image
+from . import dedupe
+from . import executors
+from . import metrics
+from . import profiling
+from . import scheduler
+from .framebuffer import raw_path
+from .library import PhotoIndex
+from .panels import get_panel
+from .readyset import ReadySet
+from .refresh import RefreshPolicy
+from .settings import render_key
+from .slideshow import Slideshow
+from .storage import StorageManager
 
 logger = logging.getLogger(__name__)
 
@@ -10,12 +25,41 @@ class DisplayController:
         self.photos_dir = Path("photos")
         self.originals_dir = self.photos_dir / "originals"
         self.display_dir = self.photos_dir / "display"
+        self.panel = get_panel(app_config)
+        self.refresh_policy = RefreshPolicy(app_config, self.display_dir)
+        self.render_key = render_key(app_config)
         
         # Ensure directories exist
         self.display_dir.mkdir(parents=True, exist_ok=True)
+        metrics.configure(self.display_dir)
+        scheduler.configure(self.display_dir)
+        profiling.configure(app_config)
+
+        self.index = PhotoIndex(self.photos_dir / "index.db")
+        # 0 turns near-duplicate detection off
+        self.near_distance = int(app_config.get('dedupe', {}).get('near_distance', dedupe.NEAR_DISTANCE))
+        self._hashes = dedupe.HashIndex()
+        self._hashes_source = None
+        self._hashes_lock = threading.Lock()
+        self.slideshow = Slideshow(self, app_config)
+        self.storage = StorageManager(self, app_config)
+        self.ready = ReadySet(self, app_config)
     
     def convert_photo(self, filename):
         """Convert a single photo from originals to display format"""
+        with profiling.profile('convert', filename), metrics.span('convert'):
+            ok = self._convert_photo(filename)
+        metrics.count('eink_jobs_total', job='convert', result='ok' if ok else 'failed')
+        metrics.flush()
+        return ok
+
+    def submit_convert(self, filename):
+        """Queue convert_photo() on the convert pool; returns a Future."""
+        return executors.submit('convert', self.convert_photo, filename)
+
+    def _convert_photo(self, filename):
+        # Pillow and the rendering code load on the first job, not at startup
+        from .waveshare_utils import convert_for_display
         try:
             input_path = self.originals_dir / filename
             if not input_path.exists():
@@ -23,8 +67,20 @@ class DisplayController:
                 return False
                 
             output_path = self.display_dir / f"{input_path.stem}.bmp"
-            
-            if convert_for_display(input_path, output_path, self.config):
+
+            info = self.index.get(filename) or {}
+            if info.get('aspect') is None:
+                info = self.analyze_photo(filename) or {}
+
+            partner = self.choose_partner(filename, info.get('aspect'))
+            partner_info = None
+            if partner is not None:
+                partner_info = (self.originals_dir / partner, self.index.get(partner)['saliency'])
+                logger.info(f"Pairing {filename} with {partner}")
+            self.index.set_partner(filename, partner)
+
+            if convert_for_display(input_path, output_path, self.config, info.get('saliency'), partner_info):
+                self.index.set_render_key(filename, self.render_key)
                 logger.info(f"Converted {filename} successfully")
                 return True
             return False
@@ -33,17 +89,222 @@ class DisplayController:
             logger.error(f"Error converting photo {filename}: {e}")
             return False
 
-    def display_photo(self, filename):
-        """Display a specific photo"""
+    def analyze_photo(self, filename):
+        """Measure a photo's shape and saliency once and keep them in the index"""
+        from .crop import PROXY_SIZE, saliency_grid
+        from .decode import open_image
+        try:
+            with metrics.span('analyze'):
+                img = open_image(self.originals_dir / filename, (PROXY_SIZE, PROXY_SIZE), 'L')
+                info = {'aspect': img.width / img.height, 'saliency': saliency_grid(img),
+                        'dhash': dedupe.dhash(img)}
+                info['duplicate_of'] = self.near_duplicate(filename, info['dhash'])
+            if info['duplicate_of']:
+                logger.info(f"{filename} looks like {info['duplicate_of']}")
+                metrics.count('eink_duplicates_total', kind='near')
+            self.index.set_analysis(filename, info['aspect'], info['saliency'],
+                                    dedupe.to_signed(info['dhash']), info['duplicate_of'])
+            return info
+        except Exception as e:
+            logger.error(f"Error analyzing photo {filename}: {e}")
+            return None
+
+    def near_duplicate(self, filename, value):
+        """The closest other photo within near_distance bits of dHash value, or None.
+
+        A photo that is itself a near duplicate is represented by the photo it
+        duplicates, so a burst of similar shots all point at the first one.
+        """
+        if not self.near_distance:
+            return None
+        history = self.index.history()
+        with self._hashes_lock:
+            if self._hashes_source is not history:
+                self._hashes.sync({name: dedupe.to_unsigned(row['dhash'])
+                                   for name, row in history.items() if row.get('dhash') is not None})
+                self._hashes_source = history
+            matches = self._hashes.near(value, self.near_distance)
+        for _, name in matches:
+            if name != filename and (self.originals_dir / name).exists():
+                return history[name].get('duplicate_of') or name
+        return None
+
+    def ingest(self, filename, stream):
+        """Add a new original from a file-like object, as uploads and imports do.
+
+        Returns filename once saved, the name of the photo already holding
+        the same bytes if it is an exact duplicate (nothing is saved), or
+        None on error.
+        """
+        if Path(filename).name != filename or filename == '..':
+            logger.error(f"Not saving {filename}: not a plain file name")
+            return None
+        target = self.originals_dir / filename
+        partial = target.with_name(f".{filename}.part")
+        digest = hashlib.sha256()
+        try:
+            self.originals_dir.mkdir(parents=True, exist_ok=True)
+            with open(partial, 'wb') as f:
+                while chunk := stream.read(256 * 1024):
+                    digest.update(chunk)
+                    f.write(chunk)
+            existing = self.index.claim_hash(filename, digest.hexdigest())
+            if existing is not None and not (self.originals_dir / existing).exists():
+                # Left behind by a photo removed outside the app
+                self.index.remove(existing)
+                existing = self.index.claim_hash(filename, digest.hexdigest())
+            if existing is not None:
+                logger.info(f"Dropped {filename}: same file as {existing}")
+                metrics.count('eink_duplicates_total', kind='exact')
+                return existing
+            os.replace(partial, target)
+        except OSError as e:
+            logger.error(f"Error saving {filename}: {e}")
+            return None
+        finally:
+            # Also covers a broken zip member or a client gone mid-upload
+            partial.unlink(missing_ok=True)
+        # Done once here so smart cropping at display time needs no extra decode;
+        # off the request thread, and convert_photo() analyzes if it gets there first
+        self.submit_analysis(filename)
+        self.storage.submit_transcode(filename)
+        self.storage.schedule_enforce()
+        # New uploads are likely to be shown soon
+        self.ready.schedule_fill()
+        return filename
+
+    def apply_bulk(self, delete=(), convert=(), display=()):
+        """Delete, convert and queue for display many photos in one go.
+
+        Index changes happen in a single transaction and rendered files of
+        deleted photos are removed in the background. Returns what changed,
+        so a client can update its view without listing the library again.
+        """
+        from .convert import ConvertJob
+        delta = {'deleted': [], 'converting': [], 'queued': [], 'missing': [], 'stale': []}
+        for filename in dict.fromkeys(delete):
+            try:
+                if Path(filename).name != filename:
+                    raise FileNotFoundError(filename)
+                (self.originals_dir / filename).unlink()
+                delta['deleted'].append(filename)
+            except FileNotFoundError:
+                delta['missing'].append(filename)
+        deleted = set(delta['deleted'])
+
+        def existing(filenames):
+            for filename in filenames:
+                if filename in deleted:
+                    continue
+                if Path(filename).name == filename and (self.originals_dir / filename).is_file():
+                    yield filename
+                elif filename not in delta['missing']:
+                    delta['missing'].append(filename)
+
+        delta['queued'] = list(existing(display))
+        delta['stale'] = self.index.apply(delete=delta['deleted'], enqueue=delta['queued'])
+        if delta['deleted'] or delta['stale']:
+            executors.submit('maintenance', self.remove_renders, delta['deleted'] + delta['stale'])
+
+        convert = list(dict.fromkeys(existing(convert)))
+        if convert:
+            job = ConvertJob(self, filenames=convert, force=True)
+            if job.start():
+                delta['converting'] = convert
+            else:
+                delta['convert_busy'] = True
+        for filename in dict.fromkeys(delta['queued']):
+            # Render ahead so the slideshow only has to push the frame
+            executors.submit('prefetch', self.prepare_photo, filename)
+        logger.info(f"Bulk: deleted {len(delta['deleted'])}, converting {len(delta['converting'])}, "
+                    f"queued {len(delta['queued'])}, missing {len(delta['missing'])}")
+        return delta
+
+    def remove_renders(self, filenames):
+        """Delete the display BMPs and raw framebuffers made for filenames"""
+        for filename in filenames:
+            scheduler.checkpoint()
+            display_path = self.display_dir / f"{Path(filename).stem}.bmp"
+            for path in (display_path, raw_path(display_path)):
+                try:
+                    path.unlink()
+                    logger.info(f"Deleted converted file: {path}")
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.error(f"Error deleting {path}: {e}")
+
+    def submit_analysis(self, filename):
+        """Queue analyze_photo() on the convert pool; returns a Future."""
+        return executors.submit('convert', self.analyze_photo, filename)
+
+    def choose_partner(self, filename, aspect):
+        """Photo to show alongside filename when display.pair is on, or None"""
+        if not self.config.get('display', {}).get('pair', False):
+            return None
+        from . import layout
+        size, _ = layout.canvas(self.panel, self.config)
+        available = {p['filename'] for p in self.get_available_photos()}
+        candidates = {name: a for name, a in self.index.aspects().items()
+                      if name in available and name != filename}
+        return layout.pick_partner(aspect, candidates, size, self.index.history())
+
+    def is_current(self, filename, info=None):
+        """Whether the display version is newer than the original and was made
+        with the current settings. info is the photo's index row, if at hand."""
+        if info is None:
+            info = self.index.get(filename) or {}
+        if info.get('render_key') != self.render_key:
+            return False
+        display_path = self.display_dir / f"{Path(filename).stem}.bmp"
+        try:
+            rendered = display_path.stat().st_mtime
+            if self.panel.fast_path:
+                rendered = min(rendered, raw_path(display_path).stat().st_mtime)
+            return rendered >= (self.originals_dir / filename).stat().st_mtime
+        except OSError:
+            return False
+
+    def prepare_photo(self, filename):
+        """Convert a photo ahead of time if it has no up-to-date display version"""
+        if self.is_current(filename):
+            metrics.count('eink_cache_requests_total', cache='display', result='hit')
+            return True
+        metrics.count('eink_cache_requests_total', cache='display', result='miss')
+        return self.convert_photo(filename)
+
+    def display_photo(self, filename, reason='manual'):
+        """Display a specific photo; reason is 'manual' or 'scheduled'"""
+        metrics.gauge('eink_queue_depth', 1, queue='display')
+        try:
+            with profiling.profile('display', filename), metrics.span('display'):
+                ok = self._display_photo(filename, reason)
+        finally:
+            metrics.gauge('eink_queue_depth', -1, queue='display')
+        metrics.count('eink_jobs_total', job='display', result='ok' if ok else 'failed')
+        metrics.flush()
+        # Showing a photo may have rendered it
+        self.storage.schedule_enforce()
+        return ok
+
+    def submit_display(self, filename, reason='manual'):
+        """Queue display_photo() behind any refresh already in progress."""
+        return executors.submit('display', self.display_photo, filename, reason)
+
+    def _display_photo(self, filename, reason):
+        from .waveshare_utils import display_image
         try:
             # Check if display version exists, if not convert it
             display_path = self.display_dir / f"{Path(filename).stem}.bmp"
             
-            if not display_path.exists():
-                if not self.convert_photo(filename):
-                    return False
+            if not self.prepare_photo(filename):
+                return False
             
-            if display_image(display_path):
+            if display_image(display_path, self.config, self.refresh_policy, reason):
+                self.index.mark_shown(filename)
+                partner = (self.index.get(filename) or {}).get('partner')
+                if partner:
+                    self.index.mark_shown(partner)
                 logger.info(f"Displayed {filename}")
                 return True
             return False
@@ -75,6 +336,10 @@ class DisplayController:
             return {
                 'total_photos': len(photos),
                 'converted_photos': sum(1 for p in photos if p['converted']),
+                'panel': self.panel.to_dict(),
+                'refresh_latency': self.refresh_policy.latencies(),
+                'slideshow': self.slideshow.status(),
+                'storage': self.storage.usage(),
                 'photos': photos
             }
         except Exception as e:
@@ -0,0 +1,61 @@
+"""Thread pools for work that should not run on a request thread.
+
+With the gthread worker each request gets a thread, so uploads, listings
+and photo downloads keep being served while a refresh is in progress. The
+slow jobs go to a pool per kind of work instead:
+
+    display      one thread: the panel is a single device, so refreshes
+                 from requests and the slideshow queue up here in order
+    convert      decoding, resizing and dithering; Pillow releases the GIL
+                 for most of it, so one thread per core
+    prefetch     one thread rendering ahead for the slideshow and the
+                 display queue
+    maintenance  one thread for housekeeping nobody is waiting on, such as
+                 removing the rendered files of deleted photos
+
+Each pool's threads do work of the scheduler class of the same name, so
+prefetch and maintenance run niced and make way for refreshes and
+requests, see scheduler.py.
+
+Pools are created on first use and forgotten in forked children, whose
+copies would have no threads behind them.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from . import scheduler
+
+SIZES = {
+    'display': 1,
+    'convert': os.cpu_count() or 1,
+    'prefetch': 1,
+    'maintenance': 1,
+}
+
+_pools = {}
+_lock = threading.Lock()
+
+def pool(name):
+    with _lock:
+        if name not in _pools:
+            _pools[name] = ThreadPoolExecutor(SIZES[name], thread_name_prefix=name,
+                                              initializer=scheduler.set_class, initargs=(name,))
+        return _pools[name]
+
+def submit(name, fn, *args, **kwargs):
+    """Run fn on the named pool; returns a Future."""
+    return pool(name).submit(scheduler.run, name, fn, *args, **kwargs)
+
+def shutdown(wait=True):
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for executor in pools:
+        executor.shutdown(wait=wait)
+
+def _forget():
+    global _lock
+    _lock = threading.Lock()
+    _pools.clear()
+
+os.register_at_fork(after_in_child=_forget)
@@ -0,0 +1,196 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# .epdraw header: magic, version, panel model, width, height, plane count,
+# bits per pixel, bytes per plane, CRC32 of the payload. Padded to 64 bytes
+# so the planes that follow start on an aligned offset.
+RAW_MAGIC = b'EPDRAW'
+RAW_VERSION = 1
+RAW_HEADER = struct.Struct('<6sB16sHHBBII27x')
+
+def raw_path(display_path):
+    """Where the pre-rendered framebuffer for a display BMP lives."""
+    return Path(display_path).with_suffix('.epdraw')
+
+def changed_regions(old, new, row_bytes, max_regions=3, gap_rows=16):
+    """Find the byte-aligned windows that differ between two 1bpp frames.
+
+    The frames are XORed as one big integer, so the comparison runs in C
+    rather than byte by byte. Changed rows closer than gap_rows apart are
+    merged into one band; if that still leaves more than max_regions bands
+    they are collapsed into a single bounding box.
+
+    Returns a list of (x0, y0, x1, y1) pixel boxes with x0/x1 on byte
+    boundaries and exclusive end coordinates.
+    """
+    if len(old) != len(new):
+        raise ValueError("Frames differ in size")
+    height = len(new) // row_bytes
+    xor = int.from_bytes(old, 'big') ^ int.from_bytes(new, 'big')
+    if not xor:
+        return []
+    mask = xor.to_bytes(len(new), 'big')
+
+    blank = bytes(row_bytes)
+    bands = []
+    for y in range(height):
+        if mask[y * row_bytes:(y + 1) * row_bytes] == blank:
+            continue
+        if bands and y - bands[-1][1] <= gap_rows:
+            bands[-1][1] = y + 1
+        else:
+            bands.append([y, y + 1])
+    if len(bands) > max_regions:
+        bands = [[bands[0][0], bands[-1][1]]]
+
+    from PIL import Image
+    mask_image = Image.frombytes('L', (row_bytes, height), mask)
+    regions = []
+    for y0, y1 in bands:
+        left, _, right, _ = mask_image.crop((0, y0, row_bytes, y1)).getbbox()
+        regions.append((left * 8, y0, right * 8, y1))
+    return regions
+
+def region_area(regions):
+    return sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in regions)
+
+def window_buffer(frame, row_bytes, region):
+    """Cut a region (from changed_regions) out of a packed 1bpp frame."""
+    x0, y0, x1, y1 = region
+    view = memoryview(frame)
+    start, end = x0 // 8, x1 // 8
+    return bytearray(b''.join(view[y * row_bytes + start:y * row_bytes + end] for y in range(y0, y1)))
+
+class FrameState:
+    """The last framebuffer pushed to the panel, shared by every worker.
+
+    Kept on disk next to the display BMPs so that whichever gunicorn worker
+    handles the next request diffs against what is really on the glass.
+    """
+
+    def __init__(self, directory):
+        self.frame_path = Path(directory) / ".last_frame"
+        self.meta_path = Path(directory) / ".last_frame.json"
+
+    def load(self, panel):
+        """Return (frame bytes, refresh counts since the last full refresh).
+
+        The counts map a refresh mode to how many times it has run since
+        the panel last had a full refresh. (None, {}) if nothing is known.
+        """
+        try:
+            meta = json.loads(self.meta_path.read_text())
+            if meta.get('model') != panel.name:
+                return None, {}
+            return self.frame_path.read_bytes(), meta.get('counts', {})
+        except (OSError, ValueError):
+            return None, {}
+
+    def save(self, panel, frame, counts):
+        try:
+            tmp = self.frame_path.with_suffix('.tmp')
+            tmp.write_bytes(frame)
+            os.replace(tmp, self.frame_path)
+            self.meta_path.write_text(json.dumps({'model': panel.name, 'counts': counts}))
+        except OSError as e:
+            logger.error(f"Could not save last frame: {e}")
+
+    def clear(self):
+        for path in (self.frame_path, self.meta_path):
+            path.unlink(missing_ok=True)
+
+def write_raw(path, panel, planes):
+    """Save packed planes for panel as an .epdraw file next to its BMP."""
+    payload = b''.join(bytes(plane) for plane in planes)
+    if len(planes) != panel.planes or len(payload) != panel.planes * panel.plane_size:
+        raise ValueError(f"Planes do not match panel {panel.name}")
+    header = RAW_HEADER.pack(RAW_MAGIC, RAW_VERSION, panel.name.encode(), panel.width,
+                             panel.height, panel.planes, panel.bits_per_pixel,
+                             panel.plane_size, zlib.crc32(payload))
+    path = Path(path)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        f.write(payload)
+    os.replace(tmp, path)
+
+class RawFrame:
+    """A memory-mapped .epdraw file.
+
+    planes are memoryviews into the mapping, so pushing them to the panel
+    never decodes an image or copies the framebuffer into Python objects.
+    """
+
+    def __init__(self, path, panel):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._check(panel)
+        except ValueError:
+            self._map.close()
+            raise
+        self._view = memoryview(self._map)
+        start, size = RAW_HEADER.size, panel.plane_size
+        self.planes = [self._view[start + i * size:start + (i + 1) * size]
+                       for i in range(panel.planes)]
+        self._frame = self._view[start:]
+
+    def _check(self, panel):
+        if len(self._map) < RAW_HEADER.size:
+            raise ValueError("Truncated header")
+        magic, version, model, width, height, planes, bpp, plane_size, crc = \
+            RAW_HEADER.unpack_from(self._map)
+        if magic != RAW_MAGIC or version != RAW_VERSION:
+            raise ValueError("Not an .epdraw file")
+        model = model.rstrip(b'\0').decode()
+        if model != panel.name or (width, height) != panel.size:
+            raise ValueError(f"Rendered for {model}, not {panel.name}")
+        if (planes, bpp, plane_size) != (panel.planes, panel.bits_per_pixel, panel.plane_size):
+            raise ValueError("Plane layout does not match panel")
+        if len(self._map) != RAW_HEADER.size + planes * plane_size:
+            raise ValueError("Truncated payload")
+        with memoryview(self._map) as view:
+            if zlib.crc32(view[RAW_HEADER.size:]) != crc:
+                raise ValueError("Checksum mismatch")
+
+    @property
+    def frame(self):
+        """All planes back to back, as FrameState stores them (not a copy)."""
+        return self._frame
+
+    def close(self):
+        for plane in self.planes:
+            plane.release()
+        self.planes = []
+        self._frame.release()
+        self._view.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def open_raw(path, panel, source=None):
+    """Open path as a RawFrame for panel, or None if it is missing or unusable.
+
+    A raw file older than source (the BMP it was rendered with) is stale.
+    """
+    path = Path(path)
+    try:
+        if source is not None and path.stat().st_mtime < Path(source).stat().st_mtime:
+            return None
+        return RawFrame(path, panel)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring raw framebuffer {path}: {e}")
+        return None
@@ -1,12 +1,84 @@
-import tomli
+import logging
+import os
+import time
+from app.settings import load_settings
 
-# Load configuration
+logger = logging.getLogger('gunicorn.error')
+
+# Load configuration; the master parses it once and, with preload_app, the
+# workers inherit both it and the app built from it
 try:
-    with open('config/config.toml', 'rb') as f:
-        _config = tomli.load(f)
-    bind = f"{_config['server']['host']}:{_config['server']['port']}"
-except (FileNotFoundError, KeyError):
+    _settings = load_settings()
+    bind = _settings.bind
+    workers = _settings.workers
+    worker_class = _settings.worker_class
+    threads = _settings.threads
+    timeout = _settings.timeout
+    preload_app = _settings.preload
+except (OSError, ValueError):
     bind = "0.0.0.0:8080"
+    workers = 2
+    worker_class = "gthread"
+    threads = 8
+    timeout = 30
+    preload_app = True
+
+if preload_app:
+    # create_app() leaves the slideshow thread to post_fork below
+    os.environ['EINK_START_IN_WORKER'] = '1'
+
+_loaded = time.monotonic()
+_forked = {}
+
+def _memory():
+    """(RSS, PSS) of this process in bytes; PSS splits shared pages between sharers."""
+    sizes = {}
+    for name in ('status', 'smaps_rollup'):
+        try:
+            with open(f'/proc/self/{name}') as f:
+                for line in f:
+                    key, _, value = line.partition(':')
+                    if key in ('VmRSS', 'Pss'):
+                        sizes[key] = int(value.split()[0]) * 1024
+        except OSError:
+            pass
+    return sizes.get('VmRSS'), sizes.get('Pss')
+
+def when_ready(server):
+    # Runs in the master once the app is loaded and before the first fork,
+    # so whatever preload builds here is shared by the workers
+    from app import preload
+    try:
+        if preload_app:
+            controller = server.app.wsgi().display_controller
+            summary = preload.warm(controller.config, controller.index)
+        else:
+            summary = preload.warm(load_settings().config)
+        logger.info(f"Preloaded {summary}")
+    except Exception as e:
+        logger.error(f"Preload failed, workers will build their own state: {e}")
+    rss, _ = _memory()
+    logger.info(f"Master ready {time.monotonic() - _loaded:.2f}s after loading config, "
+                f"RSS {(rss or 0) / 2**20:.1f} MiB")
+
+def pre_fork(server, worker):
+    _forked[worker.age] = time.monotonic()
+
+def post_fork(server, worker):
+    from app import metrics
+    # Counters recorded while preloading belong to the master
+    metrics.reset()
+    if preload_app:
+        server.app.wsgi().display_controller.slideshow.start()
 
-workers = 2
-timeout = 30
\ No newline at end of file
+def post_worker_init(worker):
+    from app import metrics
+    boot = time.monotonic() - _forked.get(worker.age, _loaded)
+    rss, pss = _memory()
+    metrics.gauge('eink_worker_boot_seconds', round(boot, 3), pid=worker.pid)
+    for kind, size in (('rss', rss), ('pss', pss)):
+        if size is not None:
+            metrics.gauge('eink_worker_memory_bytes', size, pid=worker.pid, kind=kind)
+    metrics.flush()
+    logger.info(f"Worker {worker.pid} booted in {boot * 1000:.0f}ms, "
+                f"RSS {(rss or 0) / 2**20:.1f} MiB, PSS {(pss or 0) / 2**20:.1f} MiB")
@@ -0,0 +1,87 @@
+import math
+from PIL import Image
+from .crop import crop_box
+
+# Counter-clockwise, like Image.rotate(); transposes move pixels without resampling
+_TRANSPOSES = {
+    90: Image.Transpose.ROTATE_90,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_270,
+}
+
+# White space between paired photos, in pixels
+GUTTER = 8
+
+def canvas(panel, config):
+    """(size to lay photos out on, transpose to the panel's native frame or None).
+
+    waveshare.rotation turns the picture for panels mounted upside down or
+    on their side; display.orientation = "portrait" on a landscape panel
+    (or the other way round) adds a quarter turn.
+    """
+    config = config or {}
+    rotation = config.get('waveshare', {}).get('rotation', 0) % 360
+    if rotation not in (0, 90, 180, 270):
+        raise ValueError(f"Rotation must be a multiple of 90, got {rotation}")
+    orientation = config.get('display', {}).get('orientation')
+    native = 'portrait' if panel.height > panel.width else 'landscape'
+    if orientation in ('portrait', 'landscape') and orientation != native:
+        rotation = (rotation + 90) % 360
+
+    width, height = panel.size
+    if rotation in (90, 270):
+        width, height = height, width
+    return (width, height), _TRANSPOSES.get(rotation)
+
+def slots(size, count):
+    """Boxes for count photos: side by side on a wide canvas, stacked on a tall one."""
+    width, height = size
+    if count == 1:
+        return [(0, 0, width, height)]
+    if width >= height:
+        half = (width - GUTTER) // 2
+        return [(0, 0, half, height), (width - half, 0, width, height)]
+    half = (height - GUTTER) // 2
+    return [(0, 0, width, half), (0, height - half, width, height)]
+
+def _slot_size(box):
+    return (box[2] - box[0], box[3] - box[1])
+
+def pick_partner(aspect, candidates, size, history=None):
+    """Choose a photo to share the canvas with one of the given aspect ratio.
+
+    Pairing only happens when the photo fits half the canvas better than
+    all of it (a portrait on a landscape panel). candidates maps filename
+    to aspect ratio; of those that also suit a half, the least recently
+    shown wins so the same partner does not turn up every time.
+    """
+    if not aspect:
+        return None
+    half = _slot_size(slots(size, 2)[0])
+
+    def suits_half(a):
+        distance = abs(math.log(a) - math.log(half[0] / half[1]))
+        return distance < abs(math.log(a) - math.log(size[0] / size[1]))
+
+    if not suits_half(aspect):
+        return None
+    history = history or {}
+    matches = [name for name, a in candidates.items() if a and suits_half(a)]
+    if not matches:
+        return None
+    return min(matches, key=lambda name: (history.get(name, {}).get('last_shown') or 0, name))
+
+def render(img, size, fit='fit', saliency=None):
+    """Scale img into exactly size using a display.fit mode (see convert_for_display)."""
+    if fit in ('fill', 'smart'):
+        # Crop and scale in one resample
+        box = crop_box(img.size, size, saliency if fit == 'smart' else None)
+        return img.resize(size, Image.Resampling.LANCZOS, box=box)
+
+    img.thumbnail(size, Image.Resampling.LANCZOS)
+    if img.size == size:
+        return img
+    framed = Image.new(img.mode, size, 'white')
+    # Center the image
+    framed.paste(img, ((size[0] - img.width) // 2, (size[1] - img.height) // 2))
+    return framed
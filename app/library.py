@@ -0,0 +1,224 @@
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS photos (
+    filename   TEXT PRIMARY KEY,
+    weight     REAL NOT NULL DEFAULT 1.0,
+    last_shown REAL,
+    show_count INTEGER NOT NULL DEFAULT 0,
+    saliency   BLOB,
+    aspect     REAL,
+    partner    TEXT,
+    render_key TEXT,
+    sha256     TEXT,
+    dhash      INTEGER,
+    duplicate_of TEXT
+);
+CREATE TABLE IF NOT EXISTS display_queue (
+    position INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL
+);
+"""
+
+# Columns added since the first schema, for index.db files created before them
+COLUMNS = {
+    'saliency': 'BLOB',
+    'aspect': 'REAL',
+    'partner': 'TEXT',
+    'render_key': 'TEXT',
+    'sha256': 'TEXT',
+    'dhash': 'INTEGER',
+    'duplicate_of': 'TEXT',
+}
+
+class PhotoIndex:
+    """Per-photo metadata kept in photos/index.db.
+
+    Photos on disk without a row are treated as never shown with weight 1,
+    so rows are only written when there is something to remember.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._snapshot = None
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+            existing = {row['name'] for row in db.execute("PRAGMA table_info(photos)")}
+            for name, kind in COLUMNS.items():
+                if name not in existing:
+                    db.execute(f"ALTER TABLE photos ADD COLUMN {name} {kind}")
+            db.execute("CREATE INDEX IF NOT EXISTS photos_sha256 ON photos (sha256)")
+
+    @contextmanager
+    def _connect(self):
+        # A fresh connection per call keeps this safe to use from the
+        # slideshow thread and from request handlers in any worker.
+        db = sqlite3.connect(self.path, timeout=10)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def get(self, filename):
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM photos WHERE filename = ?", (filename,)).fetchone()
+        return dict(row) if row else None
+
+    def _version(self):
+        # SQLite bumps the file change counter in the database header on
+        # every committed write, from any process
+        try:
+            with open(self.path, 'rb') as f:
+                return f.read(28)[24:28]
+        except OSError:
+            return None
+
+    def history(self):
+        """Read-only map of filename -> row for every indexed photo.
+
+        The result is kept and handed out again until index.db changes, so
+        a snapshot taken in the gunicorn master is shared by every worker
+        until the first write. Callers must not modify it.
+        """
+        version = self._version()
+        if self._snapshot is not None and version is not None and self._snapshot[0] == version:
+            return self._snapshot[1]
+        with self._connect() as db:
+            rows = {row['filename']: dict(row) for row in db.execute("SELECT * FROM photos")}
+        self._snapshot = (version, MappingProxyType(rows))
+        return self._snapshot[1]
+
+    def mark_shown(self, filename, when=None):
+        when = time.time() if when is None else when
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO photos (filename, last_shown, show_count) VALUES (?, ?, 1) "
+                "ON CONFLICT(filename) DO UPDATE SET last_shown = excluded.last_shown, "
+                "show_count = show_count + 1",
+                (filename, when))
+
+    def last_shown(self):
+        """(filename, timestamp) of the most recently shown photo, or (None, None)."""
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT filename, last_shown FROM photos WHERE last_shown IS NOT NULL "
+                "ORDER BY last_shown DESC LIMIT 1").fetchone()
+        return (row['filename'], row['last_shown']) if row else (None, None)
+
+    def set_weight(self, filename, weight):
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO photos (filename, weight) VALUES (?, ?) "
+                "ON CONFLICT(filename) DO UPDATE SET weight = excluded.weight",
+                (filename, weight))
+
+    def set_analysis(self, filename, aspect, saliency, dhash=None, duplicate_of=None):
+        """Store what was measured about a photo at ingest."""
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO photos (filename, aspect, saliency, dhash, duplicate_of) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(filename) DO UPDATE SET aspect = excluded.aspect, "
+                "saliency = excluded.saliency, dhash = excluded.dhash, "
+                "duplicate_of = excluded.duplicate_of",
+                (filename, aspect, saliency, dhash, duplicate_of))
+
+    def claim_hash(self, filename, digest):
+        """Record filename's SHA-256 unless another photo already has it.
+
+        Returns the name of the photo that has it, or None once filename does.
+        """
+        with self._connect() as db:
+            # Taken before the lookup so two uploads of one file can't both win
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT filename FROM photos WHERE sha256 = ? AND filename != ?",
+                             (digest, filename)).fetchone()
+            if row:
+                return row['filename']
+            db.execute(
+                "INSERT INTO photos (filename, sha256) VALUES (?, ?) "
+                "ON CONFLICT(filename) DO UPDATE SET sha256 = excluded.sha256",
+                (filename, digest))
+        return None
+
+    def aspects(self):
+        """Map filename -> width / height for every analyzed photo."""
+        with self._connect() as db:
+            return {row['filename']: row['aspect'] for row in
+                    db.execute("SELECT filename, aspect FROM photos WHERE aspect IS NOT NULL")}
+
+    def set_partner(self, filename, partner):
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO photos (filename, partner) VALUES (?, ?) "
+                "ON CONFLICT(filename) DO UPDATE SET partner = excluded.partner",
+                (filename, partner))
+
+    def set_render_key(self, filename, key):
+        """Remember the render_key() the display version was made with."""
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO photos (filename, render_key) VALUES (?, ?) "
+                "ON CONFLICT(filename) DO UPDATE SET render_key = excluded.render_key",
+                (filename, key))
+
+    def paired_with(self, filename):
+        """Photos whose display version also shows filename."""
+        with self._connect() as db:
+            return [row['filename'] for row in
+                    db.execute("SELECT filename FROM photos WHERE partner = ?", (filename,))]
+
+    def restore(self, rows):
+        """Write (filename, {weight, last_shown, show_count}) pairs in one transaction."""
+        with self._connect() as db:
+            db.executemany(
+                "INSERT INTO photos (filename, weight, last_shown, show_count) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(filename) DO UPDATE SET weight = excluded.weight, "
+                "last_shown = excluded.last_shown, show_count = excluded.show_count",
+                [(filename, row.get('weight', 1.0), row.get('last_shown'), row.get('show_count', 0))
+                 for filename, row in rows])
+
+    def apply(self, delete=(), enqueue=()):
+        """Remove photos and queue others for display in one transaction.
+
+        Returns the photos whose display version showed a removed photo
+        alongside them and so has to be rendered again.
+        """
+        removed = set(delete)
+        with self._connect() as db:
+            stale = [row['filename'] for row in
+                     db.execute("SELECT filename, partner FROM photos WHERE partner IS NOT NULL")
+                     if row['partner'] in removed and row['filename'] not in removed]
+            db.executemany("UPDATE photos SET partner = NULL WHERE filename = ?", [(f,) for f in stale])
+            db.executemany("UPDATE photos SET duplicate_of = NULL WHERE duplicate_of = ?",
+                           [(f,) for f in removed])
+            db.executemany("DELETE FROM photos WHERE filename = ?", [(f,) for f in removed])
+            db.executemany("DELETE FROM display_queue WHERE filename = ?", [(f,) for f in removed])
+            db.executemany("INSERT INTO display_queue (filename) VALUES (?)", [(f,) for f in enqueue])
+        return stale
+
+    def queued(self):
+        """Filenames waiting to be shown next, in order."""
+        with self._connect() as db:
+            return [row['filename'] for row in
+                    db.execute("SELECT filename FROM display_queue ORDER BY position")]
+
+    def dequeue(self, filename):
+        """Drop the first queued entry for filename."""
+        with self._connect() as db:
+            db.execute(
+                "DELETE FROM display_queue WHERE position = "
+                "(SELECT MIN(position) FROM display_queue WHERE filename = ?)", (filename,))
+
+    def remove(self, filename):
+        with self._connect() as db:
+            db.execute("DELETE FROM photos WHERE filename = ?", (filename,))
@@ -0,0 +1,209 @@
+"""Timing histograms and counters for conversion and display jobs.
+
+Code wraps each stage in span('name') and bumps counters with count().
+Every process keeps its own numbers and writes them to
+photos/display/.metrics/<pid>.json after each job, so /metrics can add up
+what all gunicorn workers, the slideshow and convert pool workers did.
+Numbers from processes that have exited are folded into retired.json.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds, from SPI chunks to ACeP refreshes
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+COUNTERS = {
+    'eink_spi_bytes_total': "Bytes sent to the panel over SPI, commands included",
+    'eink_refreshes_total': "Panel refreshes by waveform",
+    'eink_cache_requests_total': "Lookups of pre-rendered display data by cache and result",
+    'eink_jobs_total': "Conversion and display jobs by outcome",
+    'eink_duplicates_total': "Uploads found to be exact or near duplicates",
+}
+
+GAUGES = {
+    'eink_queue_depth': "Jobs waiting or in progress",
+    'eink_worker_boot_seconds': "Time from fork to ready for each gunicorn worker",
+    'eink_worker_memory_bytes': "Resident (rss) and proportional (pss) memory of each gunicorn worker at boot",
+}
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_stages = {}
+_directory = None
+
+def configure(directory):
+    """Flush this process's numbers under directory/.metrics from now on."""
+    global _directory
+    _directory = Path(directory) / ".metrics"
+
+def _key(name, labels):
+    return name + ''.join(f'|{k}={v}' for k, v in sorted(labels.items()))
+
+def count(name, amount=1, **labels):
+    """Add amount to a counter from COUNTERS."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def gauge(name, delta, **labels):
+    """Move a gauge from GAUGES up or down by delta."""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + delta
+
+def observe(stage, seconds):
+    with _lock:
+        entry = _stages.get(stage)
+        if entry is None:
+            entry = _stages[stage] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                entry['buckets'][i] += 1
+                break
+        entry['sum'] += seconds
+        entry['count'] += 1
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block into the eink_stage_seconds histogram."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+def snapshot():
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'stages': {stage: {**entry, 'buckets': list(entry['buckets'])} for stage, entry in _stages.items()},
+        }
+
+def flush():
+    """Write this process's numbers where collect() will find them."""
+    if _directory is None:
+        return
+    try:
+        _directory.mkdir(parents=True, exist_ok=True)
+        path = _directory / f"{os.getpid()}.json"
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(snapshot()))
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.error(f"Could not save metrics: {e}")
+
+def _merge(total, part):
+    for kind in ('counters', 'gauges'):
+        for key, value in part.get(kind, {}).items():
+            total[kind][key] = total[kind].get(key, 0) + value
+    for stage, entry in part.get('stages', {}).items():
+        into = total['stages'].setdefault(stage, {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0})
+        into['buckets'] = [a + b for a, b in zip(into['buckets'], entry['buckets'])]
+        into['sum'] += entry['sum']
+        into['count'] += entry['count']
+    return total
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+def _load(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+def collect():
+    """Numbers from every process that flushed, with this one's live."""
+    total = {'counters': {}, 'gauges': {}, 'stages': {}}
+    if _directory is None:
+        return _merge(total, snapshot())
+    try:
+        _directory.mkdir(parents=True, exist_ok=True)
+        with open(_directory / ".lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            retired_path = _directory / "retired.json"
+            retired = _merge({'counters': {}, 'gauges': {}, 'stages': {}}, _load(retired_path))
+            changed = False
+            for path in _directory.glob("[0-9]*.json"):
+                pid = int(path.stem)
+                if pid == os.getpid():
+                    continue
+                part = _load(path)
+                if _alive(pid):
+                    _merge(total, part)
+                else:
+                    # Gauges die with their process; counters and histograms carry on
+                    part.pop('gauges', None)
+                    _merge(retired, part)
+                    path.unlink()
+                    changed = True
+            if changed:
+                retired['gauges'] = {}
+                tmp = retired_path.with_suffix('.tmp')
+                tmp.write_text(json.dumps(retired))
+                os.replace(tmp, retired_path)
+    except OSError as e:
+        logger.error(f"Could not collect metrics: {e}")
+        retired = {}
+    _merge(total, retired)
+    return _merge(total, snapshot())
+
+def _labels(key):
+    name, *pairs = key.split('|')
+    pairs = [pair.split('=', 1) for pair in pairs]
+    if not pairs:
+        return name, ''
+    return name, '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render(data=None, extra_gauges=None):
+    """Prometheus text exposition of collect(), plus any gauges computed on the spot."""
+    data = data or collect()
+    gauges = {**data['gauges'], **(extra_gauges or {})}
+    lines = []
+    for kind, names, values in (('counter', COUNTERS, data['counters']), ('gauge', GAUGES, gauges)):
+        for name, help_text in names.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for key in sorted(values):
+                metric, labels = _labels(key)
+                if metric == name:
+                    lines.append(f"{name}{labels} {_format(values[key])}")
+
+    name = 'eink_stage_seconds'
+    lines += [f"# HELP {name} Time spent in each conversion and display stage",
+              f"# TYPE {name} histogram"]
+    for stage in sorted(data['stages']):
+        entry = data['stages'][stage]
+        cumulative = 0
+        for bound, hits in zip(BUCKETS, entry['buckets']):
+            cumulative += hits
+            lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {entry["count"]}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {_format(round(entry["sum"], 6))}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {entry["count"]}')
+    return '\n'.join(lines) + '\n'
+
+def reset():
+    """Forget everything recorded in this process (tests, forked workers)."""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _stages.clear()
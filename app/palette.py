@@ -0,0 +1,128 @@
+import logging
+from functools import lru_cache
+from PIL import Image, ImageFilter
+
+logger = logging.getLogger(__name__)
+
+# Each palette lists (panel code, nominal RGB) in the order the matching
+# Waveshare drivers use in their own getbuffer(). The code is the value the
+# controller expects for that ink, which is not always the palette position
+# (the 6-color Spectra panels skip code 4).
+PALETTES = {
+    'bw': (
+        (0, (0, 0, 0)),
+        (1, (255, 255, 255)),
+    ),
+    'bwr': (
+        (0, (0, 0, 0)),
+        (1, (255, 255, 255)),
+        (2, (255, 0, 0)),
+    ),
+    'bwy': (
+        (0, (0, 0, 0)),
+        (1, (255, 255, 255)),
+        (2, (255, 255, 0)),
+    ),
+    'bwyr': (
+        (0, (0, 0, 0)),
+        (1, (255, 255, 255)),
+        (2, (255, 255, 0)),
+        (3, (255, 0, 0)),
+    ),
+    'acep7': (
+        (0, (0, 0, 0)),
+        (1, (255, 255, 255)),
+        (2, (0, 255, 0)),
+        (3, (0, 0, 255)),
+        (4, (255, 0, 0)),
+        (5, (255, 255, 0)),
+        (6, (255, 128, 0)),
+    ),
+    'spectra6': (
+        (0, (0, 0, 0)),
+        (1, (255, 255, 255)),
+        (2, (255, 255, 0)),
+        (3, (255, 0, 0)),
+        (5, (0, 0, 255)),
+        (6, (0, 255, 0)),
+    ),
+}
+
+# Grid points per axis of the sRGB -> Lab lookup table. Pillow interpolates
+# between them, so 17 keeps the one-off table build cheap on a Pi Zero.
+LUT_SIZE = 17
+
+_D65 = (0.95047, 1.0, 1.08883)
+
+def _linearize(c):
+    return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+def _lab_f(t):
+    return t ** (1 / 3) if t > 216 / 24389 else t * 841 / 108 + 4 / 29
+
+def srgb_to_lab(r, g, b):
+    """Convert sRGB components in 0..1 to CIE L*a*b* (D65)."""
+    r, g, b = _linearize(r), _linearize(g), _linearize(b)
+    x = (0.4124564 * r + 0.3575761 * g + 0.1804375 * b) / _D65[0]
+    y = (0.2126729 * r + 0.7151522 * g + 0.0721750 * b) / _D65[1]
+    z = (0.0193339 * r + 0.1191920 * g + 0.9503041 * b) / _D65[2]
+    fx, fy, fz = _lab_f(x), _lab_f(y), _lab_f(z)
+    return 116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)
+
+def _encode_lab(lab):
+    # One byte step per Lab unit on every axis, so Pillow's Euclidean
+    # nearest-color search in "RGB" space is a CIE76 delta-E search.
+    L, a, b = lab
+    return tuple(min(255, max(0, round(v))) for v in (L, a + 128, b + 128))
+
+def _lightness_range(name):
+    lightness = [srgb_to_lab(*(c / 255 for c in rgb))[0] for _, rgb in PALETTES[name]]
+    return min(lightness), max(lightness)
+
+@lru_cache(maxsize=None)
+def lab_lut(name):
+    """Build the sRGB -> encoded Lab 3D LUT for a palette.
+
+    Source lightness is compressed into the palette's own black..white range
+    so highlights and shadows the panel cannot show don't turn into dither
+    noise. Built once per palette and cached for the life of the process.
+    """
+    low, high = _lightness_range(name)
+    scale = (high - low) / 100
+
+    def to_lab(r, g, b):
+        L, a, b_ = srgb_to_lab(r, g, b)
+        return tuple(v / 255 for v in _encode_lab((low + L * scale, a, b_)))
+
+    return ImageFilter.Color3DLUT.generate(LUT_SIZE, to_lab)
+
+@lru_cache(maxsize=None)
+def _lab_palette_image(name):
+    colors = [_encode_lab(srgb_to_lab(*(c / 255 for c in rgb))) for _, rgb in PALETTES[name]]
+    # Pad with the first entry so the unused slots can never win a match
+    colors += [colors[0]] * (256 - len(colors))
+    pal_image = Image.new('P', (1, 1))
+    pal_image.putpalette([c for color in colors for c in color])
+    return pal_image
+
+def prepare(name):
+    """Build a palette's LUT and quantizer palette ahead of the first job."""
+    lab_lut(name)
+    _lab_palette_image(name)
+
+def quantize(image, name, dither=True):
+    """Map an image onto a panel palette using perceptual color matching.
+
+    Returns a 'P' image whose pixel values are positions in PALETTES[name]
+    and whose palette holds the nominal colors, so it previews correctly.
+    """
+    lab = image.convert('RGB').filter(lab_lut(name))
+    dither_mode = Image.Dither.FLOYDSTEINBERG if dither else Image.Dither.NONE
+    result = lab.quantize(palette=_lab_palette_image(name), dither=dither_mode)
+    result.putpalette([c for _, rgb in PALETTES[name] for c in rgb])
+    return result
+
+def panel_codes(name):
+    """Translation table from palette positions to the panel's color codes."""
+    codes = [code for code, _ in PALETTES[name]]
+    return bytes(codes + [codes[0]] * (256 - len(codes)))
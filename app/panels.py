@@ -0,0 +1,340 @@
+import importlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Buffer layouts we can build without going through the driver's getbuffer():
+#   mono      - one 1bpp plane
+#   black_red - a 1bpp black plane and a 1bpp red (or yellow) plane
+#   2bpp/4bpp - one plane of packed palette codes, high bits first
+# Panels with layout None use their driver's own getbuffer().
+BITS_PER_PIXEL = {'mono': 1, 'black_red': 1, '2bpp': 2, '4bpp': 4}
+
+def _mode(init, display, *init_args):
+    return (init, display, init_args)
+
+FULL = _mode('init', 'display')
+
+class DriverAttr:
+    """An init argument that lives on the driver's EPD object, e.g. a LUT."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def resolve(self, epd):
+        return getattr(epd, self.name)
+
+_LUT_FULL = _mode('init', 'display', DriverAttr('lut_full_update'))
+
+# Steps for pushing pre-packed planes without the driver's display() method,
+# which often rebuilds or inverts the buffer byte by byte in Python first.
+def _cmd(command, *data):
+    return ('cmd', command, data)
+
+def _write(plane, invert=False):
+    return ('write', plane, invert)
+
+def _call(method):
+    return ('call', method)
+
+def _delay(ms):
+    return ('delay', ms)
+
+_UC8179_BW = [_cmd(0x10), _write(0, invert=True), _cmd(0x13), _write(0),
+              _cmd(0x12), _delay(100), _call('ReadBusy')]
+_SSD_BASE = [_cmd(0x24), _write(0), _cmd(0x26), _write(0), _call('TurnOnDisplay')]
+_SSD_BW = [_cmd(0x24), _write(0), _call('TurnOnDisplay')]
+_ACEP = [_cmd(0x10), _write(0), _call('TurnOnDisplay')]
+_BWYR = [_cmd(0x04), _call('ReadBusyH'), _cmd(0x10), _write(0), _call('TurnOnDisplay')]
+
+class Panel:
+    """Static description of one driver in app/lib/waveshare_epd.
+
+    modes maps a refresh mode ('full', 'fast', 'partial', '4gray') to the
+    driver's (init method, display method, init args). refresh_s holds the
+    typical refresh time per mode in seconds, from the Waveshare spec sheets.
+
+    partial_window says how the partial display method takes a window:
+      'slice'        - (window buffer, x0, y0, x1, y1)
+      'frame'        - (whole frame, x0, y0, x1, y1)
+      'coords_first' - (x0, y0, x1, y1, whole frame)
+      'old_new'      - (previous frame, whole frame)
+      None           - (whole frame), no windowing
+    partial_max_xy is the largest coordinate the driver can address in a
+    partial window, for drivers that drop the higher address bits.
+    Panels whose partial waveform needs the old image in controller RAM use
+    their base-image method for full refreshes.
+
+    transfers maps a display method name to the raw SPI steps that do the
+    same job, for use with pre-rendered planes.
+
+    controller is the family of the panel's controller chip:
+      'uc'  - UC81xx style: RAM at 0x10/0x13, refresh 0x12, BUSY active low
+      'ssd' - SSD16xx style: RAM at 0x24/0x26, refresh 0x20, BUSY active high
+    busy_level is the level of the BUSY pin while the panel is busy, for
+    drivers that differ from their family.
+    """
+
+    def __init__(self, name, width, height, palette='bw', layout='mono',
+                 invert=False, modes=None, refresh_s=None, clear_args=(),
+                 partial_window=None, partial_max_xy=None, transfers=None,
+                 controller='uc', busy_level=None):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.palette = palette
+        self.layout = layout
+        # True when the driver wants 1 = ink in its 1bpp planes
+        self.invert = invert
+        self.modes = {'full': FULL, **(modes or {})}
+        self.refresh_s = refresh_s or {}
+        self.clear_args = clear_args
+        self.partial_window = partial_window
+        self.partial_max_xy = partial_max_xy
+        self.transfers = transfers or {}
+        self.controller = controller
+        self.busy_level = (0 if controller == 'uc' else 1) if busy_level is None else busy_level
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+    @property
+    def planes(self):
+        return 2 if self.layout == 'black_red' else 1
+
+    @property
+    def bits_per_pixel(self):
+        return BITS_PER_PIXEL.get(self.layout, 1)
+
+    @property
+    def fast_path(self):
+        """Whether the app can pack buffers itself instead of calling getbuffer()."""
+        return self.layout is not None
+
+    @property
+    def plane_size(self):
+        return self.row_bytes * self.height
+
+    @property
+    def row_bytes(self):
+        return (self.width * self.bits_per_pixel + 7) // 8
+
+    def supports(self, mode):
+        return mode in self.modes
+
+    def load_driver(self):
+        """Import the driver module; this also pulls in epdconfig and the GPIO stack."""
+        return importlib.import_module(f"{__package__}.lib.waveshare_epd.{self.name}")
+
+    def to_dict(self):
+        return {
+            'model': self.name,
+            'width': self.width,
+            'height': self.height,
+            'palette': self.palette,
+            'planes': self.planes,
+            'bits_per_pixel': self.bits_per_pixel,
+            'modes': sorted(self.modes),
+            'refresh_s': self.refresh_s,
+        }
+
+_PANELS = [
+    Panel('epd1in02', 80, 128,
+          modes={'full': _mode('Init', 'display'),
+                 'partial': _mode('Partial_Init', 'DisplayPartial')},
+          refresh_s={'full': 2.0, 'partial': 0.5}, partial_window='old_new'),
+    Panel('epd1in54', 200, 200, controller='ssd', modes={'full': _LUT_FULL}, refresh_s={'full': 2.0}),
+    Panel('epd1in54_V2', 200, 200, controller='ssd',
+          modes={'full': _mode('init', 'displayPartBaseImage', False),
+                 'partial': _mode('init', 'displayPart', True)},
+          refresh_s={'full': 2.0, 'partial': 0.3}),
+    Panel('epd1in54b', 200, 200, palette='bwr', layout='black_red', refresh_s={'full': 15.0}),
+    Panel('epd1in54b_V2', 200, 200, controller='ssd', palette='bwr', layout='black_red',
+          refresh_s={'full': 15.0}),
+    Panel('epd1in54c', 152, 152, palette='bwy', layout='black_red', refresh_s={'full': 15.0}),
+    Panel('epd1in64g', 168, 168, palette='bwyr', layout='2bpp', refresh_s={'full': 20.0}),
+    Panel('epd2in13', 122, 250, controller='ssd', modes={'full': _LUT_FULL}, refresh_s={'full': 2.0}),
+    Panel('epd2in13_V2', 122, 250, controller='ssd',
+          modes={'full': _mode('init', 'displayPartBaseImage', 0),
+                 'partial': _mode('init', 'displayPartial', 1)},
+          refresh_s={'full': 2.0, 'partial': 0.3}),
+    Panel('epd2in13_V3', 122, 250, controller='ssd',
+          modes={'full': _mode('init', 'displayPartBaseImage'),
+                 'partial': _mode('init', 'displayPartial')},
+          refresh_s={'full': 2.0, 'partial': 0.3}),
+    Panel('epd2in13_V4', 122, 250, controller='ssd',
+          modes={'full': _mode('init', 'displayPartBaseImage'),
+                 'fast': _mode('init_fast', 'display_fast'),
+                 'partial': _mode('init', 'displayPartial')},
+          refresh_s={'full': 2.0, 'fast': 1.5, 'partial': 0.3}),
+    Panel('epd2in13b_V3', 104, 212, palette='bwr', layout='black_red', refresh_s={'full': 15.0}),
+    Panel('epd2in13b_V4', 122, 250, controller='ssd', palette='bwr', layout='black_red',
+          refresh_s={'full': 15.0}),
+    Panel('epd2in13bc', 104, 212, palette='bwr', layout='black_red', refresh_s={'full': 15.0}),
+    Panel('epd2in13d', 104, 212,
+          modes={'partial': _mode('init', 'DisplayPartial')},
+          refresh_s={'full': 2.0, 'partial': 0.3}),
+    Panel('epd2in13g', 122, 250, palette='bwyr', layout='2bpp', refresh_s={'full': 20.0}),
+    Panel('epd2in15b', 160, 296, controller='ssd', palette='bwr', layout='black_red',
+          refresh_s={'full': 15.0}),
+    Panel('epd2in15g', 160, 296, palette='bwyr', layout='2bpp', refresh_s={'full': 20.0}),
+    Panel('epd2in36g', 168, 296, palette='bwyr', layout='2bpp', refresh_s={'full': 20.0}),
+    Panel('epd2in66', 152, 296, controller='ssd', modes={'full': _mode('init', 'display', 0)},
+          refresh_s={'full': 3.0}),
+    Panel('epd2in66b', 152, 296, controller='ssd', palette='bwr', layout='black_red',
+          refresh_s={'full': 15.0}),
+    Panel('epd2in66g', 184, 360, palette='bwyr', layout='2bpp', refresh_s={'full': 20.0}),
+    Panel('epd2in7', 176, 264,
+          modes={'4gray': _mode('Init_4Gray', 'display_4Gray')},
+          refresh_s={'full': 6.0, '4gray': 6.0}),
+    Panel('epd2in7_V2', 176, 264, controller='ssd',
+          modes={'full': _mode('init', 'display_Base'),
+                 'fast': _mode('init_Fast', 'display_Fast'),
+                 'partial': _mode('init', 'display_Partial'),
+                 '4gray': _mode('Init_4Gray', 'display_4Gray')},
+          refresh_s={'full': 6.0, 'fast': 1.5, 'partial': 0.3, '4gray': 6.0},
+          partial_window='frame'),
+    Panel('epd2in7b', 176, 264, palette='bwr', layout='black_red', refresh_s={'full': 15.0}),
+    Panel('epd2in7b_V2', 176, 264, controller='ssd', palette='bwr', layout='black_red',
+          refresh_s={'full': 15.0}),
+    Panel('epd2in9', 128, 296, controller='ssd', modes={'full': _LUT_FULL}, refresh_s={'full': 2.0}),
+    Panel('epd2in9_V2', 128, 296, controller='ssd',
+          modes={'full': _mode('init', 'display_Base'),
+                 'fast': _mode('init_Fast', 'display'),
+                 'partial': _mode('init', 'display_Partial'),
+                 '4gray': _mode('Init_4Gray', 'display_4Gray')},
+          refresh_s={'full': 3.0, 'fast': 1.5, 'partial': 0.3, '4gray': 3.0}),
+    Panel('epd2in9b_V3', 128, 296, palette='bwr', layout='black_red', refresh_s={'full': 15.0}),
+    Panel('epd2in9b_V4', 128, 296, controller='ssd', palette='bwr', layout='black_red',
+          modes={'full': _mode('init', 'display_Base'),
+                 'fast': _mode('init_Fast', 'display_Fast'),
+                 'partial': _mode('init', 'display_Partial')},
+          refresh_s={'full': 15.0, 'fast': 7.0, 'partial': 1.0}, partial_window='frame',
+          transfers={'display_Base': [_cmd(0x24), _write(0), _cmd(0x26), _write(1, invert=True),
+                                      _call('TurnOnDisplay_Base'), _cmd(0x26), _write(0, invert=True)]}),
+    Panel('epd2in9bc', 128, 296, palette='bwr', layout='black_red', refresh_s={'full': 15.0}),
+    Panel('epd2in9d', 128, 296,
+          modes={'partial': _mode('init', 'DisplayPartial')},
+          refresh_s={'full': 2.0, 'partial': 0.3}),
+    Panel('epd3in0g', 168, 400, palette='bwyr', layout='2bpp', refresh_s={'full': 20.0}),
+    Panel('epd3in52', 240, 360, refresh_s={'full': 2.0}),
+    Panel('epd3in7', 280, 480, controller='ssd', layout=None,
+          modes={'full': _mode('init', 'display_1Gray', 1),
+                 '4gray': _mode('init', 'display_4Gray', 0)},
+          refresh_s={'full': 3.0, '4gray': 3.0}, clear_args=(0xFF, 1)),
+    Panel('epd4in01f', 640, 400, palette='acep7', layout='4bpp', refresh_s={'full': 25.0},
+          transfers={'display': [_cmd(0x61, 0x02, 0x80, 0x01, 0x90), _cmd(0x10), _write(0),
+                                  _cmd(0x04), _call('ReadBusyHigh'), _cmd(0x12), _call('ReadBusyHigh'),
+                                  _cmd(0x02), _call('ReadBusyLow')]}),
+    Panel('epd4in2', 400, 300,
+          modes={'partial': _mode('init_Partial', 'EPD_4IN2_PartialDisplay'),
+                 '4gray': _mode('Init_4Gray', 'display_4Gray')},
+          refresh_s={'full': 4.0, 'partial': 0.5, '4gray': 4.0},
+          partial_window='coords_first'),
+    Panel('epd4in26', 800, 480, controller='ssd',
+          modes={'full': _mode('init', 'display_Base'),
+                 'fast': _mode('init_Fast', 'display_Fast'),
+                 'partial': _mode('init', 'display_Partial'),
+                 '4gray': _mode('init_4GRAY', 'display_4Gray')},
+          refresh_s={'full': 3.5, 'fast': 1.5, 'partial': 0.4, '4gray': 3.5},
+          transfers={'display': _SSD_BW, 'display_Base': _SSD_BASE}),
+    Panel('epd4in2_V2', 400, 300, controller='ssd',
+          modes={'fast': _mode('init_fast', 'display_Fast', 0),
+                 'partial': _mode('init', 'display_Partial'),
+                 '4gray': _mode('Init_4Gray', 'display_4Gray')},
+          refresh_s={'full': 3.5, 'fast': 1.5, 'partial': 0.4, '4gray': 3.5}),
+    Panel('epd4in2b_V2', 400, 300, controller='ssd', palette='bwr', layout='black_red',
+          refresh_s={'full': 15.0}),
+    Panel('epd4in2b_V2_old', 400, 300, controller='ssd', palette='bwr', layout='black_red',
+          refresh_s={'full': 15.0}),
+    Panel('epd4in2bc', 400, 300, palette='bwr', layout='black_red', refresh_s={'full': 15.0}),
+    Panel('epd4in37g', 512, 368, palette='bwyr', layout='2bpp', refresh_s={'full': 20.0},
+          transfers={'display': _BWYR}),
+    Panel('epd5in65f', 600, 448, palette='acep7', layout='4bpp', refresh_s={'full': 25.0},
+          transfers={'display': [_cmd(0x61, 0x02, 0x58, 0x01, 0xC0), _cmd(0x10), _write(0),
+                                  _cmd(0x04), _call('ReadBusyHigh'), _cmd(0x12), _call('ReadBusyHigh'),
+                                  _cmd(0x02), _call('ReadBusyLow'), _delay(500)]}),
+    Panel('epd5in79', 792, 272, controller='ssd',
+          modes={'full': _mode('init', 'display_Base'),
+                 'fast': _mode('init_Fast', 'display_Fast'),
+                 'partial': _mode('init_Partial', 'display_Partial'),
+                 '4gray': _mode('init_4Gray', 'display_4Gray')},
+          refresh_s={'full': 3.5, 'fast': 1.5, 'partial': 0.5, '4gray': 3.5}),
+    Panel('epd5in79b', 792, 272, controller='ssd', palette='bwr', layout='black_red',
+          refresh_s={'full': 16.0}),
+    Panel('epd5in79g', 792, 272, palette='bwyr', layout='2bpp', refresh_s={'full': 22.0}),
+    Panel('epd5in83', 600, 448, layout=None, refresh_s={'full': 4.0}),
+    Panel('epd5in83_V2', 648, 480, refresh_s={'full': 4.0}),
+    Panel('epd5in83b_V2', 648, 480, palette='bwr', layout='black_red', refresh_s={'full': 16.0},
+          transfers={'display': [_cmd(0x10), _write(0), _cmd(0x13), _write(1, invert=True),
+                                  _cmd(0x12), _delay(200), _call('ReadBusy')]}),
+    Panel('epd5in83bc', 600, 448, palette='bwr', layout='black_red', refresh_s={'full': 16.0}),
+    Panel('epd7in3e', 800, 480, palette='spectra6', layout='4bpp', refresh_s={'full': 19.0},
+          transfers={'display': _ACEP}),
+    Panel('epd7in3f', 800, 480, palette='acep7', layout='4bpp', refresh_s={'full': 35.0},
+          transfers={'display': _ACEP}),
+    Panel('epd7in3g', 800, 480, palette='bwyr', layout='2bpp', refresh_s={'full': 22.0},
+          transfers={'display': _BWYR}),
+    Panel('epd7in5', 640, 384, layout=None, refresh_s={'full': 6.0}),
+    Panel('epd7in5_HD', 880, 528, controller='ssd', refresh_s={'full': 5.0},
+          transfers={'display': [_cmd(0x4F, 0x00, 0x00), _cmd(0x24), _write(0), _cmd(0x22, 0xF7),
+                                  _cmd(0x20), _delay(10), _call('ReadBusy')]}),
+    Panel('epd7in5_V2', 800, 480, invert=True,
+          modes={'fast': _mode('init_fast', 'display'),
+                 'partial': _mode('init_part', 'display_Partial'),
+                 '4gray': _mode('init_4Gray', 'display_4Gray')},
+          refresh_s={'full': 5.0, 'fast': 1.5, 'partial': 0.4, '4gray': 5.0},
+          partial_window='slice',
+          transfers={'display': _UC8179_BW}),
+    Panel('epd7in5_V2_old', 800, 480, invert=True,
+          modes={'fast': _mode('init_fast', 'display'),
+                 'partial': _mode('init_part', 'display_Partial')},
+          refresh_s={'full': 5.0, 'fast': 1.5, 'partial': 0.4}, partial_window='slice',
+          transfers={'display': _UC8179_BW}),
+    Panel('epd7in5b_HD', 880, 528, controller='ssd', palette='bwr', layout='black_red',
+          refresh_s={'full': 22.0},
+          transfers={'display': [_cmd(0x4F, 0xAF), _cmd(0x24), _write(0), _cmd(0x26), _write(1, invert=True),
+                                  _cmd(0x22, 0xC7), _cmd(0x20), _delay(200), _call('ReadBusy')]}),
+    Panel('epd7in5b_V2', 800, 480, palette='bwr', layout='black_red', invert=True,
+          modes={'fast': _mode('init_Fast', 'display'),
+                 'partial': _mode('init_part', 'display_Partial')},
+          refresh_s={'full': 16.0, 'fast': 8.0, 'partial': 1.0}, partial_window='slice',
+          transfers={'display': [_cmd(0x10), _write(0, invert=True), _cmd(0x13), _write(1),
+                                  _cmd(0x12), _delay(100), _call('ReadBusy')]}),
+    Panel('epd7in5b_V2_old', 800, 480, palette='bwr', layout='black_red', invert=True,
+          refresh_s={'full': 16.0}),
+    Panel('epd7in5bc', 640, 384, palette='bwr', layout='black_red', refresh_s={'full': 16.0}),
+    Panel('epd13in3b', 960, 680, controller='ssd', palette='bwr', layout='black_red',
+          modes={'full': _mode('init', 'display_Base'),
+                 'partial': _mode('init', 'display_Partial')},
+          refresh_s={'full': 20.0, 'partial': 1.0}, partial_window='frame',
+          transfers={'display': [_cmd(0x24), _write(0), _cmd(0x26), _write(1, invert=True),
+                                  _call('TurnOnDisplay')],
+                     'display_Base': [_cmd(0x24), _write(0), _cmd(0x26), _write(1, invert=True),
+                                      _call('TurnOnDisplay'), _cmd(0x26), _write(0)]}),
+    Panel('epd13in3k', 960, 680, controller='ssd',
+          modes={'full': _mode('init', 'display_Base'),
+                 'partial': _mode('init_Part', 'display_Partial'),
+                 '4gray': _mode('init_4GRAY', 'display_4Gray')},
+          refresh_s={'full': 3.5, 'partial': 0.6, '4gray': 3.5}, partial_window='frame',
+          # display_Partial keeps only 9 bits of the window address
+          partial_max_xy=511,
+          transfers={'display': _SSD_BW, 'display_Base': _SSD_BASE}),
+]
+
+PANELS = {panel.name: panel for panel in _PANELS}
+
+DEFAULT_MODEL = "EPD_7in5_V2"
+
+def driver_name(model):
+    """Map a config model like 'EPD_7in5_V2' to its driver module name."""
+    return 'epd' + model[4:] if model.upper().startswith('EPD_') else model
+
+def get_panel(config=None):
+    """Look up the panel for config's waveshare.model."""
+    model = (config or {}).get('waveshare', {}).get('model', DEFAULT_MODEL)
+    name = driver_name(model)
+    if name not in PANELS:
+        raise KeyError(f"Unknown Waveshare model {model!r}")
+    return PANELS[name]
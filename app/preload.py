@@ -0,0 +1,48 @@
+"""Build the read-only state every worker needs once, in the gunicorn master.
+
+gunicorn_config.when_ready() calls warm() after the app is preloaded and
+before any worker is forked. Forked workers then share these pages with
+the master copy-on-write instead of each building its own copy on the
+first job:
+
+    panel registry    app.panels, plus the modules conversion imports
+    dither LUTs       palette.lab_lut() for the configured panel
+    quantizers        the Lab palette image palette.quantize() matches against
+    photo index       PhotoIndex.history(), reused until index.db changes
+
+Driver modules are left to the workers: importing one opens SPI and GPIO
+handles, which must not be shared across a fork.
+
+Finally gc.freeze() moves everything allocated so far into the permanent
+generation. Without it the first collection in each worker touches the
+header of every object and un-shares the pages they live on.
+"""
+import gc
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+def warm(config, index=None):
+    """Build shared state for config (and index, if given), then freeze it.
+
+    Returns a summary of what was built for logging.
+    """
+    started = time.monotonic()
+    from . import palette, waveshare_utils, crop, decode, layout  # noqa: F401
+    from .panels import get_panel
+    panel = get_panel(config)
+    if panel.palette != 'bw':
+        palette.prepare(panel.palette)
+    if config.get('display', {}).get('fit') == 'smart' and crop.cv2 is not None:
+        crop._face_detector()
+    photos = len(index.history()) if index is not None else 0
+    gc.collect()
+    gc.freeze()
+    return {
+        'panel': panel.name,
+        'palette': panel.palette,
+        'photos': photos,
+        'frozen': gc.get_freeze_count(),
+        'seconds': round(time.monotonic() - started, 3),
+    }
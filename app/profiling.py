@@ -0,0 +1,103 @@
+"""Opt-in cProfile captures of web requests and display jobs.
+
+Turn on with [profiling] enabled = true in config.toml or EINK_PROFILE=1.
+Every request to the main blueprint and every convert or display job then
+writes a pstats file to photos/profiles/, keeping the newest `keep`:
+
+    python -m pstats photos/profiles/20250101-120000-123_display_cat.jpg.prof
+    snakeviz photos/profiles/...prof        # or flameprof for a flamegraph
+
+GET /profiles lists them and GET /profiles/<name> downloads one.
+"""
+import cProfile
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'enabled': False,
+    'directory': 'photos/profiles',
+    'keep': 50,
+}
+
+SUFFIX = '.prof'
+
+settings = dict(DEFAULTS)
+
+# Only one profiler can be active at a time (on Python 3.12+ the hook is
+# process-wide); a job or request starting while another is profiled is
+# not profiled. cProfile only sees the thread that started it, so routes
+# that wait on a pool job leave profiling to the job, see routes.py
+_active = threading.Lock()
+
+def configure(config):
+    settings.update(DEFAULTS)
+    settings.update((config or {}).get('profiling', {}))
+    if os.getenv('EINK_PROFILE'):
+        settings['enabled'] = os.getenv('EINK_PROFILE').lower() in ('1', 'true', 'yes')
+
+def enabled():
+    return settings['enabled']
+
+def directory():
+    return Path(settings['directory'])
+
+def _filename(kind, label):
+    label = re.sub(r'[^A-Za-z0-9._-]+', '_', label)[:80]
+    stamp = time.strftime('%Y%m%d-%H%M%S') + f"-{int(time.time() * 1000) % 1000:03d}"
+    return f"{stamp}_{kind}_{label}{SUFFIX}"
+
+def start():
+    """A running profiler, or None when profiling is off or already busy."""
+    if not enabled() or not _active.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another tool (a debugger, coverage) already holds the profiling hook
+        _active.release()
+        return None
+    return profiler
+
+def stop(profiler, kind, label):
+    """Save what profiler captured and rotate old profiles out."""
+    profiler.disable()
+    _active.release()
+    try:
+        path = directory()
+        path.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(path / _filename(kind, label))
+        _rotate(path)
+    except OSError as e:
+        logger.error(f"Could not save profile: {e}")
+
+def _rotate(path):
+    profiles = sorted(path.glob(f"*{SUFFIX}"), key=lambda p: p.name, reverse=True)
+    for old in profiles[settings['keep']:]:
+        old.unlink(missing_ok=True)
+
+@contextmanager
+def profile(kind, label):
+    """Profile the enclosed job when profiling is on."""
+    profiler = start()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            stop(profiler, kind, label)
+
+def list_profiles():
+    """Saved profiles, newest first."""
+    try:
+        files = sorted(directory().glob(f"*{SUFFIX}"), key=lambda p: p.name, reverse=True)
+        return [{'name': p.name, 'size': p.stat().st_size, 'created': p.stat().st_mtime} for p in files]
+    except OSError as e:
+        logger.error(f"Could not list profiles: {e}")
+        return []
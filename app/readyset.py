@@ -0,0 +1,160 @@
+"""Keep the photos most likely to be shown next rendered ahead of time.
+
+The ready set is, most wanted first:
+
+    next     the slideshow's next picks, photos queued for display first
+    visible  photos on screen in an open gallery, as the page reports them
+             with POST /photos/visible
+    recent   the newest uploads
+
+cut off where their rendered files (a display BMP and, for fast-path
+panels, a raw framebuffer each) would go over [ready] budget_mb. Members
+without an up-to-date display version are rendered on the prefetch pool,
+which runs niced and makes way for refreshes and requests, so a manual
+Display or a scheduled swap only has to push the frame. Frames of members
+are then hinted into the page cache, and the storage quota evicts them
+only after every other rendered file.
+
+The slideshow and the galleries may be served by different gunicorn
+workers, so their reports go to small files in photos/display that any
+worker reads.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from . import executors
+from . import scheduler
+from .framebuffer import raw_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'next': 3,
+    'visible': 6,
+    'recent': 3,
+    'budget_mb': 16,
+}
+
+# Seconds a gallery's report counts for; open pages report again well before
+VISIBLE_TTL = 120
+
+class ReadySet:
+    def __init__(self, controller, config):
+        self.controller = controller
+        settings = {**DEFAULTS, **(config or {}).get('ready', {})}
+        self.next = int(settings['next'])
+        self.visible_limit = int(settings['visible'])
+        self.recent = int(settings['recent'])
+        self.budget = int(float(settings['budget_mb']) * 2**20)
+        self.next_path = controller.display_dir / ".ready_next.json"
+        self.visible_path = controller.display_dir / ".ready_visible.json"
+        self._fill_pending = threading.Event()
+
+    def _write(self, path, photos):
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            tmp.write_text(json.dumps({'at': time.time(), 'photos': list(photos)}))
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.error(f"Could not save {path.name}: {e}")
+
+    def _read(self, path, ttl=None):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return []
+        if ttl is not None and time.time() - data.get('at', 0) > ttl:
+            return []
+        return [name for name in data.get('photos', []) if isinstance(name, str)]
+
+    def set_next(self, photos):
+        """Record the slideshow's next picks and fill the set."""
+        self._write(self.next_path, photos[:self.next])
+        self.schedule_fill()
+
+    def report_visible(self, photos):
+        """Record the photos a gallery has on screen and fill the set."""
+        self._write(self.visible_path, photos[:self.visible_limit])
+        self.schedule_fill()
+
+    def _display_path(self, filename):
+        return self.controller.display_dir / f"{Path(filename).stem}.bmp"
+
+    def _frame_paths(self, filename):
+        display_path = self._display_path(filename)
+        return (display_path, raw_path(display_path)) if self.controller.panel.fast_path else (display_path,)
+
+    def _estimate(self):
+        # What one photo's rendered files take, for photos not rendered yet
+        panel = self.controller.panel
+        bmp = panel.width * panel.height * (1 if panel.palette == 'bw' else 8) // 8
+        return bmp + (panel.plane_size * panel.planes if panel.fast_path else 0)
+
+    def _cost(self, filename, estimate):
+        try:
+            return sum(path.stat().st_size for path in self._frame_paths(filename))
+        except OSError:
+            return estimate
+
+    def members(self):
+        """Filenames in the ready set, most wanted first."""
+        originals = self.controller.originals_dir
+        available = {p['filename'] for p in self.controller.get_available_photos()}
+
+        def mtime(name):
+            try:
+                return (originals / name).stat().st_mtime
+            except OSError:
+                return 0
+
+        recent = sorted(available, key=mtime, reverse=True)[:self.recent]
+        candidates = self._read(self.next_path) + self._read(self.visible_path, VISIBLE_TTL) + recent
+        members, spent, estimate = [], 0, self._estimate()
+        for name in dict.fromkeys(candidates):
+            if name not in available:
+                continue
+            spent += self._cost(name, estimate)
+            if spent > self.budget:
+                break
+            members.append(name)
+        return members
+
+    def _warm(self, filename):
+        # Read the frame into the page cache now, so showing it streams from memory
+        path = self._frame_paths(filename)[-1]
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except (AttributeError, OSError):
+            pass
+        finally:
+            os.close(fd)
+
+    def fill(self):
+        """Render members without an up-to-date display version; returns how many were rendered."""
+        self._fill_pending.clear()
+        rendered = 0
+        history = self.controller.index.history()
+        for name in self.members():
+            if not self.controller.is_current(name, history.get(name, {})):
+                scheduler.checkpoint()
+                if not self.controller.convert_photo(name):
+                    continue
+                rendered += 1
+            self._warm(name)
+        if rendered:
+            logger.info(f"Rendered {rendered} photos ahead of time")
+            self.controller.storage.schedule_enforce()
+        return rendered
+
+    def schedule_fill(self):
+        """Fill the set in the background, once however often it is asked for."""
+        if not self._fill_pending.is_set():
+            self._fill_pending.set()
+            executors.submit('prefetch', self.fill)
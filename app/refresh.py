@@ -0,0 +1,101 @@
+import json
+import logging
+from pathlib import Path
+from .framebuffer import FrameState, changed_regions, region_area
+
+logger = logging.getLogger(__name__)
+
+# Fallbacks for the [refresh] table in config.toml. 'manual' and 'scheduled'
+# name the fastest waveform a job of that kind may use; the policy falls
+# back to slower ones when the panel or the ghosting budget rules it out.
+DEFAULTS = {
+    'manual': 'partial',
+    'scheduled': 'full',
+    'partial_limit': 5,
+    'partial_max_area': 0.25,
+    'fast_limit': 5,
+}
+
+# Waveforms from fastest to slowest
+MODES = ('partial', 'fast', 'full')
+
+# Weight of the newest sample in the running latency average
+_LATENCY_SMOOTHING = 0.2
+
+class RefreshPolicy:
+    """Decide which waveform each display job uses and track how long they take."""
+
+    def __init__(self, config, directory):
+        self.settings = {**DEFAULTS, **(config or {}).get('refresh', {})}
+        self.frames = FrameState(directory)
+        self.latency_path = Path(directory) / ".refresh_latency.json"
+
+    def choose(self, panel, frame, last_frame, counts, reason='manual'):
+        """Pick a refresh mode for moving the panel from last_frame to frame.
+
+        Returns ('none', []) when nothing changed, ('partial', regions) for a
+        windowed partial update, or ('fast', None) / ('full', None).
+        """
+        regions = None
+        if last_frame is not None and len(last_frame) == len(frame):
+            if last_frame == frame:
+                return 'none', []
+            # Only windowed partials need to know where the frames differ
+            if self._partial_capable(panel):
+                regions = changed_regions(last_frame, frame, panel.row_bytes)
+
+        preferred = self.settings.get(reason, 'full')
+        allowed = MODES[MODES.index(preferred):] if preferred in MODES else ('full',)
+
+        if 'partial' in allowed and regions and self._partial_ok(panel, regions, counts):
+            return 'partial', regions
+        if 'fast' in allowed and panel.supports('fast'):
+            if counts.get('fast', 0) < self.settings['fast_limit']:
+                return 'fast', None
+            logger.info(f"{counts['fast']} fast refreshes since last full, forcing full refresh")
+        return 'full', None
+
+    @staticmethod
+    def _partial_capable(panel):
+        return panel.supports('partial') and panel.layout == 'mono'
+
+    def _partial_ok(self, panel, regions, counts):
+        if not self._partial_capable(panel):
+            return False
+        if counts.get('partial', 0) >= self.settings['partial_limit']:
+            logger.info(f"{counts['partial']} partial refreshes since last full, forcing full refresh")
+            return False
+        limit = panel.partial_max_xy
+        if limit is not None and any(max(x1, y1) - 1 > limit for _, _, x1, y1 in regions):
+            logger.info("Changed region is beyond the partial window's reach, not using partial")
+            return False
+        return region_area(regions) <= self.settings['partial_max_area'] * panel.width * panel.height
+
+    @staticmethod
+    def next_counts(counts, mode):
+        """Refresh counts after a refresh in mode; a full refresh resets them."""
+        if mode == 'full':
+            return {}
+        return {**counts, mode: counts.get(mode, 0) + 1}
+
+    def record(self, mode, seconds):
+        """Fold a measured refresh time into the per-mode latency stats."""
+        stats = self.latencies()
+        entry = stats.get(mode)
+        if entry is None:
+            entry = {'count': 0, 'mean_s': seconds}
+        entry['count'] += 1
+        entry['last_s'] = round(seconds, 3)
+        entry['mean_s'] = round(entry['mean_s'] + _LATENCY_SMOOTHING * (seconds - entry['mean_s']), 3)
+        stats[mode] = entry
+        try:
+            self.latency_path.write_text(json.dumps(stats))
+        except OSError as e:
+            logger.error(f"Could not save refresh latency: {e}")
+        logger.info(f"{mode} refresh took {seconds:.2f}s")
+
+    def latencies(self):
+        try:
+            return json.loads(self.latency_path.read_text())
+        except (OSError, ValueError):
+            return {}
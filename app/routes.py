@@ -1,7 +1,15 @@
-from flask import Blueprint, request, jsonify, render_template, send_from_directory, current_app
+from flask import Blueprint, Response, g, request, jsonify, render_template, send_from_directory, current_app
 from pathlib import Path
+from urllib.parse import quote
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
 import logging
+import mimetypes
 import os
+from . import metrics
+from . import profiling
+from . import scheduler
+from .convert import ConvertJob
 
 logger = logging.getLogger(__name__)
 main = Blueprint('main', __name__)
@@ -9,6 +17,65 @@ main = Blueprint('main', __name__)
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'heif', 'heic', 'bmp', 'pdf'}
 BASE_DIR = Path(__file__).resolve().parent.parent
 UPLOAD_FOLDER = BASE_DIR / 'photos' / 'originals'
+PHOTOS_ROOT = BASE_DIR / 'photos'
+# nginx's internal location for PHOTOS_ROOT, see config/nginx.conf
+ACCEL_LOCATION = '/_accel/photos/'
+# Routes that wait on a pool job; the job is profiled in its own thread,
+# where the work happens, instead of the request that only waits for it
+POOLED_ENDPOINTS = {'main.display_photo', 'main.convert_photo'}
+
+@main.before_request
+def mark_in_flight():
+    # Prefetch and maintenance work pauses while a request is being served
+    scheduler.begin('convert')
+    g.in_flight = True
+
+@main.teardown_request
+def unmark_in_flight(exc=None):
+    if g.pop('in_flight', False):
+        scheduler.end('convert')
+
+@main.before_request
+def start_profile():
+    if not request.path.startswith('/profiles') and request.endpoint not in POOLED_ENDPOINTS:
+        g.profiler = profiling.start()
+
+@main.teardown_request
+def save_profile(exc=None):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiling.stop(profiler, 'request', f"{request.method} {request.path}")
+
+@main.app_url_defaults
+def version_static(endpoint, values):
+    # nginx caches /static/ for a year, so a changed file needs a new URL
+    if endpoint == 'static' and 'filename' in values:
+        try:
+            values['v'] = int(os.stat(os.path.join(current_app.static_folder, values['filename'])).st_mtime)
+        except OSError:
+            pass
+
+def send_photos_file(directory, filename, as_attachment=False):
+    """send_from_directory(), with nginx doing the transfer when it is in front.
+
+    nginx adds X-Sendfile-Type: X-Accel-Redirect to proxied requests. The app
+    then only looks the file up and answers with X-Accel-Redirect, and nginx
+    streams the file itself with sendfile.
+    """
+    if request.headers.get('X-Sendfile-Type') != 'X-Accel-Redirect':
+        return send_from_directory(directory, filename, as_attachment=as_attachment)
+    path = safe_join(str(Path(directory).resolve()), filename)
+    if path is None or not os.path.isfile(path):
+        raise NotFound()
+    try:
+        relative = Path(path).relative_to(PHOTOS_ROOT.resolve())
+    except ValueError:
+        return send_from_directory(directory, filename, as_attachment=as_attachment)
+    response = Response(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+    response.headers['X-Accel-Redirect'] = ACCEL_LOCATION + quote(relative.as_posix())
+    if as_attachment:
+        response.headers.set('Content-Disposition', 'attachment', filename=relative.name)
+    return response
 
 def allowed_file(filename):
     return '.' in filename and \
@@ -33,25 +100,30 @@ def upload_file():
         logger.error(f"Invalid file type for file {file.filename}")
         return jsonify({"error": "Invalid file extension"}), 400
 
-    try:
-        save_path = Path(UPLOAD_FOLDER) / file.filename
-        file.save(save_path)
-    except Exception as e:
-        logger.error(f'Error saving file: {e}')
+    if Path(file.filename).name != file.filename:
+        logger.error(f"Invalid file name {file.filename}")
+        return jsonify({'error': 'Invalid file name'}), 400
+
+    kept = current_app.display_controller.ingest(file.filename, file.stream)
+    if kept is None:
         return jsonify({'error': 'Error saving file'}), 500
+    if kept != file.filename:
+        return jsonify({'message': f'Already in the library as {kept}', 'duplicate_of': kept}), 200
 
-    logger.info(f'Saved file: {save_path}')
+    logger.info(f'Saved file: {file.filename}')
     return jsonify({'message': 'File uploaded successfully'}), 200
 
 @main.route('/photos/list')
 def list_photos():
     try:
         available_photos = current_app.display_controller.get_available_photos()
+        history = current_app.display_controller.index.history()
         photos = []
         for photo in available_photos:
             photos.append({
                 'filename': photo['filename'],
-                'path': f'/photos/originals/{photo["filename"]}'
+                'path': f'/photos/originals/{photo["filename"]}',
+                'duplicate_of': history.get(photo['filename'], {}).get('duplicate_of'),
             })
         logger.info(f'Loaded {len(photos)} photos')
         return jsonify(photos)
@@ -59,17 +131,33 @@ def list_photos():
         logger.error(f'Error loading files: {e}')
         return jsonify({'error': 'Error listing files'}), 400
 
+@main.route('/photos/duplicates')
+def list_duplicates():
+    """Near-duplicate groups: each photo with the photos that look like it."""
+    controller = current_app.display_controller
+    available = {p['filename'] for p in controller.get_available_photos()}
+    groups = {}
+    for filename, row in controller.index.history().items():
+        if filename in available and row.get('duplicate_of') in available:
+            groups.setdefault(row['duplicate_of'], []).append(filename)
+    return jsonify({name: sorted(names) for name, names in sorted(groups.items())}), 200
+
+@main.route('/photos/visible', methods=['POST'])
+def report_visible():
+    """The gallery's photos on screen, rendered ahead in case one is displayed."""
+    data = request.get_json(silent=True) or {}
+    photos = data.get('photos')
+    if not isinstance(photos, list) or not all(isinstance(name, str) for name in photos):
+        return jsonify({'error': 'Expected a list of filenames under photos'}), 400
+    ready = current_app.display_controller.ready
+    ready.report_visible(photos)
+    return jsonify({'ready': ready.members()}), 200
+
 @main.route('/photos/delete/<filename>', methods=['DELETE'])
 def delete_photo(filename):
     try:
-        file_path = UPLOAD_FOLDER / filename
-        if file_path.exists():
-            file_path.unlink()
-            # Also clean up corresponding display file if it exists
-            display_path = Path('photos/display') / f"{file_path.stem}.bmp"
-            if display_path.exists():
-                display_path.unlink()
-                logger.info(f'Deleted converted file: {display_path}')
+        delta = current_app.display_controller.apply_bulk(delete=[filename])
+        if delta['deleted']:
             logger.info(f'Deleted file {filename}')
             return jsonify({'message': f'Deleted {filename}'}), 200
         logger.error(f'Error deleting {filename}: file not found')
@@ -78,16 +166,74 @@ def delete_photo(filename):
         logger.error(f'Error deleteing {filename}: {e}')
         return jsonify({'error': 'Error deleting file'}), 500
 
+@main.route('/photos/bulk', methods=['POST'])
+def bulk_photos():
+    data = request.get_json(silent=True) or {}
+    actions = {action: data.get(action, []) for action in ('delete', 'convert', 'display')}
+    if not any(actions.values()) or not all(
+            isinstance(names, list) and all(isinstance(name, str) for name in names)
+            for names in actions.values()):
+        return jsonify({'error': 'Expected lists of filenames under delete, convert or display'}), 400
+    try:
+        return jsonify(current_app.display_controller.apply_bulk(**actions)), 200
+    except Exception as e:
+        logger.error(f'Error applying bulk operation: {e}')
+        return jsonify({'error': 'Error applying bulk operation'}), 500
+
 @main.route('/photos/originals/<filename>')
 def serve_photo(filename):
     if not allowed_file(filename):
         return jsonify({'error': 'Invalid file type'}), 400
     try:
-        return send_from_directory(UPLOAD_FOLDER, filename)
+        return send_photos_file(UPLOAD_FOLDER, filename)
     except Exception as e:
         logger.error(f'Error serving file {filename}: {e}')
         return jsonify({'error': 'Error serving file'}), 500
 
+@main.route('/photos/export')
+def export_photos():
+    from .archive import library_zip
+    try:
+        archive = library_zip(current_app.display_controller)
+    except OSError as e:
+        logger.error(f'Error preparing export: {e}')
+        return jsonify({'error': 'Error preparing export'}), 500
+
+    start, stop, status = 0, archive.size, 200
+    if_range = request.headers.get('If-Range')
+    if request.range is not None and (if_range is None or if_range.strip('"') == archive.etag):
+        span = request.range.range_for_length(archive.size)
+        if span is None:
+            return Response(status=416, headers={'Content-Range': f'bytes */{archive.size}'})
+        (start, stop), status = span, 206
+
+    response = Response(archive.iter_range(start, stop), status=status,
+                        mimetype='application/zip', direct_passthrough=True)
+    response.headers['Content-Length'] = str(stop - start)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['ETag'] = f'"{archive.etag}"'
+    response.headers.set('Content-Disposition', 'attachment', filename='eink-photos.zip')
+    # Stream straight through nginx rather than spooling to its temp files
+    response.headers['X-Accel-Buffering'] = 'no'
+    if status == 206:
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{archive.size}'
+    return response
+
+@main.route('/photos/import', methods=['POST'])
+def import_photos():
+    import zipfile
+    from .archive import import_zip
+    upload = request.files.get('file')
+    try:
+        result = import_zip(current_app.display_controller,
+                            upload.stream if upload else request.stream, allowed_file)
+    except zipfile.BadZipFile:
+        return jsonify({'error': 'Not a zip file'}), 400
+    except Exception as e:
+        logger.error(f'Error importing photos: {e}')
+        return jsonify({'error': 'Error importing photos'}), 500
+    return jsonify(result), 200
+
 @main.route('/photos/status')
 def photos_status():
     status = current_app.display_controller.get_status()
@@ -98,7 +244,7 @@ def photos_status():
 @main.route('/photos/display/<filename>', methods=['POST'])
 def display_photo(filename):
     try:
-        if current_app.display_controller.display_photo(filename):
+        if current_app.display_controller.submit_display(filename).result():
             return jsonify({'message': f'Displaying {filename}'}), 200
         return jsonify({'error': 'Failed to display photo'}), 500
     except Exception as e:
@@ -108,10 +254,64 @@ def display_photo(filename):
 @main.route('/photos/convert/<filename>', methods=['POST'])
 def convert_photo(filename):
     try:
-        if current_app.display_controller.convert_photo(filename):
+        if current_app.display_controller.submit_convert(filename).result():
             return jsonify({'message': f'Converted {filename}'}), 200
         return jsonify({'error': 'Failed to convert photo'}), 500
     except Exception as e:
         logger.error(f'Error converting photo {filename}: {e}')
         return jsonify({'error': 'Error converting photo'}), 500
-    
+
+@main.route('/photos/convert-all', methods=['POST'])
+def convert_all():
+    data = request.get_json(silent=True) or {}
+    try:
+        job = ConvertJob(current_app.display_controller, force=bool(data.get('force')))
+        if not job.start():
+            return jsonify({'error': 'A conversion job is already running', 'status': job.status()}), 409
+        return jsonify({'message': 'Conversion started'}), 202
+    except Exception as e:
+        logger.error(f'Error starting conversion job: {e}')
+        return jsonify({'error': 'Error starting conversion job'}), 500
+
+@main.route('/photos/convert-all')
+def convert_all_status():
+    return jsonify(ConvertJob(current_app.display_controller).status()), 200
+
+@main.route('/metrics')
+def metrics_text():
+    job = ConvertJob(current_app.display_controller).status()
+    waiting = job.get('total', 0) - job.get('converted', 0) - job.get('failed', 0) if job.get('running') else 0
+    body = metrics.render(extra_gauges={'eink_queue_depth|queue=convert': waiting})
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+@main.route('/profiles')
+def list_profiles():
+    return jsonify({'enabled': profiling.enabled(), 'profiles': profiling.list_profiles()}), 200
+
+@main.route('/profiles/<name>')
+def download_profile(name):
+    if not name.endswith(profiling.SUFFIX):
+        return jsonify({'error': 'Not a profile'}), 400
+    try:
+        return send_photos_file(profiling.directory().resolve(), name, as_attachment=True)
+    except Exception as e:
+        logger.error(f'Error serving profile {name}: {e}')
+        return jsonify({'error': 'Profile not found'}), 404
+
+@main.route('/photos/weight/<filename>', methods=['POST'])
+def set_photo_weight(filename):
+    data = request.get_json(silent=True) or {}
+    try:
+        weight = float(data['weight'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Expected a numeric weight'}), 400
+    if weight < 0:
+        return jsonify({'error': 'Weight cannot be negative'}), 400
+    if not (UPLOAD_FOLDER / filename).exists():
+        return jsonify({'error': 'File not found'}), 404
+    try:
+        current_app.display_controller.index.set_weight(filename, weight)
+        return jsonify({'message': f'Set weight of {filename} to {weight}'}), 200
+    except Exception as e:
+        logger.error(f'Error setting weight for {filename}: {e}')
+        return jsonify({'error': 'Error setting weight'}), 500
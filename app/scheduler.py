@@ -0,0 +1,193 @@
+"""Priority classes for work sharing the Pi's one core and SD card.
+
+Highest first:
+
+    display      a refresh being transferred to the panel
+    convert      work somebody is waiting for: requests in flight and
+                 conversions they started
+    prefetch     rendering ahead, for the slideshow, the display queue and
+                 whole-library convert jobs
+    maintenance  housekeeping nobody is waiting on
+
+Threads and processes doing prefetch or maintenance work run with their
+niceness raised and their I/O priority lowered (NICE, IOPRIO). Work calls
+checkpoint() between steps; while work of a higher class is in progress
+in any process, checkpoint() waits, for at most MAX_PAUSE seconds.
+
+Activity is shared between gunicorn workers, the slideshow and convert
+pool processes through flock: activity(name) holds a shared lock on
+photos/display/.activity/<name>.lock, and busy(name) notices it by failing
+to take that lock exclusively.
+"""
+import ctypes
+import fcntl
+import logging
+import os
+import platform
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+CLASSES = ('display', 'convert', 'prefetch', 'maintenance')
+
+# Added to the niceness of threads doing work of the class
+NICE = {
+    'prefetch': 5,
+    'maintenance': 10,
+}
+
+# (class, level) for ioprio_set: 2 is best effort, level 7 its lowest;
+# 3 is idle, only served when nobody else wants the disk
+IOPRIO = {
+    'prefetch': (2, 7),
+    'maintenance': (3, 0),
+}
+
+# The ioprio_set syscall has no wrapper in Python or glibc
+_IOPRIO_SET = {'x86_64': 251, 'i386': 289, 'i686': 289, 'armv6l': 314, 'armv7l': 314, 'aarch64': 30}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_SHIFT = 13
+
+# Longest checkpoint() waits before going on anyway, in seconds
+MAX_PAUSE = 30
+POLL = 0.05
+
+_local = threading.local()
+_lock = threading.Lock()
+# name -> [count, lock file] for activity held by this process
+_held = {}
+_directory = None
+
+def configure(directory):
+    """Share activity through lock files under directory/.activity."""
+    global _directory
+    path = Path(directory) / ".activity"
+    path.mkdir(parents=True, exist_ok=True)
+    _directory = path
+
+def _set_ioprio(io_class, level):
+    number = _IOPRIO_SET.get(platform.machine())
+    if number is None:
+        return
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.syscall(number, _IOPRIO_WHO_PROCESS, threading.get_native_id(),
+                     (io_class << _IOPRIO_CLASS_SHIFT) | level)
+    except (OSError, AttributeError):
+        pass
+
+def set_class(name):
+    """Make the calling thread do work of class name from now on.
+
+    On Linux niceness and I/O priority belong to each thread, addressed by
+    its thread id. They can only be lowered, so this is for pool threads
+    and worker processes that keep one class for life.
+    """
+    _local.name = name
+    try:
+        tid = threading.get_native_id()
+        if name in NICE:
+            os.setpriority(os.PRIO_PROCESS, tid, os.getpriority(os.PRIO_PROCESS, tid) + NICE[name])
+    except (AttributeError, OSError):
+        pass
+    if name in IOPRIO:
+        _set_ioprio(*IOPRIO[name])
+
+def current():
+    """The calling thread's class, or None for threads that never wait."""
+    return getattr(_local, 'name', None)
+
+def begin(name):
+    """Mark work of class name as in progress; pair with end()."""
+    with _lock:
+        entry = _held.get(name)
+        if entry is None:
+            entry = _held[name] = [0, None]
+            if _directory is not None:
+                try:
+                    lock_file = open(_directory / f"{name}.lock", 'a')
+                    fcntl.flock(lock_file, fcntl.LOCK_SH)
+                    entry[1] = lock_file
+                except OSError as e:
+                    logger.error(f"Could not mark {name} work in progress: {e}")
+        entry[0] += 1
+
+def end(name):
+    with _lock:
+        entry = _held.get(name)
+        if entry is None:
+            return
+        entry[0] -= 1
+        if entry[0] <= 0:
+            del _held[name]
+            if entry[1] is not None:
+                entry[1].close()
+
+@contextmanager
+def activity(name):
+    begin(name)
+    try:
+        yield
+    finally:
+        end(name)
+
+def busy(name):
+    """Whether work of class name is in progress in any process."""
+    with _lock:
+        if name in _held:
+            return True
+    if _directory is None:
+        return False
+    try:
+        with open(_directory / f"{name}.lock", 'a') as probe:
+            try:
+                fcntl.flock(probe, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            return False
+    except OSError:
+        return False
+
+def run(name, fn, *args, **kwargs):
+    """Call fn as work of class name, marked in progress while it runs."""
+    if name == 'display':
+        # Marked only while frames are transferred, see waveshare_utils; the
+        # BUSY wait after a transfer leaves the CPU and the card alone
+        return fn(*args, **kwargs)
+    with activity(name):
+        return fn(*args, **kwargs)
+
+def checkpoint():
+    """Wait while work of a higher class than the calling thread's is in progress.
+
+    Returns the seconds spent waiting.
+    """
+    name = current()
+    if name not in CLASSES:
+        return 0.0
+    higher = CLASSES[:CLASSES.index(name)]
+    started = time.monotonic()
+    while any(busy(other) for other in higher):
+        if time.monotonic() - started >= MAX_PAUSE:
+            logger.warning(f"Resuming {name} work after waiting {MAX_PAUSE}s for higher priority work")
+            break
+        time.sleep(POLL)
+    paused = time.monotonic() - started
+    if paused >= POLL:
+        metrics.observe('paused', paused)
+    return paused
+
+def _forget():
+    # Lock files inherited from the parent are its activity, not ours
+    global _lock
+    _lock = threading.Lock()
+    for _, lock_file in _held.values():
+        if lock_file is not None:
+            lock_file.close()
+    _held.clear()
+
+os.register_at_fork(after_in_child=_forget)
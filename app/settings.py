@@ -0,0 +1,104 @@
+"""config/config.toml, parsed once per process.
+
+gunicorn_config.py, create_app() and the convert CLI all go through
+load_settings(), so under gunicorn with preload_app the file is read once
+in the master and the workers inherit the result. runserver.sh gets the
+server address from here too:
+
+    eval "$(python3 -m app.settings --shell)"
+
+This module is imported before anything else starts, so it must stay
+cheap: no Flask, Pillow or driver imports.
+"""
+import hashlib
+import json
+import sys
+from functools import lru_cache
+from pathlib import Path
+import tomli
+from .panels import get_panel
+
+CONFIG_PATH = Path("config/config.toml")
+
+GUNICORN_DEFAULTS = {
+    'workers': 2,
+    'worker_class': 'gthread',
+    'threads': 8,
+    'timeout': 30,
+    'preload': True,
+}
+
+WORKER_CLASSES = ('sync', 'gthread')
+
+class Settings:
+    """The settings the server itself needs, checked and typed.
+
+    Everything else reads its own table from config, the parsed file as a
+    dict, which is what create_app() puts in app.config.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        server = config.get('server', {})
+        try:
+            self.host = str(server['host'])
+            self.port = int(server['port'])
+        except KeyError as e:
+            raise ValueError(f"Missing required configuration key: server.{e.args[0]}")
+        gunicorn = {**GUNICORN_DEFAULTS, **config.get('gunicorn', {})}
+        self.workers = int(gunicorn['workers'])
+        self.worker_class = str(gunicorn['worker_class'])
+        if self.worker_class not in WORKER_CLASSES:
+            raise ValueError(f"Unsupported gunicorn.worker_class {self.worker_class!r}, "
+                             f"expected one of {', '.join(WORKER_CLASSES)}")
+        self.threads = int(gunicorn['threads'])
+        self.timeout = int(gunicorn['timeout'])
+        self.preload = bool(gunicorn['preload'])
+
+    @property
+    def bind(self):
+        return f"{self.host}:{self.port}"
+
+    def shell(self):
+        """Export lines for runserver.sh."""
+        return '\n'.join([
+            f'export FLASK_HOST="{self.host}"',
+            f'export FLASK_PORT={self.port}',
+            'export CONFIG_LOADED=1',
+        ])
+
+@lru_cache(maxsize=None)
+def load_settings(path=CONFIG_PATH):
+    """Parse the config file; later calls in the same process reuse the result."""
+    with open(path, "rb") as f:
+        return Settings(tomli.load(f))
+
+def render_key(config=None):
+    """Short hash of every setting that changes what convert_for_display draws."""
+    config = config or {}
+    display = config.get('display', {})
+    settings = {
+        'model': get_panel(config).name,
+        'fit': display.get('fit', 'fit'),
+        'dither': display.get('dither', True),
+        'pair': display.get('pair', False),
+        'orientation': display.get('orientation'),
+        'rotation': config.get('waveshare', {}).get('rotation', 0),
+    }
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    try:
+        settings = load_settings()
+    except (OSError, ValueError, tomli.TOMLDecodeError) as e:
+        print(f'print_error "Error loading config: {e}"')
+        return 1
+    if '--shell' in argv:
+        print(settings.shell())
+    else:
+        print(json.dumps(settings.config, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,401 @@
+"""A software e-paper panel that stands in for epdconfig.
+
+With EINK_SIMULATOR=<directory> set, display jobs run the real driver code
+against this module instead of SPI and GPIO. It decodes the commands the
+driver sends into controller RAM, renders each refresh to a PNG, holds
+BUSY for the panel's documented refresh time on a virtual clock, and
+records a timeline of everything that happened:
+
+    photos/simulator/frame_0001_full.png
+    photos/simulator/latest.png
+    photos/simulator/timeline.json
+
+Two controller families cover the bundled drivers, as each Panel declares
+them: UC81xx style panels (BUSY active low, RAM at 0x10/0x13, refresh 0x12,
+partial window 0x90) and SSD16xx style panels (BUSY active high, RAM at
+0x24/0x26, windows 0x44/0x45, cursor 0x4E/0x4F, refresh 0x20).
+"""
+import json
+import logging
+import os
+import sys
+import types
+from pathlib import Path
+from PIL import Image
+from . import palette
+
+logger = logging.getLogger(__name__)
+
+EPDCONFIG = f"{__package__}.lib.waveshare_epd.epdconfig"
+
+RST_PIN, DC_PIN, CS_PIN, BUSY_PIN, PWR_PIN = 17, 25, 8, 24, 18
+
+# Busy time for operations other than a refresh, in ms
+_BUSY_MS = {'reset': 10, 'power_on': 100, 'power_off': 100, 'update': 10}
+
+# SSD16xx display update control (0x22) bits: drive the glass, using display mode 2
+_SSD_DISPLAY = 0x04
+_SSD_MODE_2 = 0x08
+
+# Status reads that drivers legitimately send while polling BUSY
+_STATUS_COMMANDS = {0x71}
+
+def enabled():
+    return bool(os.getenv('EINK_SIMULATOR'))
+
+def _to_bytes(data):
+    if isinstance(data, int):
+        return bytes([data & 0xFF])
+    try:
+        return bytes(data)
+    except ValueError:
+        # Drivers that invert with ~ hand over negative ints
+        return bytes(value & 0xFF for value in data)
+
+class SimulatedPanel:
+    """Controller state for one panel, driven through the epdconfig calls."""
+
+    def __init__(self, panel, directory=None):
+        self.panel = panel
+        self.directory = Path(directory) if directory else None
+        self.busy_level = panel.busy_level
+        self.family = panel.controller
+        self.now_ms = 0.0
+        self.busy_until = 0.0
+        self.busy_reason = None
+        self.timeline = []
+        # The waveform the current job initialised the driver with; the
+        # commands alone cannot tell a fast LUT from a full one
+        self.job_mode = 'full'
+        self.frames = 0
+        self.bytes_received = 0
+        self.glass = Image.new('RGB', panel.size, 'white')
+
+        self.dc = 0
+        self.command = None
+        self._logged = None
+        self.params = bytearray()
+        self.ram = {}
+        self.written = 0
+        self.full_ddx = None
+        self._power_on()
+
+    def _power_on(self):
+        # Register defaults, which a hardware reset brings back; RAM keeps its contents
+        self.update_mode = None
+        self.partial = False
+        self.ddx = None
+        self.entry_mode = 0x03
+        self._full_window()
+
+    def digital_write(self, pin, value):
+        if pin == DC_PIN:
+            self.dc = value
+        elif pin == RST_PIN and value == 0:
+            self._finish_command()
+            self._power_on()
+            self._event('reset')
+
+    def digital_read(self, pin):
+        if pin != BUSY_PIN:
+            return 0
+        # Each poll costs a little virtual time so loops without delays end
+        self.now_ms += 1
+        if self.now_ms < self.busy_until:
+            return self.busy_level
+        if self.busy_reason is not None:
+            self._event('busy_released', reason=self.busy_reason)
+            self.busy_reason = None
+        return 1 - self.busy_level
+
+    def delay_ms(self, ms):
+        self.now_ms += ms
+
+    def spi_writebyte(self, data):
+        data = _to_bytes(data)
+        self.bytes_received += len(data)
+        if self.dc == 0:
+            for code in data:
+                self._command(code)
+        else:
+            self._data(data)
+
+    spi_writebyte2 = DEV_SPI_write = spi_writebyte
+
+    def DEV_SPI_read(self):
+        return 0
+
+    def module_init(self, *args, **kwargs):
+        return 0
+
+    def module_exit(self, *args, **kwargs):
+        self._finish_command()
+        self._event('module_exit')
+        self.save_timeline()
+
+    def _event(self, kind, **details):
+        self.timeline.append({'t_ms': round(self.now_ms, 1), 'event': kind, **details})
+
+    def _set_busy(self, reason, ms):
+        self.busy_until = self.now_ms + ms
+        self.busy_reason = reason
+
+    def _full_window(self):
+        self.window = (0, 0, self.panel.row_bytes, self.panel.height)
+        self.cursor = (0, 0)
+
+    def _ram_commands(self):
+        return (0x10, 0x13) if self.family == 'uc' else (0x24, 0x26)
+
+    def _command(self, code):
+        self._finish_command()
+        if self.now_ms < self.busy_until and code not in _STATUS_COMMANDS:
+            self._event('violation', command=f"0x{code:02X}", busy=self.busy_reason,
+                        remaining_ms=round(self.busy_until - self.now_ms, 1))
+            logger.warning(f"Simulator: command 0x{code:02X} sent while busy ({self.busy_reason})")
+        self.command = code
+        self.params = bytearray()
+        self.written = 0
+        if code in self._ram_commands():
+            self.ram.setdefault(code, bytearray(b'\xff' * self.panel.row_bytes * self.panel.height))
+            if self.family == 'uc':
+                self.cursor = self.window[:2]
+            self._logged = {'t_ms': round(self.now_ms, 1), 'event': 'ram_write', 'command': f"0x{code:02X}",
+                            'window': list(self.window)}
+        else:
+            self._logged = {'t_ms': round(self.now_ms, 1), 'event': 'command', 'command': f"0x{code:02X}"}
+        # Status polls would drown out everything else
+        if code not in _STATUS_COMMANDS:
+            self.timeline.append(self._logged)
+        self._trigger(code)
+
+    def _trigger(self, code):
+        if self.family == 'uc':
+            if code == 0x12:
+                self._refresh('partial' if self.partial else self._waveform())
+            elif code == 0x04:
+                self._set_busy('power_on', _BUSY_MS['power_on'])
+            elif code == 0x02:
+                self._set_busy('power_off', _BUSY_MS['power_off'])
+            elif code == 0x91:
+                self.partial = True
+            elif code == 0x92:
+                self.partial = False
+                self._full_window()
+        else:
+            if code == 0x20:
+                if self.update_mode is None or self.update_mode & _SSD_DISPLAY:
+                    self._refresh('partial' if (self.update_mode or 0) & _SSD_MODE_2 else self._waveform())
+                else:
+                    # Clock, analog or LUT loading only; nothing changes on the glass
+                    self._set_busy('update', _BUSY_MS['update'])
+            elif code == 0x12:
+                self._set_busy('reset', _BUSY_MS['reset'])
+
+    def _waveform(self):
+        return self.job_mode if self.job_mode != 'partial' else 'full'
+
+    def _data(self, data):
+        if self.command in self._ram_commands():
+            self._write_ram(data)
+            self.written += len(data)
+        else:
+            self.params.extend(data)
+
+    def _finish_command(self):
+        code, params = self.command, self.params
+        if code is None:
+            return
+        if code in self._ram_commands():
+            self._logged['bytes'] = self.written
+        elif params:
+            self._logged['data'] = params[:16].hex()
+        self.command = None
+        if self.family == 'uc':
+            if code == 0x50 and params:
+                self.ddx = params[0] & 0x01
+            elif code == 0x90 and len(params) in (7, 9):
+                self._uc_window(params)
+            elif code == 0x07 and params[:1] == b'\xa5':
+                self._event('deep_sleep')
+        else:
+            if code == 0x44:
+                self._ssd_x_window(params)
+            elif code == 0x45 and len(params) >= 4:
+                y0, y1 = params[0] | params[1] << 8, params[2] | params[3] << 8
+                self.window = (self.window[0], min(y0, y1), self.window[2], max(y0, y1) + 1)
+            elif code == 0x4E and params:
+                x = params[0] if len(params) == 1 else (params[0] | params[1] << 8) // 8
+                self.cursor = (x, self.cursor[1])
+            elif code == 0x4F and len(params) >= 2:
+                self.cursor = (self.cursor[0], params[0] | params[1] << 8)
+            elif code == 0x11 and params:
+                self.entry_mode = params[0]
+            elif code == 0x22 and params:
+                self.update_mode = params[0]
+            elif code == 0x10 and params and params[0] & 0x03:
+                self._event('deep_sleep')
+
+    def _uc_window(self, params):
+        if len(params) == 9:
+            x0, x1, y0, y1 = (params[i] << 8 | params[i + 1] for i in range(0, 8, 2))
+        else:
+            x0, x1 = params[0], params[1]
+            y0, y1 = params[2] << 8 | params[3], params[4] << 8 | params[5]
+        self.window = (x0 // 8, y0, x1 // 8 + 1, y1 + 1)
+        self.cursor = (self.window[0], y0)
+
+    def _ssd_x_window(self, params):
+        if len(params) == 2:
+            x0, x1 = params[0], params[1] + 1
+        elif len(params) >= 4:
+            x0 = (params[0] | params[1] << 8) // 8
+            x1 = (params[2] | params[3] << 8) // 8 + 1
+        else:
+            return
+        self.window = (x0, self.window[1], x1, self.window[3])
+
+    def _write_ram(self, data):
+        """Copy data into RAM row by row from the cursor, inside the window."""
+        ram = self.ram[self.command]
+        row_bytes = self.panel.row_bytes
+        x0, y0, x1, y1 = self.window
+        if x1 <= x0 or y1 <= y0:
+            # Usually a driver masking off high address bits
+            self._logged['bad_window'] = True
+            return
+        x, y = self.cursor
+        if not x0 <= x < x1:
+            x = x0
+        step = 1 if self.family == 'uc' or self.entry_mode & 0x02 else -1
+        view = memoryview(data)
+        while view:
+            if not y0 <= y < y1:
+                if self.family == 'uc':
+                    # Drivers send a whole frame for small windows; the rest is dropped
+                    break
+                # The SSD16xx address counter wraps around inside the window
+                y = y0 if step > 0 else y1 - 1
+            count = min(len(view), x1 - x)
+            start = y * row_bytes + x
+            if start + count <= len(ram):
+                ram[start:start + count] = view[:count]
+            view = view[count:]
+            x += count
+            if x >= x1:
+                x, y = x0, y + step
+        self.cursor = (x, y)
+
+    def _plane_image(self, code, ink):
+        """A '1' image of a 1bpp RAM plane with ink pixels black."""
+        data = bytes(self.ram.get(code, b'\xff' * self.panel.row_bytes * self.panel.height))
+        if ink:
+            data = data.translate(bytes(0xFF - i for i in range(256)))
+        return Image.frombytes('1', self.panel.size, data)
+
+    def render(self):
+        """What the controller RAM would look like on the glass."""
+        panel = self.panel
+        first, second = self._ram_commands()
+        if panel.layout == 'mono':
+            code = second if self.family == 'uc' and second in self.ram else first
+            ink = 1 if panel.invert else 0
+            if self.family == 'uc' and self.partial and self.ddx != self.full_ddx:
+                ink ^= 1
+            return self._plane_image(code, ink).convert('RGB')
+        if panel.layout == 'black_red':
+            image = self._plane_image(first, 0).convert('RGB')
+            red = self._plane_image(second, 1).point(lambda v: 255 - v)
+            image.paste((255, 0, 0), mask=red.convert('L'))
+            return image
+        if panel.layout in ('2bpp', '4bpp'):
+            rawmode = 'P;4' if panel.layout == '4bpp' else 'P;2'
+            data = bytes(self.ram.get(0x10, b'\x11' * panel.plane_size))
+            image = Image.frombytes('P', panel.size, data, 'raw', rawmode)
+            colors = [255] * 768
+            for code, rgb in palette.PALETTES[panel.palette]:
+                colors[code * 3:code * 3 + 3] = rgb
+            image.putpalette(colors)
+            return image.convert('RGB')
+        return self.glass
+
+    def _refresh(self, mode):
+        seconds = self.panel.refresh_s.get(mode) or self.panel.refresh_s.get('full', 1.0)
+        area = None
+        partial = mode == 'partial' and self.window != (0, 0, self.panel.row_bytes, self.panel.height)
+        if partial:
+            x0, y0, x1, y1 = self.window
+            area = (x0 * 8, y0, min(x1 * 8, self.panel.width), min(y1, self.panel.height))
+        elif mode != 'partial':
+            self.full_ddx = self.ddx
+
+        rendered = self.render()
+        if area is None:
+            self.glass = rendered
+        elif area[2] > area[0] and area[3] > area[1]:
+            self.glass.paste(rendered.crop(area), area[:2])
+        self.frames += 1
+        self._event('refresh', mode=mode, busy_ms=seconds * 1000, area=list(area) if area else None)
+        self._set_busy(f"{mode} refresh", seconds * 1000)
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.glass.save(self.directory / f"frame_{self.frames:04d}_{mode}.png")
+            self.glass.save(self.directory / "latest.png")
+
+    def violations(self):
+        return [event for event in self.timeline if event['event'] == 'violation']
+
+    def save_timeline(self):
+        if self.directory is None:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            (self.directory / "timeline.json").write_text(json.dumps(self.timeline, indent=1))
+        except OSError as e:
+            logger.error(f"Could not save simulator timeline: {e}")
+
+_active = None
+
+def _forward(name):
+    def call(*args, **kwargs):
+        return getattr(_active, name)(*args, **kwargs)
+    return call
+
+def install(panel, directory=None, mode='full'):
+    """Make the driver modules talk to a SimulatedPanel for panel.
+
+    mode is the refresh the coming job will do. The simulator stays in
+    place for later jobs on the same panel, so partial refreshes land on
+    the glass left by earlier ones.
+    """
+    global _active
+    if directory is None:
+        directory = os.getenv('EINK_SIMULATOR') or None
+    if _active is None or _active.panel is not panel or _active.directory != (Path(directory) if directory else None):
+        _active = SimulatedPanel(panel, directory)
+    _active.job_mode = mode
+
+    module = sys.modules.get(EPDCONFIG)
+    if not getattr(module, 'SIMULATED', False):
+        module = _module()
+    # Drivers imported earlier hold on to whatever epdconfig they found
+    prefix = EPDCONFIG.rsplit('.', 1)[0] + '.'
+    for name, driver in list(sys.modules.items()):
+        if name.startswith(prefix) and hasattr(driver, 'epdconfig'):
+            driver.epdconfig = module
+    return _active
+
+def _module():
+    module = types.ModuleType(EPDCONFIG)
+    module.SIMULATED = True
+    module.RST_PIN, module.DC_PIN, module.CS_PIN, module.BUSY_PIN, module.PWR_PIN = \
+        RST_PIN, DC_PIN, CS_PIN, BUSY_PIN, PWR_PIN
+    for name in ('digital_write', 'digital_read', 'delay_ms', 'spi_writebyte', 'spi_writebyte2',
+                 'DEV_SPI_write', 'DEV_SPI_read', 'module_init', 'module_exit'):
+        setattr(module, name, _forward(name))
+    module.SPI = types.SimpleNamespace(writebytes2=_forward('spi_writebyte2'))
+    sys.modules[EPDCONFIG] = module
+    package = sys.modules.get(EPDCONFIG.rsplit('.', 1)[0])
+    if package is not None:
+        package.epdconfig = module
+    return module
@@ -0,0 +1,298 @@
+import fcntl
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from . import executors
+
+logger = logging.getLogger(__name__)
+
+ORDERS = ('shuffle', 'sequential', 'weighted', 'least_recent')
+
+_CRON_FIELDS = (
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day', 1, 31),
+    ('month', 1, 12),
+    ('weekday', 0, 6),
+)
+
+def _parse_cron_field(text, low, high):
+    values = set()
+    for part in text.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(v) for v in part.split('-'))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron value {part!r} out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+class CronSpec:
+    """A five-field cron expression: minute hour day month weekday.
+
+    Supports '*', lists, ranges and steps. Weekday 0 is Sunday.
+    """
+
+    def __init__(self, spec):
+        fields = spec.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron spec needs 5 fields, got {spec!r}")
+        self.spec = spec
+        self.minute, self.hour, self.day, self.month, self.weekday = (
+            _parse_cron_field(text, low, high) for text, (_, low, high) in zip(fields, _CRON_FIELDS))
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def _day_matches(self, t):
+        day_ok = t.day in self.day
+        weekday_ok = (t.isoweekday() % 7) in self.weekday
+        # Standard cron: if both are restricted, either one matching is enough
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, when):
+        """First matching datetime strictly after when."""
+        t = when.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 4)
+        while t < limit:
+            if t.month not in self.month:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hour:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minute:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Cron spec {self.spec!r} never matches")
+
+class Slideshow:
+    """Rotate the library on the panel on a timer.
+
+    Runs as a daemon thread inside the display service. Only one process
+    (whichever gunicorn worker takes photos/.slideshow.lock first) runs the
+    timer. While a photo is on screen the next pick is chosen and converted
+    ahead of time, so the scheduled swap only has to push the frame.
+    """
+
+    def __init__(self, controller, config):
+        self.controller = controller
+        settings = (config or {}).get('slideshow', {})
+        self.enabled = settings.get('enabled', False)
+        self.order = settings.get('order', 'shuffle')
+        if self.order not in ORDERS:
+            raise ValueError(f"Unknown slideshow order {self.order!r}")
+        self.cron = CronSpec(settings['cron']) if settings.get('cron') else None
+        hours = (config or {}).get('display', {}).get('refresh_hours', 12)
+        self.interval = timedelta(hours=hours)
+        self.prefetch = settings.get('prefetch', True)
+        self.skip_duplicates = settings.get('skip_near_duplicates', True)
+
+        self.next_photo = None
+        self.next_due = None
+        self._deck = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock_file = None
+        self._prefetch = None
+        # The timer runs in one worker; the others report its state from here
+        self.state_path = Path(controller.photos_dir) / ".slideshow.json"
+
+    def due_after(self, when):
+        if self.cron is not None:
+            return self.cron.next_after(when)
+        return when + self.interval
+
+    def pick(self, photos, history, current=None):
+        """Choose the next filename to show from photos."""
+        if not photos:
+            return None
+        candidates = [p for p in photos if p != current] or photos
+
+        if self.order == 'sequential':
+            ordered = sorted(photos)
+            if current in ordered:
+                return ordered[(ordered.index(current) + 1) % len(ordered)]
+            return ordered[0]
+
+        if self.order == 'least_recent':
+            return min(candidates, key=lambda p: (history.get(p, {}).get('last_shown') or 0, p))
+
+        if self.order == 'weighted':
+            weights = [max(history.get(p, {}).get('weight', 1.0), 0) for p in candidates]
+            if not any(weights):
+                return random.choice(candidates)
+            return random.choices(candidates, weights=weights)[0]
+
+        # Shuffle: walk a shuffled deck so every photo shows once per cycle
+        self._deck = [p for p in self._deck if p in candidates]
+        if not self._deck:
+            self._deck = list(candidates)
+            random.shuffle(self._deck)
+        return self._deck.pop()
+
+    def upcoming(self, count):
+        """Best guess at the next count photos to be shown, queued ones first."""
+        names = list(self.controller.index.queued())
+        if self.next_photo:
+            names.append(self.next_photo)
+        history = self.controller.index.history()
+        photos = self._photos(history)
+        if self.order == 'shuffle':
+            # The deck is dealt from the end
+            names.extend(reversed(self._deck))
+        elif self.order == 'sequential':
+            ordered = sorted(photos)
+            start = ordered.index(self.next_photo) + 1 if self.next_photo in ordered else 0
+            names.extend(ordered[start:] + ordered[:start])
+        elif self.order == 'least_recent':
+            names.extend(sorted(photos, key=lambda p: (history.get(p, {}).get('last_shown') or 0, p)))
+        else:
+            names.extend(sorted(photos, key=lambda p: -history.get(p, {}).get('weight', 1.0)))
+        return list(dict.fromkeys(names))[:count]
+
+    def _photos(self, history=None):
+        photos = [p['filename'] for p in self.controller.get_available_photos()]
+        if not self.skip_duplicates or history is None:
+            return photos
+        # A near duplicate is left out while the photo it resembles is around
+        available = set(photos)
+        return [p for p in photos if history.get(p, {}).get('duplicate_of') not in available]
+
+    def _choose_next(self, current):
+        # Photos queued with POST /photos/bulk go before the usual order
+        queued = self.controller.index.queued()
+        if queued:
+            self.next_photo = queued[0]
+        else:
+            history = self.controller.index.history()
+            self.next_photo = self.pick(self._photos(history), history, current)
+        if self.next_photo and self.prefetch:
+            # Pre-render while the current photo is on screen, niced and
+            # pausing for requests, on the prefetch pool
+            self._prefetch = executors.submit('prefetch', self.controller.prepare_photo, self.next_photo)
+            # The picks after it go to the ready set, rendered when there is time
+            self.controller.ready.set_next(self.upcoming(self.controller.ready.next))
+        self._publish()
+
+    def _publish(self):
+        state = {
+            'pid': os.getpid(),
+            'next_photo': self.next_photo,
+            'next_due': self.next_due.isoformat() if self.next_due else None,
+        }
+        tmp = self.state_path.with_name(f"{self.state_path.name}.{os.getpid()}.tmp")
+        try:
+            tmp.write_text(json.dumps(state))
+            os.replace(tmp, self.state_path)
+        except OSError as e:
+            logger.error(f"Could not save slideshow state: {e}")
+
+    def _published(self):
+        """State written by the worker running the timer, or None if none is."""
+        try:
+            state = json.loads(self.state_path.read_text())
+            os.kill(state['pid'], 0)
+        except PermissionError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return state
+
+    def _finish_prefetch(self):
+        # A render still under way is let finish rather than done twice
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch is not None and not prefetch.cancel():
+            prefetch.result()
+
+    def start(self):
+        """Start the timer thread if enabled and no other worker runs it."""
+        if not self.enabled or self._thread is not None:
+            return False
+        lock_path = Path(self.controller.photos_dir) / ".slideshow.lock"
+        self._lock_file = open(lock_path, 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            logger.info("Slideshow already running in another worker")
+            return False
+        self._thread = threading.Thread(target=self._run, name='slideshow', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._lock_file is not None:
+            self.state_path.unlink(missing_ok=True)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def skip(self):
+        """Show the next photo now instead of waiting for the timer."""
+        self.next_due = datetime.now()
+        self._wake.set()
+
+    def _run(self):
+        current, last = self.controller.index.last_shown()
+        now = datetime.now()
+        self.next_due = self.due_after(datetime.fromtimestamp(last)) if last else now
+        logger.info(f"Slideshow started ({self.order}), next change at {self.next_due}")
+        self._choose_next(current)
+
+        while not self._stop.is_set():
+            wait = (self.next_due - datetime.now()).total_seconds()
+            if wait > 0:
+                self._wake.wait(min(wait, 3600))
+                self._wake.clear()
+                continue
+            queued = self.controller.index.queued()
+            if queued:
+                self.next_photo = queued[0]
+            elif self.next_photo is None:
+                self._choose_next(current)
+            if self.next_photo is not None:
+                self._finish_prefetch()
+                if self.controller.submit_display(self.next_photo, reason='scheduled').result():
+                    current = self.next_photo
+                if queued:
+                    self.controller.index.dequeue(self.next_photo)
+            self.next_due = self.due_after(datetime.now())
+            self._choose_next(current)
+
+    def status(self):
+        if self._thread is not None:
+            state = {'next_photo': self.next_photo,
+                     'next_due': self.next_due.isoformat() if self.next_due else None}
+        else:
+            state = self._published()
+        return {
+            'enabled': self.enabled,
+            'running': state is not None,
+            'order': self.order,
+            'schedule': self.cron.spec if self.cron else f"every {self.interval}",
+            'next_photo': state['next_photo'] if state else None,
+            'next_due': state['next_due'] if state else None,
+            'queued': self.controller.index.queued(),
+        }
@@ -13,6 +13,16 @@ interface PhotoWithStatus {
     converted: boolean;
 }
 
+interface BulkDelta {
+    deleted: string[];
+    converting: string[];
+    queued: string[];
+    missing: string[];
+    stale: string[];
+    convert_busy?: boolean;
+    error?: string;
+}
+
 interface PhotoStatus {
     total_photos: number;
     converted_photos: number;
@@ -21,16 +31,22 @@ interface PhotoStatus {
 
 class PhotoUploader {
     private readonly MAX_TOASTS = 3;
+    // The frame forgets a report after two minutes
+    private readonly VISIBLE_REPORT_MS = 60000;
     private dropZone: HTMLElement;
     private photoDirElement: HTMLElement;
     private statusContainer: HTMLElement | null = null;
     private activeToasts: number = 0;
+    private visible = new Set<string>();
+    private visibleObserver: IntersectionObserver | null = null;
+    private visibleTimer: number | undefined;
 
     constructor() {
         this.dropZone = document.getElementById('drop-zone')!;
         this.photoDirElement = document.getElementById('photo-dir')!;
         
         this.initializeEventListeners();
+        this.initializeVisibilityReports();
         this.loadPhotos();
         this.initializeStatusContainer();
     }
@@ -122,6 +138,8 @@ class PhotoUploader {
             const photos: PhotoInfo[] = await listResponse.json();
             const status: PhotoStatus = await statusResponse.json();
 
+            this.visibleObserver?.disconnect();
+            this.visible.clear();
             this.photoDirElement.innerHTML = '';
             const photoGrid = document.createElement('div');
             photoGrid.className = 'photo-grid';
@@ -130,6 +148,7 @@ class PhotoUploader {
                 const statusInfo = status.photos.find(p => p.filename === photo.filename);
                 const photoContainer = document.createElement('div');
                 photoContainer.className = 'photo-container';
+                photoContainer.dataset.filename = photo.filename;
                 
                 const img = document.createElement('img');
                 img.src = photo.path;
@@ -164,6 +183,7 @@ class PhotoUploader {
                 photoContainer.appendChild(img);
                 photoContainer.appendChild(buttonsContainer);
                 photoGrid.appendChild(photoContainer);
+                this.visibleObserver?.observe(photoContainer);
             });
             
             this.photoDirElement.appendChild(photoGrid);    
@@ -211,21 +231,83 @@ class PhotoUploader {
     }
 
     private async deletePhoto(filename: string): Promise<void> {
+        const delta = await this.bulk({ delete: [filename] });
+        if (delta?.deleted.includes(filename)) {
+            this.updateStatus(`Deleted ${filename} successfully`, 'success');
+        } else if (delta) {
+            this.updateStatus(`Failed to delete ${filename}: file not found`, 'error');
+        }
+    }
+
+    // One request for many photos; the grid is patched from the reply
+    // instead of being reloaded
+    private async bulk(actions: { delete?: string[]; convert?: string[]; display?: string[] }): Promise<BulkDelta | null> {
         try {
-            const response = await fetch(`/photos/delete/${filename}`, {
-                method: 'DELETE'
+            const response = await fetch('/photos/bulk', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(actions)
             });
-            if (response.ok) {
-                this.updateStatus(`Deleted ${filename} successfully`,
-                                  'success');
-                await this.loadPhotos();
-            } else {
-                const errorData = await response.json();
-                this.updateStatus(`Failed to delete ${filename}: ${errorData.error}`, 'error');
+            const delta: BulkDelta = await response.json();
+            if (!response.ok) {
+                this.updateStatus(`Failed to update photos: ${delta.error}`, 'error');
+                return null;
+            }
+            this.applyDelta(delta);
+            return delta;
+        } catch (error) {
+            this.updateStatus('Error updating photos', 'error');
+            console.error('Error in bulk update:', error);
+            return null;
+        }
+    }
+
+    private applyDelta(delta: BulkDelta): void {
+        for (const filename of delta.deleted) {
+            this.photoDirElement
+                .querySelectorAll<HTMLElement>('.photo-container')
+                .forEach(el => { if (el.dataset.filename === filename) el.remove(); });
+            this.visible.delete(filename);
+        }
+        if (delta.convert_busy) {
+            this.updateStatus('A conversion job is already running', 'error');
+        }
+    }
+
+    // Tell the frame which photos are on screen, so it renders them ahead
+    // in case one of them is displayed
+    private initializeVisibilityReports(): void {
+        this.visibleObserver = new IntersectionObserver(entries => {
+            for (const entry of entries) {
+                const filename = (entry.target as HTMLElement).dataset.filename;
+                if (!filename) continue;
+                if (entry.isIntersecting) {
+                    this.visible.add(filename);
+                } else {
+                    this.visible.delete(filename);
+                }
             }
+            // Report once scrolling settles
+            window.clearTimeout(this.visibleTimer);
+            this.visibleTimer = window.setTimeout(() => this.reportVisible(), 1000);
+        });
+        window.setInterval(() => {
+            if (document.visibilityState === 'visible') {
+                this.reportVisible();
+            }
+        }, this.VISIBLE_REPORT_MS);
+    }
+
+    private async reportVisible(): Promise<void> {
+        if (this.visible.size === 0) return;
+        try {
+            await fetch('/photos/visible', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ photos: Array.from(this.visible) })
+            });
         } catch (error) {
-            this.updateStatus(`Error deleting ${filename}`, 'error');
-            console.error('Error deleting photo:', 'error');
+            console.error('Error reporting visible photos:', error);
         }
     }
 
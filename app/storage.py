@@ -0,0 +1,202 @@
+"""Keep photos/ within the SD card's means.
+
+Files under photos/ fall in three tiers:
+
+    originals  photos/originals, what was uploaded
+    derived    display BMPs and .epdraw framebuffers in photos/display,
+               which can always be rendered again from the originals
+    other      the index, job state, metrics and profiles
+
+With [storage] quota_mb set, going over the quota first evicts derived
+files, least recently shown photo first (the photo on screen and the
+slideshow's next pick are kept, and the ready set from readyset.py goes
+last). If that is not enough and max_original_px is set, originals larger
+than it are transcoded, again least recently shown first. Originals are
+never deleted.
+
+With max_original_px set, new uploads are also transcoded: scaled so their
+long side is at most max_original_px and saved at original_quality,
+keeping their EXIF data and modification time. Only JPEG and PNG are
+rewritten, in their own format so filenames stay the same. The index keeps
+the SHA-256 of the uploaded bytes, so uploading the same file again is
+still caught as a duplicate.
+
+All of this runs on the low-priority maintenance pool, pausing between
+files while refreshes and requests are in progress.
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from . import executors
+from . import scheduler
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'quota_mb': 0,
+    'max_original_px': 0,
+    'original_quality': 90,
+}
+
+DERIVED_SUFFIXES = ('.bmp', '.epdraw')
+TRANSCODABLE = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG'}
+
+# Seconds a usage scan is reused for /photos/status
+USAGE_TTL = 10
+
+def _size(path):
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+def _tree_size(directory):
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            total += _size(Path(root) / name)
+    return total
+
+class StorageManager:
+    def __init__(self, controller, config):
+        self.controller = controller
+        settings = {**DEFAULTS, **(config or {}).get('storage', {})}
+        self.quota = int(settings['quota_mb']) * 2**20
+        self.max_px = int(settings['max_original_px'])
+        self.quality = int(settings['original_quality'])
+        self._usage = None
+        self._enforce_pending = threading.Event()
+
+    def _derived(self):
+        """Derived files grouped by the stem of the photo they were made from."""
+        groups = {}
+        for path in self.controller.display_dir.iterdir():
+            if path.suffix in DERIVED_SUFFIXES and path.is_file():
+                groups.setdefault(path.stem, []).append(path)
+        return groups
+
+    def usage(self, fresh=False):
+        """Bytes used per tier, the quota and the free space on the card."""
+        if not fresh and self._usage is not None and time.monotonic() - self._usage[0] < USAGE_TTL:
+            return self._usage[1]
+        photos_dir = self.controller.photos_dir
+        originals = _tree_size(self.controller.originals_dir)
+        derived = sum(_size(p) for paths in self._derived().values() for p in paths)
+        total = _tree_size(photos_dir)
+        usage = {
+            'originals': originals,
+            'derived': derived,
+            'other': total - originals - derived,
+            'total': total,
+            'quota': self.quota or None,
+            'free': shutil.disk_usage(photos_dir).free,
+        }
+        self._usage = (time.monotonic(), usage)
+        return usage
+
+    def _by_last_shown(self, names):
+        """names ordered least recently shown first, keeping the on-screen and next photos out.
+
+        Photos in the ready set go after all the others.
+        """
+        history = self.controller.index.history()
+        current, _ = self.controller.index.last_shown()
+        keep = {current, self.controller.slideshow.next_photo}
+        ready = set(self.controller.ready.members())
+        return sorted((name for name in names if name not in keep),
+                      key=lambda name: (name in ready, history.get(name, {}).get('last_shown') or 0, name))
+
+    def enforce(self):
+        """Bring photos/ under the quota; returns the bytes freed."""
+        self._enforce_pending.clear()
+        if not self.quota:
+            return 0
+        over = self.usage(fresh=True)['total'] - self.quota
+        if over <= 0:
+            return 0
+        freed = 0
+        groups = self._derived()
+        stems = {Path(p['filename']).stem: p['filename'] for p in self.controller.get_available_photos()}
+        # Renders of photos that no longer exist go first
+        order = [stem for stem in groups if stem not in stems]
+        order += [Path(name).stem for name in self._by_last_shown(stems[s] for s in groups if s in stems)]
+        for stem in order:
+            if freed >= over:
+                break
+            scheduler.checkpoint()
+            for path in groups[stem]:
+                size = _size(path)
+                path.unlink(missing_ok=True)
+                freed += size
+        if freed < over and self.max_px:
+            for name in self._by_last_shown(stems.values()):
+                if freed >= over:
+                    break
+                scheduler.checkpoint()
+                freed += self.transcode(name)
+        self._usage = None
+        if freed < over:
+            logger.warning(f"photos/ is {(over - freed) / 2**20:.1f} MiB over its quota "
+                           f"with nothing left to evict")
+        else:
+            logger.info(f"Freed {freed / 2**20:.1f} MiB to stay under the storage quota")
+        return freed
+
+    def schedule_enforce(self):
+        """Check the quota in the background, once however often it is asked for."""
+        if self.quota and not self._enforce_pending.is_set():
+            self._enforce_pending.set()
+            executors.submit('maintenance', self.enforce)
+
+    @staticmethod
+    def _unchanged(path, stat):
+        try:
+            now = path.stat()
+        except OSError:
+            return False
+        return (now.st_ino, now.st_mtime_ns, now.st_size) == (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def transcode(self, filename):
+        """Shrink an original to max_original_px in place; returns the bytes saved."""
+        from PIL import Image
+        path = self.controller.originals_dir / filename
+        image_format = TRANSCODABLE.get(path.suffix.lower())
+        if not self.max_px or image_format is None:
+            return 0
+        partial = path.with_name(f".{filename}.transcode")
+        try:
+            stat = path.stat()
+            with Image.open(path) as img:
+                if max(img.size) <= self.max_px:
+                    return 0
+                options = {key: img.info[key] for key in ('exif', 'icc_profile') if img.info.get(key)}
+                img.thumbnail((self.max_px, self.max_px), Image.Resampling.LANCZOS)
+                if image_format == 'JPEG':
+                    options.update(quality=self.quality, optimize=True)
+                    if img.mode not in ('RGB', 'L', 'CMYK'):
+                        img = img.convert('RGB')
+                else:
+                    options.update(optimize=True)
+                img.save(partial, image_format, **options)
+            saved = stat.st_size - _size(partial)
+            if saved <= 0 or not self._unchanged(path, stat):
+                # Deleted or replaced while it was being re-encoded
+                partial.unlink()
+                return 0
+            os.replace(partial, path)
+            # The picture is the same, so its display version is still current
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            self._usage = None
+            logger.info(f"Transcoded {filename}, saved {saved / 2**20:.1f} MiB")
+            return saved
+        except Exception as e:
+            logger.error(f"Error transcoding {filename}: {e}")
+            partial.unlink(missing_ok=True)
+            return 0
+
+    def submit_transcode(self, filename):
+        if self.max_px:
+            executors.submit('maintenance', self.transcode, filename)
@@ -1,69 +1,379 @@
 from PIL import Image
 import os
 import logging
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from . import palette
+from . import layout
+from . import metrics
+from . import scheduler
+from . import simulator
+from .decode import open_image
+from .framebuffer import open_raw, raw_path, window_buffer, write_raw
+from .panels import DriverAttr, get_panel
 
 logger = logging.getLogger(__name__)
 
+_INVERT = bytes(0xFF - i for i in range(256))
+
+def _spi_chunk_size():
+    # Match spidev's transfer buffer so each write is one ioctl
+    try:
+        return int(Path('/sys/module/spidev/parameters/bufsiz').read_text())
+    except (OSError, ValueError):
+        return 4096
+
+SPI_CHUNK = _spi_chunk_size()
+
 def _is_eink_enabled():
     return os.getenv('EINK_DISPLAY', 'false').lower() == 'true'
 
-def convert_for_display(input_path, output_path, config=None):
-    """Convert an image file to BMP format suitable for e-ink display."""
+def _pack(indices, size, table, rawmode):
+    """Translate palette positions through table and bit-pack them."""
+    return bytearray(Image.frombytes('P', size, indices.translate(table)).tobytes('raw', rawmode))
+
+def _plane_table(index, invert):
+    """1bpp table that marks palette position index as ink."""
+    ink, paper = (1, 0) if invert else (0, 1)
+    return bytes(ink if i == index else paper for i in range(256))
+
+def get_buffers(image, panel):
+    """Build the plane buffers panel's driver display() expects."""
+    if panel.layout == 'mono':
+        buf = image.convert('1').tobytes()
+        return [bytearray(buf.translate(_INVERT) if panel.invert else buf)]
+
+    if image.mode != 'P':
+        image = palette.quantize(image, panel.palette)
+    indices = image.tobytes()
+
+    if panel.layout == 'black_red':
+        return [_pack(indices, image.size, _plane_table(0, panel.invert), 'P;1'),
+                _pack(indices, image.size, _plane_table(2, panel.invert), 'P;1')]
+
+    rawmode = 'P;4' if panel.layout == '4bpp' else 'P;2'
+    return [_pack(indices, image.size, palette.panel_codes(panel.palette), rawmode)]
+
+def convert_for_display(input_path, output_path, config=None, saliency=None, partner=None):
+    """Convert an image file to BMP format suitable for e-ink display.
+
+    display.fit picks how the photo fills the panel: 'fit' letterboxes it,
+    'fill' crops the centre to the panel's shape and 'smart' crops around
+    the most salient part, using the grid from crop.saliency_grid().
+    partner is an optional (path, saliency) for a second photo that shares
+    the frame, see layout.pick_partner().
+    """
     try:
-        img = Image.open(input_path).convert('L')
-        
-        target_size = (800, 480)  # Default to landscape
-        
-        img.thumbnail(target_size, Image.Resampling.LANCZOS)
-        new_img = Image.new('L', target_size, 'white')
-        
-        # Center and rotate the image
-        x = (target_size[0] - img.width) // 2
-        y = (target_size[1] - img.height) // 2
-        new_img.paste(img, (x, y))
-        # new_img = new_img.rotate(angle=config["waveshare"]["rotation"])
-        
-        # Convert to 1-bit color for e-ink
-        new_img = new_img.convert('1')
-        new_img.save(output_path, 'BMP')
+        panel = get_panel(config)
+        mode = 'RGB' if panel.palette != 'bw' else 'L'
+        fit = (config or {}).get('display', {}).get('fit', 'fit')
+        canvas_size, transpose = layout.canvas(panel, config)
+
+        photos = [(input_path, saliency)] + ([partner] if partner else [])
+        boxes = layout.slots(canvas_size, len(photos))
+        new_img = Image.new(mode, canvas_size, 'white') if len(photos) > 1 else None
+        for (path, grid), box in zip(photos, boxes):
+            size = (box[2] - box[0], box[3] - box[1])
+            # Background renders make way for refreshes and requests between stages
+            scheduler.checkpoint()
+            with metrics.span('decode'):
+                img = open_image(path, size, mode)
+            with metrics.span('resize'):
+                img = layout.render(img, size, fit, grid)
+            if new_img is None:
+                new_img = img
+            else:
+                new_img.paste(img, box[:2])
+
+        if transpose is not None:
+            # Lossless quarter/half turn into the panel's own orientation
+            new_img = new_img.transpose(transpose)
+
+        scheduler.checkpoint()
+        with metrics.span('dither'):
+            if panel.palette == 'bw':
+                # Convert to 1-bit color for e-ink
+                new_img = new_img.convert('1')
+            else:
+                dither = (config or {}).get('display', {}).get('dither', True)
+                new_img = palette.quantize(new_img, panel.palette, dither)
+        scheduler.checkpoint()
+        with metrics.span('save'):
+            new_img.save(output_path, 'BMP')
+        if panel.fast_path:
+            # Pack once here so display jobs can stream the planes straight from disk
+            with metrics.span('getbuffer'):
+                buffers = get_buffers(new_img, panel)
+            with metrics.span('save_raw'):
+                write_raw(raw_path(output_path), panel, buffers)
         
         return True
     except Exception as e:
         logger.error(f"Conversion failed: {e}")
         return False
 
-def display_image(image_path):
-    """Display an image on the e-ink display."""
+def _send_plane(epd, epdconfig, plane, invert=False):
+    """Like the drivers' send_data2, but in SPI_CHUNK slices of a memoryview.
+
+    Slices of a memory-mapped plane are handed to spidev without copying,
+    and inverted planes are translated a chunk at a time, so memory use
+    stays flat however large the panel is.
+    """
+    epdconfig.digital_write(epd.dc_pin, 1)
+    epdconfig.digital_write(epd.cs_pin, 0)
+    for start in range(0, len(plane), SPI_CHUNK):
+        chunk = plane[start:start + SPI_CHUNK]
+        if invert:
+            chunk = chunk.tobytes().translate(_INVERT)
+        epdconfig.spi_writebyte2(chunk)
+    epdconfig.digital_write(epd.cs_pin, 1)
+
+def _transfer(epd, epdconfig, steps, buffers):
+    """Run a panel transfer recipe (see panels.py) against the driver."""
+    for step in steps:
+        kind = step[0]
+        if kind == 'cmd':
+            epd.send_command(step[1])
+            for value in step[2]:
+                epd.send_data(value)
+        elif kind == 'write':
+            _send_plane(epd, epdconfig, buffers[step[1]], invert=step[2])
+        elif kind == 'call':
+            getattr(epd, step[1])()
+        elif kind == 'delay':
+            epdconfig.delay_ms(step[1])
+
+class _DriverTimer:
+    """Time driver stages, with BUSY waits split out as refresh_wait.
+
+    The drivers poll BUSY from inside init(), Clear() and display(), so
+    each ReadBusy* method on epd is wrapped and its time is taken off
+    whichever stage it happened in.
+    """
+
+    def __init__(self, epd):
+        self.waited = 0.0
+        for name in dir(type(epd)):
+            if name.startswith('ReadBusy'):
+                setattr(epd, name, self._timed_wait(getattr(epd, name)))
+
+    def _timed_wait(self, wait):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return wait(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - started
+                self.waited += seconds
+                metrics.observe('refresh_wait', seconds)
+        return timed
+
+    @contextmanager
+    def stage(self, name):
+        started, waited = time.perf_counter(), self.waited
+        try:
+            yield
+        finally:
+            metrics.observe(name, time.perf_counter() - started - (self.waited - waited))
+
+class _SpiCounter:
+    """Count the bytes a driver writes over SPI, commands included.
+
+    Drivers write through epdconfig's functions or straight to its SPI
+    device, so both are wrapped on the shared module for the duration of
+    a job and put back afterwards.
+    """
+
+    WRITES = ('spi_writebyte', 'spi_writebyte2', 'DEV_SPI_write')
+
+    def __init__(self, epdconfig):
+        self.epdconfig = epdconfig
+        self.sent = 0
+        self.saved = {}
+
+    def __enter__(self):
+        for name in self.WRITES + ('SPI',):
+            if hasattr(self.epdconfig, name):
+                self.saved[name] = getattr(self.epdconfig, name)
+        for name in self.WRITES:
+            if name in self.saved:
+                setattr(self.epdconfig, name, self._counted(self.saved[name]))
+        if 'SPI' in self.saved:
+            self.epdconfig.SPI = _CountedSPI(self.saved['SPI'], self)
+        return self
+
+    def __exit__(self, *exc):
+        for name, value in self.saved.items():
+            setattr(self.epdconfig, name, value)
+        # Once per job; the drivers write a byte at a time in places
+        metrics.count('eink_spi_bytes_total', self.sent)
+
+    def add(self, data):
+        # A few drivers pass a bare int rather than a list
+        self.sent += 1 if isinstance(data, int) else len(data)
+
+    def _counted(self, write):
+        def counted(data):
+            self.add(data)
+            return write(data)
+        return counted
+
+class _CountedSPI:
+    def __init__(self, spi, counter):
+        self._spi = spi
+        self._counter = counter
+
+    def __getattr__(self, name):
+        return getattr(self._spi, name)
+
+    def writebytes(self, data):
+        self._counter.add(data)
+        return self._spi.writebytes(data)
+
+    def writebytes2(self, data):
+        self._counter.add(data)
+        return self._spi.writebytes2(data)
+
+def _show(epd, driver, panel, display, buffers):
+    steps = panel.transfers.get(display)
+    if steps:
+        _transfer(epd, driver.epdconfig, steps, [memoryview(b) for b in buffers])
+    else:
+        # Drivers modify their buffers in place, so never hand them the mapping
+        getattr(epd, display)(*(bytearray(b) for b in buffers))
+
+def _init(epd, init, init_args):
+    args = [arg.resolve(epd) if isinstance(arg, DriverAttr) else arg for arg in init_args]
+    getattr(epd, init)(*args)
+
+def _full_refresh(epd, driver, panel, buffers, timer):
+    init, display, init_args = panel.modes['full']
+    with timer.stage('driver_init'):
+        _init(epd, init, init_args)
+    with timer.stage('clear'):
+        epd.Clear(*panel.clear_args)
+    with timer.stage('transfer'), scheduler.activity('display'):
+        _show(epd, driver, panel, display, buffers)
+
+def _fast_refresh(epd, driver, panel, buffers, timer):
+    # The fast waveform is only worth it without the extra Clear() pass
+    init, display, init_args = panel.modes['fast']
+    with timer.stage('driver_init'):
+        _init(epd, init, init_args)
+    with timer.stage('transfer'), scheduler.activity('display'):
+        _show(epd, driver, panel, display, buffers)
+
+def _partial_refresh(epd, panel, frame, last_frame, regions, timer):
+    init, display, init_args = panel.modes['partial']
+    with timer.stage('driver_init'):
+        _init(epd, init, init_args)
+    show = getattr(epd, display)
+    frame = bytearray(frame)
+    with timer.stage('transfer'), scheduler.activity('display'):
+        if panel.partial_window == 'old_new':
+            show(bytearray(last_frame), frame)
+        elif panel.partial_window is None:
+            show(frame)
+        else:
+            for region in regions:
+                logger.info(f"Partial refresh of window {region}")
+                if panel.partial_window == 'slice':
+                    show(window_buffer(frame, panel.row_bytes, region), *region)
+                else:
+                    # The driver cuts the window out of the whole frame itself
+                    if panel.partial_window == 'frame':
+                        show(frame, *region)
+                    else:
+                        show(*region, frame)
+
+def display_image(image_path, config=None, policy=None, reason='manual'):
+    """Display an image on the e-ink display.
+
+    With a RefreshPolicy the waveform is picked per job: reason is 'manual'
+    for taps in the UI and 'scheduled' for slideshow rotations. Identical
+    frames are skipped and each refresh's wall time is recorded per mode.
+
+    When convert_for_display left a matching .epdraw next to the BMP, its
+    planes are memory-mapped and sent as-is instead of decoding the image.
+
+    EINK_SIMULATOR=<directory> runs the driver against app.simulator
+    instead of the real panel and saves what it would show there.
+    """
+    raw = None
     try:
         # Check if image file exists
         if not Path(image_path).exists():
             logger.error(f"Image file not found: {image_path}")
             return False
-            
-        if not _is_eink_enabled():
-            logger.info(f"MOCK: Would display image: {image_path}")
+
+        panel = get_panel(config)
+        image = None
+        with metrics.span('load'):
+            if panel.fast_path:
+                raw = open_raw(raw_path(image_path), panel, source=image_path)
+                metrics.count('eink_cache_requests_total', cache='epdraw', result='miss' if raw is None else 'hit')
+            if raw is not None:
+                buffers = raw.planes
+            else:
+                image = Image.open(image_path)
+                buffers = get_buffers(image, panel) if panel.fast_path else None
+
+        mode, regions = 'full', None
+        frame = last_frame = None
+        counts = {}
+        if policy is not None and buffers is not None:
+            with metrics.span('choose'):
+                # Copy before the driver gets a chance to modify the buffers in place
+                frame = raw.frame if raw is not None else b''.join(bytes(b) for b in buffers)
+                last_frame, counts = policy.frames.load(panel)
+                mode, regions = policy.choose(panel, frame, last_frame, counts, reason)
+        if mode == 'none':
+            logger.info(f"Frame unchanged, skipping refresh for {image_path}")
+            metrics.count('eink_refreshes_total', mode='none')
             return True
             
-        try:
-            from .lib.waveshare_epd import epd7in5_V2
-        except ImportError:
-            logger.error("Waveshare EPD library not found. Install waveshare-epd or set EINK_DISPLAY=false")
-            return False
-            
-        logger.info("Initializing display...")
-        epd = epd7in5_V2.EPD()
-        epd.init()
-        epd.Clear()
-
-        logger.info(f"Displaying image: {image_path}")
-        image = Image.open(image_path)
-        epd.display(epd.getbuffer(image))
-        
-        logger.info("Putting display to sleep...")
-        epd.sleep()
+        if simulator.enabled():
+            simulator.install(panel, mode=mode)
+        if not _is_eink_enabled() and not simulator.enabled():
+            logger.info(f"MOCK: Would display image: {image_path} ({mode} refresh)")
+        else:
+            try:
+                driver = panel.load_driver()
+            except ImportError:
+                logger.error("Waveshare EPD library not found. Install waveshare-epd or set EINK_DISPLAY=false")
+                return False
+                
+            logger.info(f"Initializing display {panel.name} for {mode} refresh...")
+            epd = driver.EPD()
+            timer = _DriverTimer(epd)
+            logger.info(f"Displaying image: {image_path}")
+            with _SpiCounter(driver.epdconfig):
+                started = time.monotonic()
+                if mode == 'partial':
+                    _partial_refresh(epd, panel, frame, last_frame, regions, timer)
+                elif mode == 'fast':
+                    _fast_refresh(epd, driver, panel, buffers, timer)
+                else:
+                    if buffers is None:
+                        with metrics.span('getbuffer'):
+                            buffers = [epd.getbuffer(image)]
+                    _full_refresh(epd, driver, panel, buffers, timer)
+                if policy is not None:
+                    policy.record(mode, time.monotonic() - started)
+                metrics.count('eink_refreshes_total', mode=mode)
+
+                logger.info("Putting display to sleep...")
+                with timer.stage('sleep'):
+                    epd.sleep()
+
+        if frame is not None:
+            policy.frames.save(panel, frame, policy.next_counts(counts, mode))
         return True
         
     except Exception as e:
         logger.error(f"Display error: {e}")
         return False
+    finally:
+        if raw is not None:
+            raw.close()
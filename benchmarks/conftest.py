@@ -0,0 +1,24 @@
+import sys
+import pytest
+from .fakes import EPDCONFIG, FakeBus
+
+DRIVERS = EPDCONFIG.rsplit('.', 1)[0] + '.'
+
+@pytest.fixture
+def bus(monkeypatch):
+    """Install FakeBus as epdconfig so the bundled drivers import off the Pi.
+
+    Driver modules bind epdconfig when imported, so any already loaded are
+    set aside for the test and the ones it imports are dropped afterwards;
+    nothing outside the test sees the fake.
+    """
+    import app.lib.waveshare_epd as package
+    fake = FakeBus()
+    module = fake.as_module()
+    for name in [n for n in sys.modules if n.startswith(DRIVERS) and n != EPDCONFIG]:
+        monkeypatch.delitem(sys.modules, name)
+    monkeypatch.setitem(sys.modules, EPDCONFIG, module)
+    monkeypatch.setattr(package, 'epdconfig', module, raising=False)
+    yield fake
+    for name in [n for n in sys.modules if n.startswith(DRIVERS) and n != EPDCONFIG]:
+        del sys.modules[name]
@@ -0,0 +1,72 @@
+import types
+from PIL import Image
+
+EPDCONFIG = 'app.lib.waveshare_epd.epdconfig'
+
+class FakeBus:
+    """In-memory stand-in for epdconfig that counts SPI and GPIO traffic.
+
+    BUSY reads alternate between 0 and 1 so every driver's wait loop exits
+    on its second poll whichever polarity it waits for, and delays return
+    at once; only Python-side work is left to time.
+    """
+
+    RST_PIN, DC_PIN, CS_PIN, BUSY_PIN, PWR_PIN = 17, 25, 8, 24, 18
+
+    def __init__(self):
+        self.reset()
+        self.SPI = types.SimpleNamespace(writebytes2=self.spi_writebyte2)
+
+    def reset(self):
+        self.bytes_sent = 0
+        self.transactions = 0
+        self.gpio_writes = 0
+        self._busy = 0
+
+    def counts(self):
+        return {'bytes_sent': self.bytes_sent, 'transactions': self.transactions,
+                'gpio_writes': self.gpio_writes}
+
+    def digital_write(self, pin, value):
+        self.gpio_writes += 1
+
+    def digital_read(self, pin):
+        self._busy ^= 1
+        return self._busy
+
+    def delay_ms(self, ms):
+        pass
+
+    def spi_writebyte(self, data):
+        self.transactions += 1
+        # A few drivers pass a bare int rather than a list
+        self.bytes_sent += 1 if isinstance(data, int) else len(data)
+
+    spi_writebyte2 = DEV_SPI_write = spi_writebyte
+
+    def DEV_SPI_read(self):
+        return 0
+
+    def module_init(self, *args, **kwargs):
+        return 0
+
+    def module_exit(self, *args, **kwargs):
+        pass
+
+    def as_module(self):
+        module = types.ModuleType(EPDCONFIG)
+        for name in dir(self):
+            if not name.startswith('_'):
+                setattr(module, name, getattr(self, name))
+        return module
+
+def photo(size):
+    """A synthetic photo with gradients and edges, so codecs and dithering do real work."""
+    width, height = size
+    base = Image.merge('RGB', [
+        Image.linear_gradient('L').resize(size),
+        Image.linear_gradient('L').rotate(90).resize(size),
+        Image.radial_gradient('L').resize(size),
+    ])
+    noise = Image.effect_noise(size, 40).convert('RGB')
+    return Image.blend(base, noise, 0.3)
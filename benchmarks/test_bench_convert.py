@@ -0,0 +1,30 @@
+import pytest
+from app import decode
+from app.waveshare_utils import convert_for_display
+from .fakes import photo
+
+pytest.importorskip('pytest_benchmark')
+
+SIZES = {'vga': (640, 480), '3mp': (2048, 1536), '12mp': (4032, 3024)}
+FORMATS = ['jpg', 'png'] + (['heic'] if decode.HEIF_SUPPORTED else [])
+PANELS = ['EPD_7in5_V2', 'EPD_7in3f', 'EPD_13in3k']
+
+@pytest.fixture(scope='module')
+def sources(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('sources')
+    paths = {}
+    for name, size in SIZES.items():
+        img = photo(size)
+        for fmt in FORMATS:
+            paths[name, fmt] = directory / f'{name}.{fmt}'
+            img.save(paths[name, fmt])
+    return paths
+
+@pytest.mark.parametrize('model', PANELS)
+@pytest.mark.parametrize('fmt', FORMATS)
+@pytest.mark.parametrize('size', SIZES)
+def test_convert_for_display(benchmark, sources, tmp_path, model, fmt, size):
+    benchmark.group = f'convert {model}'
+    config = {'waveshare': {'model': model}, 'display': {'fit': 'fit'}}
+    ok = benchmark(convert_for_display, sources[size, fmt], tmp_path / 'out.bmp', config)
+    assert ok
@@ -0,0 +1,20 @@
+import random
+import pytest
+from app.dedupe import HashIndex
+
+pytest.importorskip('pytest_benchmark')
+
+@pytest.fixture(scope='module')
+def library():
+    rng = random.Random(47)
+    index = HashIndex()
+    for i in range(50_000):
+        index.add(f'photo{i}.jpg', rng.getrandbits(64))
+    return index, rng
+
+def test_near_duplicate_lookup_50k(benchmark, library):
+    index, rng = library
+    queries = [rng.getrandbits(64) for _ in range(100)]
+    benchmark.group = 'dedupe'
+    # 100 lookups per round
+    benchmark(lambda: [index.near(q) for q in queries])
@@ -0,0 +1,22 @@
+import pytest
+from app.waveshare_utils import convert_for_display, display_image, raw_path
+from .fakes import photo
+
+pytest.importorskip('pytest_benchmark')
+
+CONFIG = {'waveshare': {'model': 'EPD_7in3f'}}
+
+@pytest.mark.parametrize('source', ['epdraw', 'bmp'])
+def test_display_image(benchmark, bus, monkeypatch, tmp_path, source):
+    """A whole display job, from the file on disk to bytes on the (fake) bus."""
+    benchmark.group = 'display_image EPD_7in3f'
+    monkeypatch.setenv('EINK_DISPLAY', 'true')
+    photo((800, 480)).save(tmp_path / 'in.png')
+    assert convert_for_display(tmp_path / 'in.png', tmp_path / 'out.bmp', CONFIG)
+    if source == 'bmp':
+        raw_path(tmp_path / 'out.bmp').unlink()
+
+    bus.reset()
+    assert display_image(tmp_path / 'out.bmp', CONFIG)
+    benchmark.extra_info.update(bus.counts())
+    benchmark.pedantic(display_image, args=(tmp_path / 'out.bmp', CONFIG), rounds=5)
@@ -0,0 +1,79 @@
+import pytest
+from PIL import Image
+from app import palette
+from app.panels import PANELS
+from app.waveshare_utils import _show, get_buffers
+from .fakes import photo
+
+pytest.importorskip('pytest_benchmark')
+
+LAYOUTS = {'mono': 'epd7in5_V2', 'black_red': 'epd7in5b_V2', '2bpp': 'epd7in3g', '4bpp': 'epd7in3f'}
+
+def load(bus, name):
+    try:
+        return PANELS[name].load_driver()
+    except ImportError as e:
+        # A few drivers import RPi.GPIO themselves
+        pytest.skip(f"{name} needs {e.name}")
+
+def record_traffic(benchmark, bus, fn, *args):
+    """Run fn once against the fake bus and keep its SPI/GPIO counts with the timings."""
+    bus.reset()
+    fn(*args)
+    benchmark.extra_info.update(bus.counts())
+
+@pytest.mark.parametrize('name', sorted(PANELS))
+def test_driver_getbuffer(benchmark, bus, name):
+    benchmark.group = 'driver getbuffer'
+    epd = load(bus, name).EPD()
+    image = photo(PANELS[name].size)
+    benchmark(epd.getbuffer, image)
+
+@pytest.mark.parametrize('name', sorted(n for n in PANELS if n != 'epd2in13d'))
+def test_driver_getbuffer_4gray(benchmark, bus, name):
+    epd = load(bus, name).EPD()
+    if not hasattr(epd, 'getbuffer_4Gray'):
+        pytest.skip(f"{name} has no 4-gray mode")
+    benchmark.group = 'driver getbuffer_4Gray'
+    benchmark(epd.getbuffer_4Gray, photo(PANELS[name].size).convert('L'))
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_get_buffers(benchmark, layout):
+    """The app's own packers, from a quantized frame to display() planes."""
+    benchmark.group = 'pack planes'
+    panel = PANELS[LAYOUTS[layout]]
+    image = photo(panel.size)
+    image = image.convert('1') if panel.palette == 'bw' else palette.quantize(image, panel.palette)
+    buffers = benchmark(get_buffers, image, panel)
+    assert sum(len(b) for b in buffers) == panel.planes * panel.plane_size
+
+@pytest.mark.parametrize('name', sorted(PANELS))
+def test_driver_display(benchmark, bus, name):
+    """The driver's own full-refresh display method with its getbuffer output."""
+    benchmark.group = 'driver display'
+    panel = PANELS[name]
+    epd = load(bus, name).EPD()
+    init, display, _ = panel.modes['full']
+    buffer = list(epd.getbuffer(Image.new('RGB', panel.size, 'white')))
+    planes = 2 if panel.layout == 'black_red' else 1
+
+    def fresh_buffers():
+        # Many display() methods modify their buffers in place
+        return [list(buffer) for _ in range(planes)], {}
+
+    record_traffic(benchmark, bus, getattr(epd, display), *fresh_buffers()[0])
+    benchmark.pedantic(getattr(epd, display), setup=fresh_buffers, rounds=5)
+
+@pytest.mark.parametrize('name', sorted(n for n, p in PANELS.items() if p.transfers))
+def test_app_display(benchmark, bus, name):
+    """The app's path for the same refresh: transfer recipe from packed planes."""
+    benchmark.group = 'app display'
+    panel = PANELS[name]
+    driver = load(bus, name)
+    epd = driver.EPD()
+    display = panel.modes['full'][1]
+    if display not in panel.transfers:
+        display = 'display'
+    planes = [bytes(panel.plane_size) for _ in range(panel.planes)]
+    record_traffic(benchmark, bus, _show, epd, driver, panel, display, planes)
+    benchmark.pedantic(_show, args=(epd, driver, panel, display, planes), rounds=5)
@@ -48,21 +48,8 @@ if [[ ! -f "config/config.toml" ]]; then
 EOF
 fi
     
-eval "$(python3 - << EOF
-import tomli
-try:
-    config = tomli.load(open('config/config.toml', 'rb'))
-    print(f'export FLASK_HOST="{config["server"]["host"]}"')
-    print(f'export FLASK_PORT={config["server"]["port"]}')
-    print(f'export CONFIG_LOADED=1')
-except KeyError as e:
-    print(f'print_error "Missing required configuration key: {e}"')
-    exit(1)
-except Exception as e:
-    print(f'print_error "Error loading config: {e}"')
-    exit(1)
-EOF
-)"
+# Same parser the app and gunicorn use; it prints export lines
+eval "$(python3 -m app.settings --shell)"
 
 if [[ "$CONFIG_LOADED" -ne 1 ]]; then
     print_error "Configuration loading failed. Exiting."
@@ -73,7 +60,10 @@ export PYTHONPATH="$PWD"
 
 # Setup nginx if in production mode and not already configured
 setup_nginx() {
-    if [[ ! -f "/etc/nginx/sites-enabled/eink-photo" ]]; then
+    # nginx serves static files and photos straight from this checkout
+    local site
+    site=$(sed "s#/home/pi/eink-photo#$PWD#g" ./config/nginx.conf)
+    if [[ "$site" != "$(cat /etc/nginx/sites-available/eink-photo 2>/dev/null)" ]]; then
         print_status "Setting up nginx reverse proxy..."
         
         if ! command -v nginx >/dev/null 2>&1; then
@@ -82,10 +72,15 @@ setup_nginx() {
         fi
         
         print_status "Configuring nginx..."
-        sudo cp ./config/nginx.conf /etc/nginx/sites-available/eink-photo
+        echo "$site" | sudo tee /etc/nginx/sites-available/eink-photo > /dev/null
         sudo ln -sf /etc/nginx/sites-available/eink-photo /etc/nginx/sites-enabled/
         sudo rm -f /etc/nginx/sites-enabled/default
         
+        if ! sudo -u www-data test -r "$PWD/photos"; then
+            print_error "nginx (www-data) cannot read $PWD/photos; photos and static files will 404."
+            print_error "Allow it with: chmod o+x $HOME"
+        fi
+
         if sudo nginx -t; then
             print_status "Starting nginx..."
             sudo systemctl enable nginx
@@ -0,0 +1,20 @@
+import shutil
+from pathlib import Path
+import pytest
+from app import executors, metrics, routes, scheduler
+
+REPO = Path(__file__).resolve().parent.parent
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    """Run the app against an empty photos/ under tmp_path, not the real library."""
+    shutil.copytree(REPO / 'config', tmp_path / 'config')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(routes, 'PHOTOS_ROOT', tmp_path / 'photos')
+    monkeypatch.setattr(routes, 'UPLOAD_FOLDER', tmp_path / 'photos' / 'originals')
+    yield tmp_path
+    # Background jobs use paths relative to the working directory, so they
+    # have to finish before it changes back
+    executors.shutdown()
+    metrics._directory = None
+    scheduler._directory = None
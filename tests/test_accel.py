@@ -0,0 +1,34 @@
+import pytest
+from app import create_app, routes
+
+ACCEL = {'X-Sendfile-Type': 'X-Accel-Redirect'}
+
+@pytest.fixture
+def client(library):
+    return create_app({'TESTING': True}).test_client()
+
+@pytest.fixture
+def photo():
+    path = routes.UPLOAD_FOLDER / 'accel test.jpg'
+    path.write_bytes(b'jpeg bytes')
+    return path
+
+def test_without_nginx_flask_sends_the_file(client, photo):
+    response = client.get('/photos/originals/accel test.jpg')
+    assert response.status_code == 200
+    assert response.data == b'jpeg bytes'
+    assert 'X-Accel-Redirect' not in response.headers
+
+def test_behind_nginx_only_the_location_is_returned(client, photo):
+    response = client.get('/photos/originals/accel test.jpg', headers=ACCEL)
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'] == '/_accel/photos/originals/accel%20test.jpg'
+    assert response.mimetype == 'image/jpeg'
+    assert response.data == b''
+
+def test_behind_nginx_paths_stay_inside_the_folder(client, photo):
+    response = client.get('/photos/originals/..%2F..%2Fetc%2Fpasswd.jpg', headers=ACCEL)
+    assert 'X-Accel-Redirect' not in response.headers
+
+def test_static_urls_are_versioned(client):
+    assert b'styles.css?v=' in client.get('/').data
@@ -0,0 +1,84 @@
+import io
+import zipfile
+import pytest
+from app import archive, create_app
+
+def stream(tmp_path, names=('a.jpg', 'b.png', 'c.jpg')):
+    files = []
+    for i, name in enumerate(names):
+        path = tmp_path / name
+        path.write_bytes(bytes([i]) * (40 + i * 7))
+        files.append(('originals/' + name, path))
+    return archive.ZipStream(files, [('index.json', b'{"version": 1}')])
+
+def test_archive_reads_back(tmp_path):
+    zs = stream(tmp_path)
+    data = b''.join(zs.iter_range())
+    assert len(data) == zs.size
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ['originals/a.jpg', 'originals/b.png', 'originals/c.jpg', 'index.json']
+        assert zf.read('originals/b.png') == b'\x01' * 47
+        assert zf.getinfo('originals/a.jpg').compress_type == zipfile.ZIP_STORED
+
+def test_any_range_matches_the_whole(tmp_path):
+    whole = b''.join(stream(tmp_path).iter_range())
+    for cut in (1, 30, 70, 75, 200, len(whole) - 5):
+        # A fresh stream per request, as when a download is resumed
+        assert b''.join(stream(tmp_path).iter_range(cut)) == whole[cut:]
+        assert b''.join(stream(tmp_path).iter_range(3, cut)) == whole[3:cut]
+
+def test_zip64_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, 'ZIP64_LIMIT', 100)
+    zs = stream(tmp_path)
+    with zipfile.ZipFile(io.BytesIO(b''.join(zs.iter_range()))) as zf:
+        assert zf.testzip() is None
+        assert zf.read('originals/c.jpg') == b'\x02' * 54
+
+def test_export_resume_and_import(library):
+    app = create_app({'TESTING': True})
+    client = app.test_client()
+    controller = app.display_controller
+    (controller.originals_dir / 'archive test.jpg').write_bytes(b'x' * 1000)
+    controller.index.set_weight('archive test.jpg', 3.0)
+    try:
+        full = client.get('/photos/export')
+        assert full.status_code == 200
+        assert full.headers['Accept-Ranges'] == 'bytes'
+        part = client.get('/photos/export', headers={'Range': 'bytes=500-', 'If-Range': full.headers['ETag']})
+        assert part.status_code == 206
+        assert part.data == full.data[500:]
+        assert client.get('/photos/export', headers={'Range': 'bytes=500-', 'If-Range': '"stale"'}).status_code == 200
+
+        (controller.originals_dir / 'archive test.jpg').unlink()
+        controller.index.remove('archive test.jpg')
+        response = client.post('/photos/import', data=full.data, content_type='application/zip')
+        assert response.status_code == 200
+        assert response.get_json()['imported'] >= 1
+        assert (controller.originals_dir / 'archive test.jpg').read_bytes() == b'x' * 1000
+        assert controller.index.get('archive test.jpg')['weight'] == 3.0
+        assert client.post('/photos/import', data=b'not a zip').status_code == 400
+    finally:
+        (controller.originals_dir / 'archive test.jpg').unlink(missing_ok=True)
+        controller.index.remove('archive test.jpg')
+
+def test_import_skips_unsafe_names():
+    allowed = lambda name: name.endswith('.jpg')
+    assert archive._photo_name('originals/ok.jpg', allowed) == 'ok.jpg'
+    for member in ('originals/../x.jpg', 'originals/sub/x.jpg', 'x.jpg', 'originals/.hidden.jpg', 'originals/x.exe'):
+        assert archive._photo_name(member, allowed) is None
+
+def test_interrupted_ingest_leaves_no_partial(tmp_path, monkeypatch):
+    from app.display import DisplayController
+    monkeypatch.chdir(tmp_path)
+    controller = DisplayController({'waveshare': {'model': 'EPD_7in5_V2'}})
+
+    class Disconnecting(io.BytesIO):
+        def read(self, size=-1):
+            if self.tell():
+                raise zipfile.BadZipFile("Bad CRC-32")
+            return super().read(size)
+
+    with pytest.raises(zipfile.BadZipFile):
+        controller.ingest('broken.jpg', Disconnecting(b'x' * 600_000))
+    assert list(controller.originals_dir.iterdir()) == []
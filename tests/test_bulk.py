@@ -0,0 +1,52 @@
+import pytest
+from app import create_app, executors
+
+NAMES = ('bulk a.jpg', 'bulk b.jpg', 'bulk c.jpg')
+
+@pytest.fixture
+def app(library):
+    app = create_app({'TESTING': True})
+    for name in NAMES:
+        (app.display_controller.originals_dir / name).write_bytes(b'photo')
+    return app
+
+def finish_cleanup():
+    executors.submit('maintenance', lambda: None).result()
+
+def test_bulk_delete_and_queue(app):
+    controller = app.display_controller
+    for name in ('bulk a.jpg', 'bulk c.jpg'):
+        (controller.display_dir / name).with_suffix('.bmp').write_bytes(b'bmp')
+        (controller.display_dir / name).with_suffix('.epdraw').write_bytes(b'raw')
+    controller.index.set_partner('bulk c.jpg', 'bulk a.jpg')
+    controller.index.set_weight('bulk a.jpg', 2.0)
+
+    response = app.test_client().post('/photos/bulk', json={
+        'delete': ['bulk a.jpg', 'gone.jpg'], 'display': ['bulk b.jpg', 'bulk a.jpg']})
+    assert response.status_code == 200
+    delta = response.get_json()
+    assert delta['deleted'] == ['bulk a.jpg']
+    assert delta['missing'] == ['gone.jpg']
+    assert delta['stale'] == ['bulk c.jpg']
+    assert delta['queued'] == ['bulk b.jpg']
+
+    finish_cleanup()
+    assert not (controller.originals_dir / 'bulk a.jpg').exists()
+    assert not list(controller.display_dir.glob('bulk [ac].*'))
+    assert controller.index.get('bulk a.jpg') is None
+    assert controller.index.get('bulk c.jpg')['partner'] is None
+    assert controller.index.queued() == ['bulk b.jpg']
+    controller.index.dequeue('bulk b.jpg')
+    assert controller.index.queued() == []
+
+def test_single_delete_uses_the_same_path(app):
+    client = app.test_client()
+    assert client.delete('/photos/delete/bulk b.jpg').status_code == 200
+    assert client.delete('/photos/delete/bulk b.jpg').status_code == 404
+    assert client.delete('/photos/delete/..%2Findex.db').status_code in (404, 405)
+
+def test_bulk_rejects_bad_payloads(app):
+    client = app.test_client()
+    assert client.post('/photos/bulk', json={}).status_code == 400
+    assert client.post('/photos/bulk', json={'delete': 'bulk a.jpg'}).status_code == 400
+    assert client.post('/photos/bulk', json={'convert': [1, 2]}).status_code == 400
@@ -0,0 +1,42 @@
+from PIL import Image
+from app.convert import ConvertJob
+from app.display import DisplayController
+
+CONFIG = {'waveshare': {'model': 'EPD_7in3f'}}
+
+def make_library(tmp_path, monkeypatch, count=3):
+    monkeypatch.chdir(tmp_path)
+    originals = tmp_path / 'photos' / 'originals'
+    originals.mkdir(parents=True)
+    for i in range(count):
+        Image.new('RGB', (120, 90), (40 * i, 80, 160)).save(originals / f'p{i}.jpg')
+    (originals / 'broken.jpg').write_text('not an image')
+    return DisplayController(CONFIG)
+
+def test_convert_all_skips_up_to_date_photos(tmp_path, monkeypatch):
+    controller = make_library(tmp_path, monkeypatch)
+    controller.convert_photo('p0.jpg')
+    job = ConvertJob(controller, workers=2)
+    assert sorted(job.pending()) == ['broken.jpg', 'p1.jpg', 'p2.jpg']
+
+    progress = job.run()
+    assert (progress['converted'], progress['failed'], progress['skipped']) == (2, 1, 1)
+    assert progress['failures'] == ['broken.jpg']
+    assert job.status()['running'] is False
+    assert ConvertJob(controller).pending() == ['broken.jpg']
+
+def test_settings_change_makes_renders_stale(tmp_path, monkeypatch):
+    controller = make_library(tmp_path, monkeypatch, count=1)
+    controller.convert_photo('p0.jpg')
+    assert controller.is_current('p0.jpg')
+    rotated = DisplayController({**CONFIG, 'waveshare': {'model': 'EPD_7in3f', 'rotation': 180}})
+    assert not rotated.is_current('p0.jpg')
+
+def test_only_one_job_at_a_time(tmp_path, monkeypatch):
+    controller = make_library(tmp_path, monkeypatch, count=1)
+    first, second = ConvertJob(controller), ConvertJob(controller)
+    assert first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
@@ -0,0 +1,29 @@
+import pytest
+from PIL import Image, ImageDraw
+from app.crop import GRID, crop_box, saliency_grid
+from app.library import PhotoIndex
+
+def test_crop_box_matches_target_aspect_and_centres():
+    assert crop_box((1000, 1000), (800, 400)) == (0, 250, 1000, 750)
+    assert crop_box((400, 800), (100, 100)) == (0, 200, 400, 600)
+
+def test_smart_crop_follows_detail():
+    img = Image.new('L', (300, 100), 255)
+    draw = ImageDraw.Draw(img)
+    for x in range(220, 290, 6):
+        draw.line((x, 10, x, 90), fill=0, width=2)
+    saliency = saliency_grid(img)
+    assert len(saliency) == GRID * GRID
+    left, top, right, bottom = crop_box(img.size, (100, 100), saliency)
+    assert (top, bottom) == (0, 100)
+    assert left <= 220 and right >= 285
+
+def test_blank_image_crops_centre():
+    saliency = saliency_grid(Image.new('L', (300, 100), 255))
+    assert crop_box((300, 100), (100, 100), saliency) == pytest.approx((100, 0, 200, 100))
+
+def test_saliency_is_stored_in_index(tmp_path):
+    index = PhotoIndex(tmp_path / 'index.db')
+    index.set_analysis('a.jpg', 1.5, bytes(GRID * GRID))
+    index.mark_shown('a.jpg')
+    assert index.get('a.jpg')['saliency'] == bytes(GRID * GRID)
@@ -0,0 +1,27 @@
+from PIL import Image
+from app.decode import _pdf_dpi, open_image
+
+def save_jpeg(path, size, orientation=1):
+    img = Image.new('RGB', size, 'white')
+    img.paste((255, 0, 0), (0, 0, size[0] // 2, size[1]))
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    img.save(path, 'JPEG', exif=exif)
+
+def test_rotated_photo_is_decoded_upright(tmp_path):
+    save_jpeg(tmp_path / 'a.jpg', (400, 200), orientation=6)
+    img = open_image(tmp_path / 'a.jpg', (100, 200))
+    # Drafted at half scale, then turned upright
+    assert img.size == (100, 200)
+    # The red left half of the sensor image ends up on top
+    assert img.getpixel((50, 10))[0] > 200 and img.getpixel((50, 10))[1] < 60
+    assert img.getpixel((50, 190)) == (255, 255, 255)
+
+def test_large_jpeg_is_drafted_down(tmp_path):
+    save_jpeg(tmp_path / 'a.jpg', (1600, 1200))
+    img = open_image(tmp_path / 'a.jpg', (200, 150), 'L')
+    assert img.mode == 'L'
+    assert img.size == (200, 150)
+
+def test_pdf_dpi_fits_target():
+    assert _pdf_dpi(612, 792, (800, 480)) == 94
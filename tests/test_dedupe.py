@@ -0,0 +1,71 @@
+import io
+import random
+import pytest
+from PIL import Image, ImageDraw
+from app import create_app, dedupe
+from app.dedupe import HashIndex
+
+def picture(seed, size=(640, 480)):
+    rng = random.Random(seed)
+    img = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.ellipse([x, y, x + size[0] // 4, y + size[1] // 4], fill=tuple(rng.randrange(256) for _ in range(3)))
+    return img
+
+def encoded(img, fmt='JPEG', **options):
+    buffer = io.BytesIO()
+    img.save(buffer, fmt, **options)
+    buffer.seek(0)
+    return buffer
+
+def test_dhash_survives_resizing_and_recompression():
+    img = picture(1)
+    again = Image.open(encoded(img.resize((320, 240)), quality=60))
+    assert dedupe.distance(dedupe.dhash(img), dedupe.dhash(again)) <= dedupe.NEAR_DISTANCE
+    assert dedupe.distance(dedupe.dhash(img), dedupe.dhash(picture(2))) > dedupe.NEAR_DISTANCE
+
+def test_hash_index_matches_brute_force():
+    rng = random.Random(3)
+    index = HashIndex()
+    hashes = {f'p{i}': rng.getrandbits(64) for i in range(2000)}
+    base = hashes['p0']
+    for i in range(1, 8):
+        hashes[f'near{i}'] = base ^ sum(1 << b for b in rng.sample(range(64), i))
+    index.sync(hashes)
+    for query in (base, rng.getrandbits(64)):
+        expected = sorted((dedupe.distance(query, v), n) for n, v in hashes.items()
+                          if dedupe.distance(query, v) <= 6)
+        assert index.near(query, 6) == expected
+    index.sync({'p0': base})
+    assert index.near(base, 6) == [(0, 'p0')]
+    assert dedupe.to_unsigned(dedupe.to_signed(2**64 - 1)) == 2**64 - 1
+
+@pytest.fixture
+def controller(library):
+    return create_app({'TESTING': True}).display_controller
+
+def test_exact_duplicates_are_dropped(controller):
+    data = encoded(picture(4), 'PNG').getvalue()
+    assert controller.ingest('dedupe a.png', io.BytesIO(data)) == 'dedupe a.png'
+    assert controller.ingest('dedupe b.png', io.BytesIO(data)) == 'dedupe a.png'
+    assert not (controller.originals_dir / 'dedupe b.png').exists()
+    # Uploading the same file under the same name again is fine
+    assert controller.ingest('dedupe a.png', io.BytesIO(data)) == 'dedupe a.png'
+
+def test_near_duplicates_are_marked_and_skipped_by_the_slideshow(controller):
+    img = picture(5)
+    for name, data in (('dedupe c.jpg', encoded(img, quality=90)),
+                       ('dedupe d.jpg', encoded(img.resize((500, 375)), quality=50)),
+                       ('dedupe e.jpg', encoded(picture(6)))):
+        (controller.originals_dir / name).write_bytes(data.getvalue())
+        controller.analyze_photo(name)
+    history = controller.index.history()
+    assert history['dedupe d.jpg']['duplicate_of'] == 'dedupe c.jpg'
+    assert history['dedupe e.jpg']['duplicate_of'] is None
+    photos = controller.slideshow._photos(history)
+    assert 'dedupe c.jpg' in photos and 'dedupe e.jpg' in photos
+    assert 'dedupe d.jpg' not in photos
+    controller.apply_bulk(delete=['dedupe c.jpg'])
+    assert controller.index.get('dedupe d.jpg')['duplicate_of'] is None
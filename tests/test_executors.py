@@ -0,0 +1,30 @@
+import os
+import threading
+import time
+from app import executors
+
+def test_display_jobs_run_one_at_a_time():
+    running, overlap = [0], [False]
+    lock = threading.Lock()
+
+    def refresh():
+        with lock:
+            running[0] += 1
+            overlap[0] |= running[0] > 1
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return threading.current_thread().name
+
+    names = {f.result() for f in [executors.submit('display', refresh) for _ in range(4)]}
+    assert not overlap[0]
+    assert len(names) == 1
+
+def test_forked_child_starts_new_pools():
+    executors.submit('convert', int).result()
+    pid = os.fork()
+    if pid == 0:
+        ok = not executors._pools and executors.submit('convert', int, '7').result(timeout=5) == 7
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
@@ -0,0 +1,108 @@
+from app.framebuffer import FrameState, changed_regions, open_raw, window_buffer, write_raw
+from app.panels import PANELS
+from app.waveshare_utils import SPI_CHUNK, _transfer
+
+PANEL = PANELS['epd7in5_V2']
+ROW = PANEL.row_bytes
+
+def blank():
+    return bytearray(ROW * PANEL.height)
+
+def draw(frame, x_byte, y, value=0xFF):
+    frame[y * ROW + x_byte] = value
+
+def test_identical_frames_have_no_regions():
+    assert changed_regions(blank(), blank(), ROW) == []
+
+def test_single_change_gives_tight_byte_aligned_box():
+    new = blank()
+    draw(new, 10, 20)
+    draw(new, 12, 25)
+    assert changed_regions(blank(), new, ROW) == [(80, 20, 104, 26)]
+
+def test_distant_changes_give_separate_regions():
+    new = blank()
+    draw(new, 1, 0)
+    draw(new, 50, 400)
+    assert changed_regions(blank(), new, ROW) == [(8, 0, 16, 1), (400, 400, 408, 401)]
+
+def test_window_buffer_slices_rows():
+    frame = blank()
+    draw(frame, 2, 1, 0xAA)
+    draw(frame, 3, 2, 0x55)
+    assert window_buffer(frame, ROW, (16, 1, 32, 3)) == bytearray([0xAA, 0, 0, 0x55])
+
+def test_frame_state_round_trip(tmp_path):
+    state = FrameState(tmp_path)
+    assert state.load(PANEL) == (None, {})
+    state.save(PANEL, b'\x01\x02', {'partial': 2})
+    assert state.load(PANEL) == (b'\x01\x02', {'partial': 2})
+    assert state.load(PANELS['epd7in3f']) == (None, {})
+
+def test_raw_frame_round_trip(tmp_path):
+    frame = blank()
+    draw(frame, 3, 7, 0x5A)
+    write_raw(tmp_path / 'a.epdraw', PANEL, [frame])
+    with open_raw(tmp_path / 'a.epdraw', PANEL) as raw:
+        assert len(raw.planes) == 1
+        assert raw.planes[0] == frame
+        assert raw.frame == bytes(frame)
+
+def test_raw_frame_rejects_other_panel_and_corruption(tmp_path):
+    path = tmp_path / 'a.epdraw'
+    write_raw(path, PANEL, [blank()])
+    assert open_raw(path, PANELS['epd7in5_V2_old']) is None
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(data)
+    assert open_raw(path, PANEL) is None
+    assert open_raw(tmp_path / 'missing.epdraw', PANEL) is None
+
+class FakeEPD:
+    dc_pin, cs_pin = 25, 8
+
+    def __init__(self):
+        self.log = []
+
+    def send_command(self, command):
+        self.log.append(('cmd', command))
+
+    def send_data(self, value):
+        self.log.append(('data', value))
+
+    def ReadBusy(self):
+        self.log.append(('busy',))
+
+class FakeConfig:
+    def __init__(self, log):
+        self.log = log
+
+    def digital_write(self, pin, value):
+        pass
+
+    def spi_writebyte2(self, data):
+        self.log.append(('spi', data))
+
+    def delay_ms(self, ms):
+        pass
+
+def test_transfer_recipe_matches_driver_display():
+    epd = FakeEPD()
+    plane = memoryview(bytes([0x0F, 0xF0]))
+    _transfer(epd, FakeConfig(epd.log), PANEL.transfers['display'], [plane])
+    assert epd.log == [('cmd', 0x10), ('spi', bytes([0xF0, 0x0F])), ('cmd', 0x13),
+                       ('spi', bytes([0x0F, 0xF0])), ('cmd', 0x12), ('busy',)]
+
+def test_large_plane_streams_from_mapping_in_chunks(tmp_path):
+    panel = PANELS['epd7in3f']
+    write_raw(tmp_path / 'a.epdraw', panel, [bytes(range(256)) * (panel.plane_size // 256)])
+    epd = FakeEPD()
+    epd.TurnOnDisplay = lambda: None
+    with open_raw(tmp_path / 'a.epdraw', panel) as raw:
+        _transfer(epd, FakeConfig(epd.log), panel.transfers['display'], raw.planes)
+        chunks = [data for kind, *data in epd.log if kind == 'spi']
+        assert all(isinstance(chunk, memoryview) and len(chunk) <= SPI_CHUNK for (chunk,) in chunks)
+        assert b''.join(chunk for (chunk,) in chunks) == raw.planes[0]
+        # Drop the slices before the file is unmapped
+        del chunks
+        epd.log.clear()
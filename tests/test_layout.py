@@ -0,0 +1,44 @@
+from PIL import Image
+from app import layout
+from app.library import PhotoIndex
+from app.panels import PANELS
+from app.waveshare_utils import convert_for_display
+
+PANEL = PANELS['epd7in3f']
+
+def test_canvas_follows_rotation_and_orientation():
+    assert layout.canvas(PANEL, {}) == ((800, 480), None)
+    assert layout.canvas(PANEL, {'waveshare': {'rotation': 180}}) == ((800, 480), Image.Transpose.ROTATE_180)
+    assert layout.canvas(PANEL, {'display': {'orientation': 'portrait'}}) == ((480, 800), Image.Transpose.ROTATE_90)
+    assert layout.canvas(PANEL, {'display': {'orientation': 'portrait'},
+                                 'waveshare': {'rotation': 180}}) == ((480, 800), Image.Transpose.ROTATE_270)
+
+def test_slots_split_along_long_side():
+    assert layout.slots((800, 480), 2) == [(0, 0, 396, 480), (404, 0, 800, 480)]
+    assert layout.slots((480, 800), 2) == [(0, 0, 480, 396), (0, 404, 480, 800)]
+
+def test_portraits_pair_with_least_recent_portrait():
+    candidates = {'wide.jpg': 1.5, 'tall.jpg': 0.75, 'tall2.jpg': 0.66}
+    history = {'tall.jpg': {'last_shown': 100}}
+    assert layout.pick_partner(0.75, candidates, (800, 480), history) == 'tall2.jpg'
+    assert layout.pick_partner(1.5, candidates, (800, 480), history) is None
+    assert layout.pick_partner(1.5, candidates, (480, 800), history) == 'wide.jpg'
+
+def test_aspects_and_partners_in_index(tmp_path):
+    index = PhotoIndex(tmp_path / 'index.db')
+    index.set_analysis('a.jpg', 0.75, None)
+    index.set_partner('b.jpg', 'a.jpg')
+    assert index.aspects() == {'a.jpg': 0.75}
+    assert index.paired_with('a.jpg') == ['b.jpg']
+
+def test_rotated_pair_is_rendered_in_panel_frame(tmp_path):
+    Image.new('RGB', (300, 400), 'black').save(tmp_path / 'a.png')
+    Image.new('RGB', (300, 400), 'white').save(tmp_path / 'b.png')
+    config = {'waveshare': {'model': 'EPD_7in3f', 'rotation': 180}, 'display': {'fit': 'fill'}}
+    assert convert_for_display(tmp_path / 'a.png', tmp_path / 'out.bmp', config,
+                               partner=(tmp_path / 'b.png', None))
+    out = Image.open(tmp_path / 'out.bmp').convert('RGB')
+    assert out.size == (800, 480)
+    # Turned half way round, the first photo ends up on the right
+    assert out.getpixel((700, 240)) == (0, 0, 0)
+    assert out.getpixel((100, 240)) == (255, 255, 255)
@@ -0,0 +1,74 @@
+import json
+import subprocess
+import pytest
+from app import create_app, metrics
+
+@pytest.fixture(autouse=True)
+def fresh(monkeypatch):
+    monkeypatch.setattr(metrics, '_directory', None)
+    metrics.reset()
+    yield
+    metrics.reset()
+
+def test_span_lands_in_a_bucket():
+    metrics.observe('decode', 0.003)
+    metrics.observe('decode', 7)
+    with metrics.span('decode'):
+        pass
+    entry = metrics.snapshot()['stages']['decode']
+    assert entry['count'] == 3
+    assert entry['buckets'][metrics.BUCKETS.index(0.005)] == 1
+    assert entry['buckets'][metrics.BUCKETS.index(10)] == 1
+    assert entry['sum'] == pytest.approx(7.003, abs=0.01)
+
+def test_render_is_prometheus_text():
+    metrics.count('eink_refreshes_total', mode='full')
+    metrics.count('eink_spi_bytes_total', 48000)
+    metrics.observe('transfer', 0.2)
+    text = metrics.render(extra_gauges={'eink_queue_depth|queue=convert': 3})
+    assert '# TYPE eink_refreshes_total counter' in text
+    assert 'eink_refreshes_total{mode="full"} 1' in text
+    assert 'eink_spi_bytes_total 48000' in text
+    assert 'eink_queue_depth{queue="convert"} 3' in text
+    assert 'eink_stage_seconds_bucket{stage="transfer",le="0.1"} 0' in text
+    assert 'eink_stage_seconds_bucket{stage="transfer",le="0.25"} 1' in text
+    assert 'eink_stage_seconds_bucket{stage="transfer",le="+Inf"} 1' in text
+    assert 'eink_stage_seconds_count{stage="transfer"} 1' in text
+
+def test_collect_adds_up_processes_and_retires_dead_ones(tmp_path):
+    metrics.configure(tmp_path)
+    metrics.count('eink_refreshes_total', mode='full')
+    metrics.flush()
+    dead = subprocess.Popen(['true'])
+    dead.wait()
+    other = {'counters': {'eink_refreshes_total|mode=full': 2}, 'gauges': {'eink_queue_depth|queue=display': 1},
+             'stages': {'clear': {'buckets': [0] * len(metrics.BUCKETS), 'sum': 1.5, 'count': 1}}}
+    (tmp_path / '.metrics' / f'{dead.pid}.json').write_text(json.dumps(other))
+
+    data = metrics.collect()
+    assert data['counters']['eink_refreshes_total|mode=full'] == 3
+    assert data['stages']['clear']['count'] == 1
+    # A dead process's work stays counted, but not its gauges
+    assert 'eink_queue_depth|queue=display' not in data['gauges']
+    assert not (tmp_path / '.metrics' / f'{dead.pid}.json').exists()
+    assert metrics.collect()['counters']['eink_refreshes_total|mode=full'] == 3
+
+def test_display_job_records_stages_and_cache(tmp_path, monkeypatch):
+    from PIL import Image
+    from app.waveshare_utils import convert_for_display, display_image
+    monkeypatch.delenv('EINK_SIMULATOR', raising=False)
+    config = {'waveshare': {'model': 'epd7in5_V2'}}
+    Image.new('RGB', (400, 300), 'gray').save(tmp_path / 'photo.png')
+    assert convert_for_display(tmp_path / 'photo.png', tmp_path / 'photo.bmp', config)
+    assert display_image(tmp_path / 'photo.bmp', config)
+    data = metrics.snapshot()
+    assert {'decode', 'resize', 'dither', 'save', 'getbuffer', 'load'} <= set(data['stages'])
+    assert data['counters']['eink_cache_requests_total|cache=epdraw|result=hit'] == 1
+
+def test_metrics_endpoint(library):
+    client = create_app({'TESTING': True}).test_client()
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert b'# TYPE eink_stage_seconds histogram' in response.data
+    assert b'eink_queue_depth{queue="convert"} 0' in response.data
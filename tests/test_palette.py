@@ -0,0 +1,46 @@
+import pytest
+from PIL import Image
+from app import palette
+from app.panels import PANELS
+from app.waveshare_utils import get_buffers
+
+def gradient(size=(64, 48)):
+    channels = [
+        Image.linear_gradient('L').resize(size),
+        Image.linear_gradient('L').rotate(90).resize(size),
+        Image.radial_gradient('L').resize(size),
+    ]
+    return Image.merge('RGB', channels)
+
+@pytest.mark.parametrize('name', sorted(palette.PALETTES))
+def test_quantize_uses_every_ink(name):
+    result = palette.quantize(gradient(), name)
+    assert result.mode == 'P'
+    assert set(result.tobytes()) == set(range(len(palette.PALETTES[name])))
+
+def test_quantize_matches_nearest_perceptual_color():
+    orange = Image.new('RGB', (4, 4), (240, 120, 10))
+    result = palette.quantize(orange, 'acep7', dither=False)
+    assert set(result.tobytes()) == {6}
+
+def test_lab_lut_is_cached_per_palette():
+    assert palette.lab_lut('acep7') is palette.lab_lut('acep7')
+
+def test_spectra6_buffer_skips_unused_code():
+    image = Image.new('P', (4, 1))
+    image.putdata([4, 5, 0, 1])
+    assert get_buffers(image, PANELS['epd7in3e']) == [bytearray([0x56, 0x01])]
+
+def test_black_red_buffers_split_planes():
+    image = Image.new('P', (8, 1))
+    image.putdata([0, 1, 2, 2, 0, 1, 1, 1])
+    black, red = get_buffers(image, PANELS['epd7in5b_V2'])
+    assert black == bytearray([0b10001000])
+    assert red == bytearray([0b00110000])
+
+def test_black_red_buffers_keep_driver_polarity():
+    image = Image.new('P', (8, 1))
+    image.putdata([0, 1, 2, 2, 0, 1, 1, 1])
+    black, red = get_buffers(image, PANELS['epd4in2b_V2'])
+    assert black == bytearray([0b01110111])
+    assert red == bytearray([0b11001111])
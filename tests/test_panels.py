@@ -0,0 +1,34 @@
+import pytest
+from app.panels import PANELS, get_panel, driver_name
+
+def test_model_names_map_to_driver_modules():
+    assert driver_name('EPD_7in5_V2') == 'epd7in5_V2'
+    assert driver_name('epd13in3k') == 'epd13in3k'
+
+def test_get_panel_reads_config_model():
+    panel = get_panel({'waveshare': {'model': 'EPD_7in3f'}})
+    assert panel.size == (800, 480)
+    assert panel.palette == 'acep7'
+    assert panel.bits_per_pixel == 4
+
+def test_get_panel_defaults_to_7in5_v2():
+    panel = get_panel({})
+    assert panel.name == 'epd7in5_V2'
+    assert panel.supports('fast') and panel.supports('partial')
+
+def test_controller_family_sets_busy_level():
+    assert (PANELS['epd7in5_V2'].controller, PANELS['epd7in5_V2'].busy_level) == ('uc', 0)
+    assert (PANELS['epd13in3k'].controller, PANELS['epd13in3k'].busy_level) == ('ssd', 1)
+    # Polls a status bit rather than comparing the pin, but waits while it is low
+    assert PANELS['epd1in02'].busy_level == 0
+
+def test_unknown_model_raises():
+    with pytest.raises(KeyError):
+        get_panel({'waveshare': {'model': 'EPD_99in9'}})
+
+@pytest.mark.parametrize('name', sorted(PANELS))
+def test_every_panel_has_a_full_refresh(name):
+    panel = PANELS[name]
+    assert panel.supports('full')
+    assert set(panel.refresh_s) <= set(panel.modes)
+    assert panel.controller in ('uc', 'ssd') and panel.busy_level in (0, 1)
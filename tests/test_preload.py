@@ -0,0 +1,27 @@
+import gc
+from app import palette, preload
+from app.library import PhotoIndex
+
+def test_history_snapshot_is_reused_until_the_index_changes(tmp_path):
+    index = PhotoIndex(tmp_path / 'index.db')
+    index.set_weight('a.jpg', 2.0)
+    first = index.history()
+    assert index.history() is first
+    # Another process (a different PhotoIndex) writing must invalidate it
+    PhotoIndex(tmp_path / 'index.db').mark_shown('b.jpg')
+    second = index.history()
+    assert second is not first
+    assert set(second) == {'a.jpg', 'b.jpg'}
+
+def test_warm_builds_palette_and_freezes(tmp_path):
+    palette.lab_lut.cache_clear()
+    index = PhotoIndex(tmp_path / 'index.db')
+    index.set_weight('a.jpg', 1.0)
+    try:
+        summary = preload.warm({'waveshare': {'model': 'epd7in3f'}}, index)
+        assert summary['palette'] == 'acep7'
+        assert summary['photos'] == 1
+        assert summary['frozen'] > 0
+        assert palette.lab_lut.cache_info().currsize == 1
+    finally:
+        gc.unfreeze()
@@ -0,0 +1,62 @@
+import pstats
+import pytest
+from app import create_app, profiling
+
+@pytest.fixture
+def profiles(tmp_path, monkeypatch):
+    monkeypatch.delenv('EINK_PROFILE', raising=False)
+    profiling.configure({'profiling': {'enabled': True, 'directory': str(tmp_path), 'keep': 3}})
+    yield tmp_path
+    profiling.configure({})
+
+def test_off_unless_configured_or_env(monkeypatch):
+    monkeypatch.delenv('EINK_PROFILE', raising=False)
+    profiling.configure({})
+    assert profiling.start() is None
+    monkeypatch.setenv('EINK_PROFILE', '1')
+    profiling.configure({})
+    assert profiling.enabled()
+    monkeypatch.setenv('EINK_PROFILE', '0')
+    profiling.configure({'profiling': {'enabled': True}})
+    assert not profiling.enabled()
+
+def test_job_profile_is_saved_and_rotated(profiles):
+    for i in range(5):
+        with profiling.profile('display', f'photo {i}.jpg'):
+            sum(range(1000))
+    names = [p['name'] for p in profiling.list_profiles()]
+    assert len(names) == 3
+    assert all('_display_photo_' in name for name in names)
+    stats = pstats.Stats(str(profiles / names[0]))
+    assert stats.total_calls > 0
+
+def test_nested_jobs_are_covered_by_the_outer_profile(profiles):
+    with profiling.profile('request', 'outer'):
+        with profiling.profile('display', 'inner'):
+            pass
+    assert [p['name'].split('_')[1] for p in profiling.list_profiles()] == ['request']
+
+def test_requests_are_profiled_and_downloadable(library, profiles):
+    client = create_app({'TESTING': True, 'profiling': {}}).test_client()
+    profiling.configure({'profiling': {'enabled': True, 'directory': str(profiles)}})
+    assert client.get('/photos/list').status_code == 200
+    listing = client.get('/profiles').get_json()
+    assert listing['enabled']
+    name = listing['profiles'][0]['name']
+    assert '_request_GET_photos_list' in name
+    response = client.get(f'/profiles/{name}')
+    assert response.status_code == 200
+    assert response.data == (profiles / name).read_bytes()
+    assert client.get('/profiles/missing.prof').status_code == 404
+    assert client.get('/profiles/app.log').status_code == 400
+
+def test_pooled_job_is_profiled_in_its_own_thread(library, profiles):
+    from PIL import Image
+    client = create_app({'TESTING': True, 'profiling': {}}).test_client()
+    Image.new('RGB', (160, 120), 'red').save(library / 'photos' / 'originals' / 'a.jpg')
+    profiling.configure({'profiling': {'enabled': True, 'directory': str(profiles)}})
+    assert client.post('/photos/convert/a.jpg').status_code == 200
+    names = [p['name'] for p in profiling.list_profiles()]
+    assert len(names) == 1 and '_convert_a.jpg' in names[0]
+    stats = pstats.Stats(str(profiles / names[0]))
+    assert any(func[2] == 'convert_for_display' for func in stats.stats)
@@ -0,0 +1,51 @@
+import os
+from PIL import Image
+from app import create_app
+from app.display import DisplayController
+
+CONFIG = {'waveshare': {'model': 'EPD_7in5_V2'}}
+
+def make_controller(tmp_path, monkeypatch, **ready):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'photos' / 'originals').mkdir(parents=True)
+    controller = DisplayController({**CONFIG, 'ready': ready})
+    for i, name in enumerate(('a.jpg', 'b.jpg', 'c.jpg', 'd.jpg')):
+        path = controller.originals_dir / name
+        Image.new('RGB', (160, 120), (60 * i, 90, 200)).save(path)
+        os.utime(path, (1000 + i, 1000 + i))
+    return controller
+
+def test_members_in_order_within_budget(tmp_path, monkeypatch):
+    controller = make_controller(tmp_path, monkeypatch, recent=1)
+    ready = controller.ready
+    ready._write(ready.next_path, ['b.jpg', 'gone.jpg'])
+    ready._write(ready.visible_path, ['a.jpg', 'b.jpg'])
+    # Next picks, then what a gallery shows, then the newest upload
+    assert ready.members() == ['b.jpg', 'a.jpg', 'd.jpg']
+
+    ready.budget = ready._estimate() * 2
+    assert ready.members() == ['b.jpg', 'a.jpg']
+
+def test_fill_renders_members_for_display(tmp_path, monkeypatch):
+    controller = make_controller(tmp_path, monkeypatch, recent=2)
+    assert controller.ready.fill() == 2
+    assert controller.is_current('d.jpg') and controller.is_current('c.jpg')
+    assert not controller.is_current('a.jpg')
+    # Already rendered
+    assert controller.ready.fill() == 0
+
+def test_slideshow_upcoming_follows_its_order(tmp_path, monkeypatch):
+    controller = make_controller(tmp_path, monkeypatch)
+    slideshow = controller.slideshow
+    slideshow.order = 'sequential'
+    slideshow.next_photo = 'c.jpg'
+    assert slideshow.upcoming(3) == ['c.jpg', 'd.jpg', 'a.jpg']
+    controller.index.apply(enqueue=['a.jpg'])
+    assert slideshow.upcoming(3) == ['a.jpg', 'c.jpg', 'd.jpg']
+
+def test_visible_report_needs_a_list(library):
+    client = create_app({'TESTING': True}).test_client()
+    assert client.post('/photos/visible', json={'photos': 'a.jpg'}).status_code == 400
+    response = client.post('/photos/visible', json={'photos': []})
+    assert response.status_code == 200
+    assert 'ready' in response.get_json()
@@ -0,0 +1,63 @@
+import pytest
+from app.panels import PANELS
+from app.refresh import RefreshPolicy
+
+PANEL = PANELS['epd7in5_V2']
+SIZE = PANEL.row_bytes * PANEL.height
+
+@pytest.fixture
+def policy(tmp_path):
+    return RefreshPolicy({}, tmp_path)
+
+def small_change():
+    frame = bytearray(SIZE)
+    frame[20 * PANEL.row_bytes + 10] = 0xFF
+    return bytes(frame)
+
+def test_small_manual_change_uses_partial(policy):
+    mode, regions = policy.choose(PANEL, small_change(), bytes(SIZE), {})
+    assert mode == 'partial' and regions == [(80, 20, 88, 21)]
+
+def test_unchanged_frame_is_skipped(policy):
+    assert policy.choose(PANEL, bytes(SIZE), bytes(SIZE), {}) == ('none', [])
+
+def test_new_photo_on_manual_tap_uses_fast(policy):
+    assert policy.choose(PANEL, bytes([0xFF]) * SIZE, bytes(SIZE), {}) == ('fast', None)
+    assert policy.choose(PANEL, bytes(SIZE), None, {}) == ('fast', None)
+
+def test_scheduled_rotation_uses_full(policy):
+    assert policy.choose(PANEL, small_change(), bytes(SIZE), {}, 'scheduled') == ('full', None)
+
+def test_limits_force_full(tmp_path):
+    policy = RefreshPolicy({'refresh': {'partial_limit': 2, 'fast_limit': 3}}, tmp_path)
+    assert policy.choose(PANEL, small_change(), bytes(SIZE), {'partial': 2})[0] == 'fast'
+    assert policy.choose(PANEL, small_change(), bytes(SIZE), {'partial': 2, 'fast': 3})[0] == 'full'
+
+def test_panel_without_fast_waveform_uses_full(policy):
+    panel = PANELS['epd7in3f']
+    size = panel.row_bytes * panel.height
+    assert policy.choose(panel, bytes([1]) * size, bytes(size), {}) == ('full', None)
+
+def test_full_refresh_resets_counts():
+    assert RefreshPolicy.next_counts({'fast': 2}, 'partial') == {'fast': 2, 'partial': 1}
+    assert RefreshPolicy.next_counts({'fast': 2, 'partial': 1}, 'full') == {}
+
+def test_latency_is_recorded_per_mode(policy):
+    policy.record('fast', 1.5)
+    policy.record('fast', 2.5)
+    stats = policy.latencies()
+    assert stats['fast']['count'] == 2
+    assert stats['fast']['last_s'] == 2.5
+    assert 1.5 < stats['fast']['mean_s'] < 2.5
+
+def test_partial_window_past_address_limit_is_not_used(policy):
+    panel = PANELS['epd13in3k']
+    size = panel.row_bytes * panel.height
+    near = bytearray(size)
+    near[20 * panel.row_bytes + 10] = 0xFF
+    assert policy.choose(panel, bytes(near), bytes(size), {})[0] == 'partial'
+    far = bytearray(size)
+    for y in range(600, 620):
+        far[y * panel.row_bytes + 100:y * panel.row_bytes + 105] = b'\xff' * 5
+    # The driver would refresh (288, 88) instead, so the whole panel is redrawn
+    assert policy.choose(panel, bytes(far), bytes(size), {}) == ('full', None)
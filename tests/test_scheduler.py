@@ -0,0 +1,62 @@
+import os
+import threading
+import time
+import pytest
+from app import scheduler
+
+@pytest.fixture(autouse=True)
+def activity_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler, '_directory', None)
+    scheduler.configure(tmp_path)
+
+def in_thread(fn):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(fn()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+def test_activity_is_seen_from_another_process():
+    ready, done = os.pipe(), os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        with scheduler.activity('display'):
+            os.write(ready[1], b'x')
+            os.read(done[0], 1)
+        os._exit(0)
+    os.read(ready[0], 1)
+    assert scheduler.busy('display')
+    os.write(done[1], b'x')
+    os.waitpid(pid, 0)
+    assert not scheduler.busy('display')
+
+def test_nested_activity_stays_busy_until_the_last_ends():
+    with scheduler.activity('convert'):
+        with scheduler.activity('convert'):
+            pass
+        assert scheduler.busy('convert')
+    assert not scheduler.busy('convert')
+
+def test_checkpoint_waits_for_higher_classes_only():
+    def release_later():
+        time.sleep(0.2)
+        scheduler.end('display')
+
+    def checkpoint_as(name):
+        scheduler.set_class(name)
+        return scheduler.checkpoint()
+
+    scheduler.begin('display')
+    threading.Thread(target=release_later).start()
+    assert in_thread(lambda: checkpoint_as('prefetch')) >= 0.15
+
+    with scheduler.activity('prefetch'):
+        assert in_thread(lambda: checkpoint_as('convert')) < scheduler.POLL
+
+def test_background_threads_are_niced():
+    def niceness(name):
+        scheduler.set_class(name)
+        return os.getpriority(os.PRIO_PROCESS, threading.get_native_id())
+
+    base = in_thread(lambda: niceness(None))
+    assert in_thread(lambda: niceness('maintenance')) == min(base + scheduler.NICE['maintenance'], 19)
@@ -0,0 +1,49 @@
+import subprocess
+import sys
+import pytest
+from app.settings import Settings, load_settings, render_key
+
+def write(tmp_path, text):
+    path = tmp_path / 'config.toml'
+    path.write_text(text)
+    return path
+
+def test_server_settings_are_typed(tmp_path):
+    settings = load_settings(write(tmp_path, '[server]\nport = "8080"\nhost = "127.0.0.1"\n[gunicorn]\nworkers = 3\n'))
+    assert settings.port == 8080
+    assert settings.bind == '127.0.0.1:8080'
+    assert (settings.workers, settings.timeout, settings.preload) == (3, 30, True)
+    assert settings.config['gunicorn'] == {'workers': 3}
+
+def test_config_is_parsed_once_per_path(tmp_path):
+    path = write(tmp_path, '[server]\nport = 1\nhost = "h"\n')
+    first = load_settings(path)
+    path.write_text('[server]\nport = 2\nhost = "h"\n')
+    assert load_settings(path) is first
+
+def test_missing_server_key():
+    with pytest.raises(ValueError, match='server.port'):
+        Settings({'server': {'host': '0.0.0.0'}})
+
+def test_worker_class():
+    server = {'host': '0.0.0.0', 'port': 8080}
+    settings = Settings({'server': server})
+    assert (settings.worker_class, settings.threads) == ('gthread', 8)
+    with pytest.raises(ValueError, match='worker_class'):
+        Settings({'server': server, 'gunicorn': {'worker_class': 'uvicorn.workers.UvicornWorker'}})
+
+def test_shell_exports():
+    shell = Settings({'server': {'host': '0.0.0.0', 'port': 8080}}).shell()
+    assert 'export FLASK_HOST="0.0.0.0"' in shell
+    assert 'export FLASK_PORT=8080' in shell
+
+def test_cli_does_not_load_flask_or_pillow():
+    code = ("import sys, app.settings; app.settings.load_settings(); "
+            "print(any(m.split('.')[0] in ('flask', 'PIL') for m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
+
+def test_render_key_tracks_drawing_settings():
+    base = {'waveshare': {'model': 'epd7in5_V2'}, 'display': {'fit': 'fit'}}
+    assert render_key(base) == render_key({**base, 'server': {'port': 1}})
+    assert render_key(base) != render_key({**base, 'display': {'fit': 'smart'}})
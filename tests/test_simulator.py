@@ -0,0 +1,138 @@
+import json
+import sys
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+from app import metrics, simulator
+from app.panels import PANELS
+from app.refresh import RefreshPolicy
+from app.waveshare_utils import convert_for_display, display_image
+
+DRIVERS = 'app.lib.waveshare_epd'
+
+@pytest.fixture
+def sim(tmp_path, monkeypatch):
+    """Point EINK_SIMULATOR at tmp_path and undo the epdconfig swap afterwards."""
+    import app.lib.waveshare_epd as package
+    before = set(sys.modules)
+    bound = {name: module.epdconfig for name, module in sys.modules.items()
+             if name.startswith(DRIVERS + '.') and hasattr(module, 'epdconfig')}
+    monkeypatch.setenv('EINK_SIMULATOR', str(tmp_path / 'sim'))
+    monkeypatch.setitem(sys.modules, simulator.EPDCONFIG, sys.modules.get(simulator.EPDCONFIG))
+    monkeypatch.setattr(package, 'epdconfig', getattr(package, 'epdconfig', None), raising=False)
+    monkeypatch.setattr(simulator, '_active', None)
+    yield tmp_path / 'sim'
+    for name in set(sys.modules) - before:
+        if name.startswith(DRIVERS + '.'):
+            del sys.modules[name]
+    for name, epdconfig in bound.items():
+        sys.modules[name].epdconfig = epdconfig
+
+def render(tmp_path, model, name='photo', extra=None):
+    """Convert a test card for model and return (config, display BMP path)."""
+    config = {'waveshare': {'model': model}, 'display': {'fit': 'fit'}}
+    panel = PANELS[model]
+    img = Image.new('RGB', panel.size, 'white')
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((10, 10, panel.width // 2, panel.height // 2), fill='black')
+    draw.rectangle((panel.width // 2, panel.height // 2, panel.width - 10, panel.height - 10), fill='red')
+    if extra:
+        draw.rectangle(extra, fill='black')
+    src = tmp_path / f"{name}.png"
+    img.save(src)
+    out = tmp_path / f"{name}.bmp"
+    assert convert_for_display(str(src), str(out), config)
+    return config, out
+
+def differs(png, bmp):
+    return ImageChops.difference(Image.open(png).convert('RGB'), Image.open(bmp).convert('RGB')).getbbox()
+
+def timeline(directory):
+    return json.loads((directory / 'timeline.json').read_text())
+
+@pytest.mark.parametrize('model', ['epd7in5_V2', 'epd13in3k', 'epd7in5b_V2', 'epd7in3f'])
+def test_full_refresh_renders_what_was_converted(sim, tmp_path, model):
+    config, bmp = render(tmp_path, model)
+    assert display_image(str(bmp), config)
+    assert differs(sim / 'latest.png', bmp) is None
+    assert sorted(p.name for p in sim.glob('frame_*.png'))[-1].endswith('_full.png')
+
+@pytest.mark.parametrize('model', ['epd7in5_V2', 'epd13in3k'])
+def test_busy_is_held_for_the_refresh_time(sim, tmp_path, model):
+    config, bmp = render(tmp_path, model)
+    display_image(str(bmp), config)
+    events = timeline(sim)
+    refreshes = [e for e in events if e['event'] == 'refresh']
+    assert refreshes and all(e['busy_ms'] == PANELS[model].refresh_s['full'] * 1000 for e in refreshes)
+    released = [e for e in events if e['event'] == 'busy_released' and e['reason'] == 'full refresh']
+    for refresh, release in zip(refreshes, released):
+        assert release['t_ms'] - refresh['t_ms'] >= refresh['busy_ms']
+    assert not [e for e in events if e['event'] == 'violation']
+    assert events[-1]['event'] == 'module_exit'
+
+def test_partial_refresh_updates_only_its_window(sim, tmp_path):
+    first_config, first = render(tmp_path, 'epd7in5_V2', 'first')
+    config, second = render(tmp_path, 'epd7in5_V2', 'second', extra=(600, 40, 630, 60))
+    policy = RefreshPolicy(config, tmp_path)
+    assert display_image(str(first), config, policy, 'scheduled')
+    metrics.reset()
+    received = simulator._active.bytes_received
+    assert display_image(str(second), config, policy, 'manual')
+    refresh = [e for e in timeline(sim) if e['event'] == 'refresh'][-1]
+    assert refresh['mode'] == 'partial'
+    # display_Partial sends the whole frame, whatever the window
+    sent = metrics.snapshot()['counters']['eink_spi_bytes_total']
+    assert sent == simulator._active.bytes_received - received > PANELS['epd7in5_V2'].plane_size
+    metrics.reset()
+    assert refresh['busy_ms'] == PANELS['epd7in5_V2'].refresh_s['partial'] * 1000
+    assert refresh['area'] == [600, 40, 632, 61]
+    assert differs(sim / 'latest.png', second) is None
+
+@pytest.mark.parametrize('reason, mode', [('manual', 'fast'), ('scheduled', 'full')])
+def test_reset_ends_the_partial_window(sim, tmp_path, reason, mode):
+    config, first = render(tmp_path, 'epd7in5_V2', 'first')
+    _, second = render(tmp_path, 'epd7in5_V2', 'second', extra=(600, 40, 630, 60))
+    _, third = render(tmp_path, 'epd7in5_V2', 'third', extra=(20, 240, 780, 470))
+    policy = RefreshPolicy(config, tmp_path)
+    assert display_image(str(first), config, policy, 'scheduled')
+    assert display_image(str(second), config, policy, 'manual')
+    assert display_image(str(third), config, policy, reason)
+    refresh = [e for e in timeline(sim) if e['event'] == 'refresh'][-1]
+    assert refresh['mode'] == mode
+    assert refresh['area'] is None
+    assert differs(sim / 'latest.png', third) is None
+
+def test_commands_while_busy_are_violations():
+    panel = simulator.SimulatedPanel(PANELS['epd7in5_V2'])
+    panel.spi_writebyte([0x12])
+    assert panel.digital_read(simulator.BUSY_PIN) == panel.busy_level == 0
+    panel.spi_writebyte([0x10])
+    assert panel.violations()[0]['command'] == '0x10'
+    panel.delay_ms(5000)
+    assert panel.digital_read(simulator.BUSY_PIN) == 1
+
+def test_ssd_window_writes_land_at_the_cursor():
+    panel = simulator.SimulatedPanel(PANELS['epd13in3k'])
+    assert panel.family == 'ssd'
+    for command, data in [(0x44, [16, 0, 31, 0]), (0x45, [2, 0, 3, 0]), (0x4E, [16, 0]), (0x4F, [2, 0]),
+                          (0x24, [0x00, 0x0F, 0xF0, 0x00])]:
+        panel.spi_writebyte([command])
+        panel.dc = 1
+        panel.spi_writebyte(data)
+        panel.dc = 0
+    ram = panel.ram[0x24]
+    row = PANELS['epd13in3k'].row_bytes
+    assert ram[2 * row + 2:2 * row + 4] == b'\x00\x0f'
+    assert ram[3 * row + 2:3 * row + 4] == b'\xf0\x00'
+    assert ram[2 * row + 4] == 0xFF
+
+def test_driver_stages_are_timed(sim, tmp_path):
+    metrics.reset()
+    config, bmp = render(tmp_path, 'epd7in5_V2')
+    display_image(str(bmp), config)
+    data = metrics.snapshot()
+    assert {'driver_init', 'clear', 'transfer', 'refresh_wait', 'sleep'} <= set(data['stages'])
+    # Clear() and display() each send both RAM planes
+    assert data['counters']['eink_spi_bytes_total'] == simulator._active.bytes_received
+    assert data['counters']['eink_spi_bytes_total'] > 4 * PANELS['epd7in5_V2'].plane_size
+    assert data['counters']['eink_refreshes_total|mode=full'] == 1
+    metrics.reset()
@@ -0,0 +1,81 @@
+from datetime import datetime
+import pytest
+from app.slideshow import CronSpec, Slideshow
+
+class FakeController:
+    photos_dir = '.'
+
+def slideshow(order, **settings):
+    config = {'slideshow': {'order': order, **settings}, 'display': {'refresh_hours': 2}}
+    return Slideshow(FakeController(), config)
+
+def test_cron_next_after():
+    cron = CronSpec("0 7,19 * * *")
+    assert cron.next_after(datetime(2024, 5, 1, 7, 0)) == datetime(2024, 5, 1, 19, 0)
+    assert cron.next_after(datetime(2024, 5, 1, 20, 30)) == datetime(2024, 5, 2, 7, 0)
+
+def test_cron_steps_and_weekdays():
+    cron = CronSpec("*/15 9-17 * * 1-5")
+    # Saturday 2024-05-04 rolls over to Monday
+    assert cron.next_after(datetime(2024, 5, 3, 17, 50)) == datetime(2024, 5, 6, 9, 0)
+    assert cron.next_after(datetime(2024, 5, 6, 9, 1)) == datetime(2024, 5, 6, 9, 15)
+
+def test_cron_rejects_bad_specs():
+    with pytest.raises(ValueError):
+        CronSpec("0 25 * * *")
+    with pytest.raises(ValueError):
+        CronSpec("* * *")
+
+def test_interval_from_refresh_hours():
+    show = slideshow('shuffle')
+    assert show.due_after(datetime(2024, 5, 1, 7, 0)) == datetime(2024, 5, 1, 9, 0)
+
+def test_cron_overrides_interval():
+    show = slideshow('shuffle', cron="30 8 * * *")
+    assert show.due_after(datetime(2024, 5, 1, 7, 0)) == datetime(2024, 5, 1, 8, 30)
+
+def test_sequential_wraps_around():
+    show = slideshow('sequential')
+    assert show.pick(['b', 'a', 'c'], {}, current='a') == 'b'
+    assert show.pick(['b', 'a', 'c'], {}, current='c') == 'a'
+
+def test_least_recent_prefers_never_shown():
+    show = slideshow('least_recent')
+    history = {'a': {'last_shown': 100}, 'b': {'last_shown': 50}}
+    assert show.pick(['a', 'b', 'c'], history) == 'c'
+    assert show.pick(['a', 'b'], history) == 'b'
+
+def test_weighted_skips_zero_weight():
+    show = slideshow('weighted')
+    history = {'a': {'weight': 0}, 'b': {'weight': 1}}
+    assert {show.pick(['a', 'b'], history) for _ in range(20)} == {'b'}
+
+def test_shuffle_shows_every_photo_once_per_cycle():
+    show = slideshow('shuffle')
+    photos = ['a', 'b', 'c', 'd']
+    assert sorted(show.pick(photos, {}) for _ in photos) == photos
+
+def test_unknown_order_rejected():
+    with pytest.raises(ValueError):
+        slideshow('alphabetical')
+
+def test_other_workers_report_the_timer_state(tmp_path):
+    class Index:
+        def queued(self):
+            return []
+
+    class Controller:
+        photos_dir = tmp_path
+        index = Index()
+
+    config = {'slideshow': {'enabled': True}}
+    timer, other = Slideshow(Controller(), config), Slideshow(Controller(), config)
+    assert other.status()['running'] is False
+    timer.next_photo, timer.next_due = 'a.jpg', datetime(2025, 1, 1, 7)
+    timer._publish()
+    status = other.status()
+    assert status['running'] and status['next_photo'] == 'a.jpg'
+    assert status['next_due'] == '2025-01-01T07:00:00'
+    # Left behind by a worker that has exited
+    timer.state_path.write_text('{"pid": 999999999, "next_photo": "a.jpg", "next_due": null}')
+    assert other.status()['running'] is False
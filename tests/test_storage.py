@@ -0,0 +1,65 @@
+import os
+from PIL import Image
+from app.display import DisplayController
+
+CONFIG = {'waveshare': {'model': 'EPD_7in5_V2'}}
+
+def make_controller(tmp_path, monkeypatch, **storage):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'photos' / 'originals').mkdir(parents=True)
+    return DisplayController({**CONFIG, 'storage': storage})
+
+def test_transcode_keeps_exif_and_mtime(tmp_path, monkeypatch):
+    controller = make_controller(tmp_path, monkeypatch, max_original_px=400)
+    path = controller.originals_dir / 'big.jpg'
+    exif = Image.Exif()
+    exif[0x0112] = 6          # orientation
+    exif[0x010F] = 'Phone'    # make
+    Image.effect_noise((1600, 1200), 60).convert('RGB').save(path, quality=98, exif=exif)
+    os.utime(path, (1000, 1000))
+    before = path.stat().st_size
+
+    assert controller.storage.transcode('big.jpg') > 0
+    with Image.open(path) as img:
+        assert max(img.size) == 400
+        assert img.getexif()[0x0112] == 6
+        assert img.getexif()[0x010F] == 'Phone'
+    assert path.stat().st_size < before
+    assert path.stat().st_mtime == 1000
+    # Already small enough
+    assert controller.storage.transcode('big.jpg') == 0
+
+def test_quota_evicts_renders_least_recently_shown_first(tmp_path, monkeypatch):
+    controller = make_controller(tmp_path, monkeypatch, quota_mb=1)
+    for i, name in enumerate(('old', 'recent', 'current')):
+        (controller.originals_dir / f'{name}.jpg').write_bytes(b'o' * 1000)
+        (controller.display_dir / f'{name}.bmp').write_bytes(b'b' * 300_000)
+        (controller.display_dir / f'{name}.epdraw').write_bytes(b'r' * 100_000)
+        controller.index.mark_shown(f'{name}.jpg', when=1000 + i)
+    (controller.display_dir / 'deleted.bmp').write_bytes(b'b' * 300_000)
+
+    usage = controller.storage.usage(fresh=True)
+    assert usage['derived'] == 1_500_000
+    assert usage['originals'] == 3000
+    assert usage['quota'] == 2**20
+
+    assert controller.storage.enforce() > 0
+    left = sorted(p.name for p in controller.display_dir.glob('*.bmp'))
+    # The orphan and the least recently shown go; what is on screen stays
+    assert left == ['current.bmp', 'recent.bmp']
+    assert controller.storage.usage(fresh=True)['total'] <= 2**20
+    assert 'storage' in controller.get_status()
+
+def test_transcode_does_not_bring_back_a_deleted_original(tmp_path, monkeypatch):
+    controller = make_controller(tmp_path, monkeypatch, max_original_px=400)
+    path = controller.originals_dir / 'big.jpg'
+    Image.effect_noise((1600, 1200), 60).convert('RGB').save(path, quality=98)
+    thumbnail = Image.Image.thumbnail
+
+    def delete_meanwhile(img, *args, **kwargs):
+        controller.apply_bulk(delete=['big.jpg'])
+        return thumbnail(img, *args, **kwargs)
+
+    monkeypatch.setattr(Image.Image, 'thumbnail', delete_meanwhile)
+    assert controller.storage.transcode('big.jpg') == 0
+    assert list(controller.originals_dir.iterdir()) == []
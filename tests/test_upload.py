@@ -4,7 +4,7 @@ from pathlib import Path
 import io
 
 @pytest.fixture
-def app():
+def app(library):
     app = create_app({'TESTING': True})
     return app
 
@@ -26,3 +26,11 @@ def test_upload_success(client):
     response = client.post('/upload', data=data, content_type='multipart/form-data')
     assert response.status_code == 200
     assert Path('photos/originals/test.jpg').exists()
+
+def test_upload_rejects_paths(app, client):
+    data = {'file': (io.BytesIO(b'test image content'), 'sub/test.jpg')}
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid file name'
+    assert app.display_controller.ingest('../test.jpg', io.BytesIO(b'test image content')) is None
+    assert not Path('photos/test.jpg').exists()